@@ -0,0 +1,45 @@
+"""Compare two benchmark runs.
+
+    python -m benchmarks.compare baseline.json current.json [--threshold 0.1]
+
+Prints per record time of every stage in both runs and exits with status 1
+if any stage got slower by more than the threshold (relative).
+"""
+import argparse
+import sys
+
+from benchmarks.recorder import load_results
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    print(f'{"stage":<24}{"records":>10}{"baseline ms":>14}{"current ms":>14}{"change":>10}')
+    for key in sorted(current, key=lambda k: (k[0], k[1])):
+        stage, records = key
+        new = current[key]['per_record_ms']
+        old = baseline.get(key, {}).get('per_record_ms')
+        if old is None or new is None:
+            print(f'{stage:<24}{records:>10}{"-":>14}{new or 0:>14.4f}{"":>10}')
+            continue
+        change = (new - old) / old if old else 0
+        print(f'{stage:<24}{records:>10}{old:>14.4f}{new:>14.4f}{change:>+10.1%}')
+        if change > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two N-results benchmark runs.')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+    regressions = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+    for stage, records in regressions:
+        print(f'Regression: {stage} ({records} records)', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
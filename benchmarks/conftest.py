@@ -0,0 +1,41 @@
+"""Benchmarks of the N-results record lifecycle.
+
+Run with ``pytest benchmarks --bench-records=1,1000,100000 --bench-output=results.json``.
+They use the SQLite database of the test suite and synthetic records of
+:mod:`nr_nresults.generator`, no Elasticsearch is needed: searches are only
+built, not sent. Search latencies (``test_search.py``) are measured only if
+Elasticsearch is running.
+"""
+import pytest
+
+from benchmarks.recorder import BenchmarkRecorder
+from tests.conftest import app, db  # noqa
+
+DEFAULT_RECORD_COUNTS = '1,100,1000'
+
+_recorder = BenchmarkRecorder()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('nresults benchmarks')
+    group.addoption('--bench-records', default=DEFAULT_RECORD_COUNTS,
+                    help='comma separated numbers of records each stage is run with '
+                         f'(default {DEFAULT_RECORD_COUNTS})')
+    group.addoption('--bench-output', default='benchmark-results.json',
+                    help='file the timings are written to')
+
+
+def pytest_generate_tests(metafunc):
+    if 'record_count' in metafunc.fixturenames:
+        counts = [int(x) for x in metafunc.config.getoption('bench_records').split(',') if x.strip()]
+        metafunc.parametrize('record_count', counts)
+
+
+def pytest_sessionfinish(session):
+    if _recorder.results:
+        _recorder.write(session.config.getoption('bench_output'))
+
+
+@pytest.fixture()
+def recorder():
+    return _recorder
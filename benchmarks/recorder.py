@@ -0,0 +1,56 @@
+"""Collects timings of the benchmark stages and stores them as JSON."""
+import json
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+def package_version():
+    try:
+        from importlib.metadata import version
+        return version('techlib-nr-Nresults')
+    except Exception:
+        return None
+
+
+class BenchmarkRecorder:
+    """Records wall clock time of ``stage`` run over ``count`` records."""
+
+    def __init__(self):
+        self.results = []
+
+    @contextmanager
+    def measure(self, stage, count):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        self.results.append({
+            'stage': stage,
+            'records': count,
+            'seconds': elapsed,
+            'per_record_ms': elapsed * 1000 / count if count else None,
+            'records_per_second': count / elapsed if elapsed else None,
+        })
+
+    def to_json(self):
+        return {
+            'version': package_version(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'results': self.results,
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+            f.write('\n')
+
+
+def load_results(path):
+    """Return {(stage, records): result} of a stored benchmark run."""
+    with open(path) as f:
+        data = json.load(f)
+    return {(r['stage'], r['records']): r for r in data['results']}
@@ -0,0 +1,7 @@
+from tests.test_imports import import_in_subprocess
+
+
+def test_cold_import(recorder):
+    # interpreter start included, comparable between runs on the same machine
+    with recorder.measure('cold_import', 1):
+        import_in_subprocess()
@@ -0,0 +1,100 @@
+import itertools
+import json
+import uuid
+
+import pytest
+from elasticsearch_dsl import Q
+from invenio_db import db as db_
+
+from nr_nresults.constants import prefixed_published_index_name
+from nr_nresults.fetchers import nr_nresults_id_fetcher
+from nr_nresults.generator import create_taxonomy_terms, generate_records
+from nr_nresults.marshmallow import NResultsMetadataSchemaV1
+from nr_nresults.minters import nr_nresults_id_minter
+from nr_nresults.proxies import current_nresults
+from nr_nresults.record import PublishedNResultRecord
+from nr_nresults.search import NResultsRecordsSearch
+
+control_numbers = itertools.count(1000000, 1000000)
+
+
+@pytest.fixture(scope='module')
+def synthetic_taxonomy(app, db):
+    create_taxonomy_terms()
+    db.session.commit()
+
+
+def make_records(count, control_number=True):
+    records = list(generate_records(count, seed=count, start=next(control_numbers)))
+    if not control_number:
+        for data in records:
+            del data['control_number']
+    return records
+
+
+def create_records(count):
+    records = [PublishedNResultRecord.create(data, id_=uuid.uuid4()) for data in make_records(count)]
+    db_.session.commit()
+    return records
+
+
+def test_schema_load(app, db, synthetic_taxonomy, record_count, recorder):
+    records = make_records(record_count)
+    current_nresults.taxonomy_cache.invalidate()
+    with recorder.measure('schema_load', record_count):
+        for data in records:
+            NResultsMetadataSchemaV1().load(data)
+
+
+def test_mint(app, db, synthetic_taxonomy, record_count, recorder):
+    records = make_records(record_count, control_number=False)
+    with recorder.measure('mint', record_count):
+        for data in records:
+            nr_nresults_id_minter(uuid.uuid4(), data)
+        db_.session.commit()
+
+
+def test_create(app, db, synthetic_taxonomy, record_count, recorder):
+    records = make_records(record_count)
+    with recorder.measure('create', record_count):
+        for data in records:
+            PublishedNResultRecord.create(data, id_=uuid.uuid4())
+        db_.session.commit()
+
+
+def test_commit(app, db, synthetic_taxonomy, record_count, recorder):
+    records = create_records(record_count)
+    for record in records:
+        record['dateIssued'] = '2021-01-01'
+    with recorder.measure('commit', record_count):
+        for record in records:
+            record.commit()
+        db_.session.commit()
+
+
+def test_fetch(app, db, synthetic_taxonomy, record_count, recorder):
+    records = create_records(record_count)
+    with recorder.measure('fetch', record_count):
+        for record in records:
+            nr_nresults_id_fetcher(record.id, record)
+
+
+def test_serialize(app, db, synthetic_taxonomy, record_count, recorder):
+    records = create_records(record_count)
+    with recorder.measure('serialize', record_count):
+        for record in records:
+            json.dumps({
+                'id': record['control_number'],
+                'metadata': record.dumps(),
+                'links': {'self': record.canonical_url}
+            })
+
+
+def test_search_build(app, db, record_count, recorder):
+    with app.test_request_context('/nr/nresults/?q=metodika'):
+        with recorder.measure('search_build', record_count):
+            for i in range(record_count):
+                NResultsRecordsSearch(index=prefixed_published_index_name) \
+                    .query(Q('query_string', query=f'metodika {i}')) \
+                    .sort('-dateIssued')[0:10] \
+                    .to_dict()
@@ -0,0 +1,90 @@
+"""Latency of N-results list searches.
+
+Unlike the lifecycle benchmarks these need a running Elasticsearch, they are
+skipped if it is not reachable. The synthetic records are indexed into
+temporary indices created from the N-results mapping, e.g.
+``pytest benchmarks/test_search.py --bench-records=1000000``.
+"""
+import json
+
+import pytest
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+from elasticsearch_dsl import Q
+from flask import request
+from oarepo_mapping_includes.mapping_transformer import process
+
+from nr_nresults.constants import prefixed_published_index_name
+from nr_nresults.generator import generate_records
+from nr_nresults.search import NResultsRecordsSearch
+
+BENCHMARK_INDEX = 'nr_nresults-benchmark-search'
+QUERIES = ['metodika', 'mapa', 'monitoring vody', 'památkový postup', 'ochrana rostlin',
+           'hodnocení', 'georadar', 'eroze', 'bezpečnost', 'údržba']
+
+
+@pytest.fixture(scope='module')
+def es_client():
+    client = Elasticsearch()
+    if not client.ping():
+        pytest.skip('Elasticsearch is not available')
+    return client
+
+
+@pytest.fixture()
+def nresults_mapping(app, tmpdir):
+    mapping_path = app.extensions['invenio-search'].mappings['nr_nresults-nr-nresults-v1.0.0']
+    with open(process(app.extensions['oarepo-mapping-includes'], str(tmpdir), mapping_path)) as f:
+        return json.load(f)
+
+
+def create_index(es_client, index, mapping, record_count):
+    es_client.indices.delete(index=index, ignore=[404])
+    es_client.indices.create(index=index, body={'mappings': mapping['mappings'],
+                                                'settings': mapping['settings']})
+    # the mapping requires routing, the records are routed by their control numbers
+    bulk(es_client, ({'_index': index, '_routing': data['control_number'], '_source': data}
+                     for data in generate_records(record_count, seed=record_count)))
+    es_client.indices.refresh(index=index)
+    es_client.indices.forcemerge(index=index, max_num_segments=1)
+
+
+@pytest.fixture()
+def search_index(es_client, nresults_mapping, record_count):
+    create_index(es_client, BENCHMARK_INDEX, nresults_mapping, record_count)
+    yield BENCHMARK_INDEX
+    es_client.indices.delete(index=BENCHMARK_INDEX, ignore=[404])
+
+
+def list_body(app, query=None, highlight=False, sort=None):
+    """Body of a list request, without the permission filters (generated records are not published)."""
+    url = '/nr/nresults/?' + (f'q={query}' if query else '') + ('&highlight=true' if highlight else '')
+    with app.test_request_context(url):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name).with_list_args(request.args)
+        if sort:
+            search = search.sort(*sort).extra(track_total_hits=False)
+        body = search[0:25].to_dict()
+    body['query'] = Q('query_string', query=query).to_dict() if query else {'match_all': {}}
+    return body
+
+
+def run_searches(es_client, index, bodies, repeat=10):
+    for body in bodies:
+        # warm up the caches of the index
+        es_client.search(index=index, body=body)
+    for body in bodies * repeat:
+        es_client.search(index=index, body=body, request_cache=False)
+
+
+@pytest.mark.parametrize('highlight', [False, True], ids=['plain', 'highlight'])
+def test_list_latency(app, es_client, search_index, record_count, recorder, highlight):
+    bodies = [list_body(app, query, highlight) for query in QUERIES]
+    stage = 'list_highlight' if highlight else 'list'
+    with recorder.measure(stage, record_count):
+        run_searches(es_client, search_index, bodies)
+
+
+def test_newest_first_latency(app, es_client, search_index, record_count, recorder):
+    bodies = [list_body(app, sort=['-dateIssued.date', '-control_number.long'])]
+    with recorder.measure('newest_first', record_count):
+        run_searches(es_client, search_index, bodies, repeat=100)
@@ -0,0 +1,39 @@
+"""Encoding of N-results list responses, the oarepo-validate serializer against the N-results one."""
+import copy
+
+import pytest
+from oarepo_validate.serializers import json_serializer as oarepo_json_serializer
+
+from nr_nresults.fetchers import nr_nresults_id_fetcher
+from nr_nresults.generator import generate_records
+from nr_nresults.serializers import json_serializer
+
+PAGE_SIZE = 500
+
+
+def links_factory(pid, record_hit=None, **kwargs):
+    return {"self": f"https://localhost/nr/nresults/{pid.pid_value}"}
+
+
+def search_pages(count):
+    records = list(generate_records(count, seed=count))
+    pages = []
+    for start in range(0, count, PAGE_SIZE):
+        hits = [{"_id": str(i), "_version": 1, "_source": data}
+                for i, data in enumerate(records[start:start + PAGE_SIZE], start)]
+        pages.append({"hits": {"total": {"value": count}, "hits": hits}, "aggregations": {}})
+    return pages
+
+
+@pytest.mark.parametrize('stage, serializer', [
+    ('serialize_search_oarepo', oarepo_json_serializer),
+    ('serialize_search_nresults', json_serializer),
+])
+def test_serialize_search(app, record_count, recorder, stage, serializer):
+    # the oarepo serializer removes _created/_updated from the hits, each run gets its own copy
+    pages = copy.deepcopy(search_pages(record_count))
+    with app.test_request_context():
+        with recorder.measure(stage, record_count):
+            for page in pages:
+                serializer.serialize_search(nr_nresults_id_fetcher, page,
+                                            item_links_factory=links_factory)
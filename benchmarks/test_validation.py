@@ -0,0 +1,30 @@
+from invenio_jsonschemas import current_jsonschemas
+from invenio_records.api import _records_state
+
+from nr_nresults.constants import NRESULTS_PREFERRED_SCHEMA
+from nr_nresults.generator import generate_records
+from nr_nresults.proxies import current_nresults
+
+
+def schema_records(count):
+    url = current_jsonschemas.path_to_url(NRESULTS_PREFERRED_SCHEMA)
+    records = list(generate_records(count, seed=count))
+    for data in records:
+        data['$schema'] = url
+    return url, records
+
+
+def test_schema_validation(app, record_count, recorder):
+    url, records = schema_records(record_count)
+    with recorder.measure('jsonschema_validate', record_count):
+        for data in records:
+            _records_state.validate(data, url)
+
+
+def test_compiled_schema_validation(app, record_count, recorder):
+    url, records = schema_records(record_count)
+    current_nresults.schema_validators.clear()
+    with recorder.measure('jsonschema_validate_compiled', record_count):
+        validator = current_nresults.schema_validator(url)
+        for data in records:
+            validator.validate(data)
@@ -0,0 +1,77 @@
+"""Work deferred until the database transaction commits.
+
+Items are collected on the session (``session.info``) and passed to their
+callback when the outermost transaction commits. Items added within a
+savepoint that is rolled back are dropped, a rollback of the outermost
+transaction drops all of them.
+
+The callbacks run in the ``after_commit`` session event, the session cannot
+emit SQL there: they should only hand the items over, e.g. to Celery or to
+the message queue.
+"""
+import logging
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+log = logging.getLogger('nr-nresults-after-commit')
+
+SESSION_KEY = 'nr-nresults-after-commit'
+"""Key of the deferred items in ``session.info``."""
+
+
+def defer(session, name, key, value, callback, merge=None):
+    """Pass ``value`` to ``callback`` when the outermost transaction of the session commits.
+
+    :param name: group of items passed to the callback together, as a list
+    :param key: the item replaces a previous item of the group with the same key
+    :param merge: callable (previous value, value) returning the value replacing the previous one
+    """
+    callback_, items = session.info.setdefault(SESSION_KEY, OrderedDict()) \
+        .setdefault(name, (callback, OrderedDict()))
+    transaction = session.transaction
+    if key in items:
+        # the change of the previous item does not go away with a rolled back savepoint
+        transaction, previous = items.pop(key)
+        if merge is not None:
+            value = merge(previous, value)
+    items[key] = (transaction, value)
+
+
+def _within(transaction, ancestor):
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+def _after_commit(session):
+    if session.transaction is not None and session.transaction.nested:
+        # released savepoint, nothing is committed yet
+        return
+    for name, (callback, items) in session.info.pop(SESSION_KEY, {}).items():
+        if not items:
+            continue
+        try:
+            callback([value for _, value in items.values()])
+        except Exception:
+            log.exception('Deferred %s of %s failed', name, ', '.join(map(str, items)))
+
+
+def _after_soft_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(SESSION_KEY, None)
+        return
+    for callback, items in session.info.get(SESSION_KEY, {}).values():
+        for key in [k for k, (transaction, _) in items.items()
+                    if _within(transaction, previous_transaction)]:
+            del items[key]
+
+
+def register_session_events():
+    """Run the deferred callbacks on commit and drop the items on rollback (idempotent)."""
+    if not event.contains(Session, 'after_commit', _after_commit):
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
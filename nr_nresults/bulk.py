@@ -0,0 +1,167 @@
+"""Bulk ingest of N-result records.
+
+Records are read from JSON lines and processed in chunks: for every record
+the PID is minted and the record is validated and created (which also
+registers its references), the whole chunk is committed in one database
+transaction and indexed with one Elasticsearch bulk request.
+
+After each chunk the number of consumed input lines is written to the
+checkpoint file, so an interrupted ingest can be resumed from the last
+committed chunk.
+"""
+import json
+import logging
+import os
+import uuid
+from collections import namedtuple
+
+from invenio_db import db
+from invenio_pidstore.errors import PIDDoesNotExistError
+from invenio_pidstore.models import PersistentIdentifier
+from nr_common.minters import get_pid_type
+
+from nr_nresults.indexer import NResultsBulkIndexer
+from nr_nresults.marshmallow.batch import prefetch_taxonomy_terms
+from nr_nresults.minters import nr_nresults_id_minter
+from nr_nresults.record import PublishedNResultRecord
+
+log = logging.getLogger('nr-nresults-bulk')
+
+IngestError = namedtuple('IngestError', ['line', 'error'])
+"""Record that failed to ingest: its input line number and the error."""
+
+IngestResult = namedtuple('IngestResult', ['processed', 'created', 'skipped', 'errors'])
+"""Summary of a bulk ingest."""
+
+
+def read_checkpoint(checkpoint):
+    """Return number of input lines already ingested according to the checkpoint file."""
+    if not checkpoint or not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint) as f:
+        return json.load(f)['lines']
+
+
+def write_checkpoint(checkpoint, lines):
+    if not checkpoint:
+        return
+    tmp = checkpoint + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'lines': lines}, f)
+    os.replace(tmp, checkpoint)
+
+
+def iter_json_lines(stream, start=0):
+    """Yield tuples (line number, line) of non-empty lines, skipping the first start lines."""
+    for line_no, line in enumerate(stream):
+        if line_no < start:
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        yield line_no, line
+
+
+def _chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _already_ingested(data):
+    control_number = data.get('control_number')
+    if control_number is None:
+        return False
+    try:
+        PersistentIdentifier.get(get_pid_type(data), str(control_number))
+        return True
+    except PIDDoesNotExistError:
+        return False
+
+
+def ingest_chunk(lines, record_class=PublishedNResultRecord, minter=nr_nresults_id_minter,
+                 indexer=None):
+    """Mint, validate, create, commit and index one chunk of records.
+
+    :param lines: list of tuples (line number, JSON string)
+    :returns: tuple (created records, number of skipped records, list of :data:`IngestError`)
+    """
+    errors = []
+    parsed = []
+    for line_no, line in lines:
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            errors.append(IngestError(line_no, e))
+            continue
+        parsed.append((line_no, data))
+
+    prefetch_taxonomy_terms([data for _, data in parsed])
+
+    created = []
+    skipped = 0
+    for line_no, data in parsed:
+        try:
+            if _already_ingested(data):
+                # ingested by a previous run that failed before writing the checkpoint
+                skipped += 1
+                continue
+            with db.session.begin_nested():
+                record_uuid = uuid.uuid4()
+                minter(record_uuid, data)
+                created.append(record_class.create(data, id_=record_uuid))
+        except Exception as e:
+            log.exception('Error ingesting record on line %s', line_no)
+            errors.append(IngestError(line_no, e))
+    db.session.commit()
+
+    if indexer is not None and created:
+        _, index_errors = indexer.bulk_index_records(created)
+        if index_errors:
+            log.error('%s records of the chunk were not indexed', len(index_errors))
+    return created, skipped, errors
+
+
+def bulk_ingest(stream, chunk_size=500, checkpoint=None, resume=True,
+                record_class=PublishedNResultRecord, minter=nr_nresults_id_minter,
+                index=True, progress=None):
+    """Ingest N-result records from a stream of JSON lines.
+
+    :param stream: iterable of lines, each containing one record
+    :param chunk_size: number of records committed and indexed together
+    :param checkpoint: path of the checkpoint file, None to disable checkpointing
+    :param resume: continue after the last chunk recorded in the checkpoint
+    :param record_class: class of the created records
+    :param minter: PID minter
+    :param index: index the records after each chunk is committed
+    :param progress: optional callable receiving the :data:`IngestResult` after each chunk
+    :returns: :data:`IngestResult`
+    """
+    start = read_checkpoint(checkpoint) if resume else 0
+    if start:
+        log.info('Resuming ingest after line %s', start)
+    indexer = NResultsBulkIndexer() if index else None
+
+    processed = created_count = skipped_count = 0
+    errors = []
+    for chunk in _chunks(iter_json_lines(stream, start), chunk_size):
+        try:
+            created, skipped, chunk_errors = ingest_chunk(chunk, record_class=record_class,
+                                                          minter=minter, indexer=indexer)
+        except Exception:
+            db.session.rollback()
+            raise
+        processed += len(chunk)
+        created_count += len(created)
+        skipped_count += skipped
+        errors.extend(chunk_errors)
+        write_checkpoint(checkpoint, chunk[-1][0] + 1)
+        if progress:
+            progress(IngestResult(processed, created_count, skipped_count, errors))
+
+    return IngestResult(processed, created_count, skipped_count, errors)
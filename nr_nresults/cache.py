@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+
+
+class TTLCache:
+    """Thread safe LRU cache with bounded size and a time to live of the entries.
+
+    ``max_size`` of 0 disables the cache, nothing is stored.
+    """
+
+    def __init__(self, max_size=1024, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def lookup(self, key):
+        """Return the cached value or None if it is not cached or has expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def store(self, key, value):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate_matching(self, predicate):
+        """Drop entries whose key matches the predicate."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedVersions:
+    """Version counters of cached data shared by the processes of the deployment.
+
+    Cache entries are keyed by the current version of the data they depend on,
+    bumping the version invalidates the entries in every process. The counters
+    are kept in the invenio-cache backend (Redis in deployments); without
+    invenio-cache they are local to the process.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._local = {}
+        self._local_changed = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _backend():
+        if not has_app_context():
+            return None
+        return getattr(current_app.extensions.get('invenio-cache'), 'cache', None)
+
+    def get(self, name):
+        backend = self._backend()
+        if backend is None:
+            return self._local.get(name, 0)
+        return backend.get(f'{self.prefix}:{name}') or 0
+
+    def bump(self, name):
+        backend = self._backend()
+        now = time.time()
+        if backend is None:
+            with self._lock:
+                self._local[name] = self._local.get(name, 0) + 1
+                self._local_changed[name] = now
+        else:
+            backend.inc(f'{self.prefix}:{name}')
+            backend.set(f'{self.prefix}:{name}:changed', now)
+
+    def age(self, name):
+        """Return the seconds since the version was bumped, None if it never was."""
+        backend = self._backend()
+        if backend is None:
+            changed = self._local_changed.get(name)
+        else:
+            changed = backend.get(f'{self.prefix}:{name}:changed')
+        return None if changed is None else time.time() - changed
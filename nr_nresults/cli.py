@@ -0,0 +1,184 @@
+import click
+from flask.cli import with_appcontext
+from invenio_base.utils import obj_or_import_string
+
+from nr_nresults.constants import PUBLISHED_NRESULT_RECORD
+
+
+@click.group()
+def nresults():
+    """N-results repository commands."""
+
+
+@nresults.command('bulk-ingest')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--chunk-size', '-c', default=500, show_default=True,
+              help='Number of records committed and indexed together')
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help='File keeping the ingest position, used to resume the ingest')
+@click.option('--resume/--no-resume', default=True, help='Continue from the checkpoint')
+@click.option('--record-class', default=PUBLISHED_NRESULT_RECORD, show_default=True)
+@click.option('--index/--no-index', default=True, help='Index the records in Elasticsearch')
+@with_appcontext
+def bulk_ingest(source, chunk_size, checkpoint, resume, record_class, index):
+    """Ingest N-result records from a JSON lines file (- for stdin)."""
+    from nr_nresults.bulk import bulk_ingest as _bulk_ingest
+
+    def progress(result):
+        click.echo(f'processed {result.processed}, created {result.created}, '
+                   f'skipped {result.skipped}, errors {len(result.errors)}')
+
+    result = _bulk_ingest(source, chunk_size=chunk_size, checkpoint=checkpoint, resume=resume,
+                          record_class=obj_or_import_string(record_class), index=index,
+                          progress=progress)
+    for error in result.errors:
+        click.secho(f'line {error.line + 1}: {error.error}', fg='red', err=True)
+
+
+@nresults.command('generate')
+@click.argument('output', type=click.File('w', encoding='utf-8'))
+@click.option('--count', '-n', default=1000, show_default=True, help='Number of records')
+@click.option('--seed', default=0, show_default=True, help='Seed of the random generator')
+@click.option('--start', default=1, show_default=True, help='First control number')
+@click.option('--taxonomy-url', help='Base URL of the taxonomy links '
+                                     '(default SERVER_NAME + FLASK_TAXONOMIES_URL_PREFIX)')
+@click.option('--community', default='nr', show_default=True, help='Primary community')
+@click.option('--create-terms', is_flag=True, help='Create the taxonomy terms the records link to')
+@with_appcontext
+def generate(output, count, seed, start, taxonomy_url, community, create_terms):
+    """Write synthetic N-result records as JSON lines (- for stdout)."""
+    from flask import current_app
+    from invenio_db import db
+
+    from nr_nresults.generator import create_taxonomy_terms, generate_records, write_ndjson
+
+    if create_terms:
+        create_taxonomy_terms()
+        db.session.commit()
+    if not taxonomy_url:
+        prefix = current_app.config.get('FLASK_TAXONOMIES_URL_PREFIX', '/2.0/taxonomies/')
+        server_name = current_app.config.get('SERVER_NAME') or 'localhost'
+        taxonomy_url = f'https://{server_name}{prefix}'.rstrip('/')
+    written = write_ndjson(output, generate_records(count, seed=seed, start=start,
+                                                     taxonomy_url=taxonomy_url,
+                                                     community=community))
+    click.echo(f'generated {written} records', err=True)
+
+
+@nresults.command('refresh-term')
+@click.argument('term_url')
+@click.option('--batch-size', '-b', default=100, show_default=True,
+              help='Number of records committed and reindexed together')
+@click.option('--throttle', default=0.0, show_default=True,
+              help='Seconds to wait between batches')
+@click.option('--index/--no-index', default=True, help='Reindex the refreshed records')
+@with_appcontext
+def refresh_term(term_url, batch_size, throttle, index):
+    """Dereference again and reindex records referencing the taxonomy term TERM_URL."""
+    from nr_nresults.refresh import refresh_records
+
+    def progress(result):
+        click.echo(f'refreshed {result.refreshed}/{result.total}, indexed {result.indexed}, '
+                   f'errors {len(result.errors)}')
+
+    result = refresh_records(term_url, batch_size=batch_size, throttle=throttle, index=index,
+                             progress=progress)
+    for error in result.errors:
+        click.secho(f'{error.record_uuid}: {error.error}', fg='red', err=True)
+
+
+@nresults.command('reindex')
+@click.option('--index', 'index_type', type=click.Choice(['published', 'draft']),
+              default='published', show_default=True)
+@click.option('--source', type=click.Choice(['database', 'index']), default='database',
+              show_default=True, help='Read the documents from the database or the old index')
+@click.option('--slices', '-s', default=4, show_default=True, help='Number of parallel readers')
+@click.option('--batch-size', '-b', default=500, show_default=True,
+              help='Number of records indexed together')
+@click.option('--delete-old', is_flag=True, help='Delete the old index after the alias swap')
+@click.option('--force', is_flag=True, help='Swap the aliases even if the document counts differ')
+@with_appcontext
+def reindex(index_type, source, slices, batch_size, delete_old, force):
+    """Rebuild an N-results index into a new one and atomically swap the aliases."""
+    from nr_nresults.constants import draft_index_name, published_index_name
+    from nr_nresults.reindex import ReindexError, reindex as _reindex
+
+    index = published_index_name if index_type == 'published' else draft_index_name
+    try:
+        result = _reindex(index, source=source, slices=slices, batch_size=batch_size,
+                          delete_old=delete_old, force=force, progress=click.echo)
+    except ReindexError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{result.new_index}: {result.count} documents (expected {result.expected}), '
+               f'caught up {result.caught_up}')
+
+
+@nresults.command('build-mapping')
+@click.option('--output', '-o', type=click.Path(dir_okay=False),
+              help='Artifact file (default NRESULTS_MAPPING_ARTIFACT)')
+@with_appcontext
+def build_mapping(output):
+    """Write the N-results mapping with resolved extends and includes, and its hash."""
+    from flask import current_app
+
+    from nr_nresults.mapping_artifact import artifact_path, build_artifact
+
+    if not output and not artifact_path(current_app):
+        raise click.ClickException('NRESULTS_MAPPING_ARTIFACT is not set, use --output')
+    status = build_artifact(current_app, output)
+    click.echo(f'{status.path}: mapping {status.mapping_hash}, sources {status.source_hash}')
+
+
+@nresults.command('check-mapping')
+@click.option('--index/--no-index', default=True,
+              help='Compare with the hash stored in the published index')
+@with_appcontext
+def check_mapping(index):
+    """Compare the mapping artifact and the published index with the current sources."""
+    import os
+
+    from flask import current_app
+    from invenio_search.utils import build_alias_name
+
+    from nr_nresults.constants import published_index_name
+    from nr_nresults.mapping_artifact import artifact_path, artifact_status, \
+        index_mapping_hashes, mapping_hash, resolve_mapping
+
+    current = mapping_hash(resolve_mapping(current_app))
+    click.echo(f'sources: {current}')
+    drift = False
+    path = artifact_path(current_app)
+    if path and os.path.exists(path):
+        status = artifact_status(path)
+        click.echo(f'artifact {path}: {status.mapping_hash}'
+                   + (f' (not used: {status.reason})' if not status.valid else ''))
+        drift = not status.valid or status.mapping_hash != current
+    else:
+        click.echo('no artifact, the mapping is expanded at runtime')
+    if index:
+        for name, stored in index_mapping_hashes(build_alias_name(published_index_name)).items():
+            click.echo(f'index {name}: {stored or "no hash (created without the artifact)"}')
+            drift = drift or (stored is not None and stored != current)
+    if drift:
+        raise click.ClickException('The mapping differs from the current sources')
+
+
+@nresults.command('process-index-queue')
+@click.option('--batch-size', '-b', type=int, help='Max number of operations sent in one bulk request')
+@with_appcontext
+def process_index_queue(batch_size):
+    """Index the records queued by NResultsQueuedIndexer."""
+    from nr_nresults.index_queue import process_index_queue as _process_index_queue
+
+    result = _process_index_queue(batch_size=batch_size)
+    click.echo(f'indexed {result.sent}, coalesced {result.coalesced}, waiting {result.waiting}, '
+               f'retried {result.retried}, failed {result.failed}')
+
+
+@nresults.command('requeue-failed')
+@with_appcontext
+def requeue_failed():
+    """Return the operations given up by the index queue to the queue."""
+    from nr_nresults.index_queue import requeue_failed as _requeue_failed
+
+    click.echo(f'requeued {_requeue_failed()}')
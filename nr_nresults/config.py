@@ -9,17 +9,168 @@
 
 from __future__ import absolute_import, print_function
 
-from functools import partial
+from datetime import timedelta
 
-from invenio_records_rest.utils import allow_all, deny_all
-from nr_common.search import community_search_factory
-from oarepo_communities.links import community_record_links_factory
+from oarepo_taxonomies.facets import taxonomy_term_facet
 
 from nr_nresults.constants import PUBLISHED_NRESULT_PID_TYPE, PUBLISHED_NRESULT_RECORD, DRAFT_NRESULT_PID_TYPE, \
-    DRAFT_NRESULT_RECORD, ALL_NRESULTS_RECORD_CLASS, ALL_NRESULTS_PID_TYPE, all_nresults_index_name
-from nr_nresults.record import draft_index_name, published_index_name
-from nr_nresults.search import NResultsRecordsSearch
-from nr_common.links import nr_links_factory
+    DRAFT_NRESULT_RECORD, ALL_NRESULTS_RECORD_CLASS, ALL_NRESULTS_PID_TYPE, all_nresults_index_name, \
+    draft_index_name, published_index_name
+from nr_nresults.facets import TAXONOMY_FACET_FIELDS, taxonomy_term_filter, year_histogram_facet, \
+    year_range_filter
+
+NRESULTS_TAXONOMY_CACHE_SIZE = 1024
+"""Max number of taxonomy terms kept in the dereferencing cache, 0 disables the cache."""
+
+NRESULTS_TAXONOMY_CACHE_TTL = 600
+"""Seconds after which a cached taxonomy term is resolved again."""
+
+NRESULTS_REFRESH_ON_TERM_CHANGE = True
+"""Refresh and reindex records referencing a taxonomy term in a background task when the term change commits.
+
+The task needs a Celery worker. With CELERY_TASK_ALWAYS_EAGER it is not run (it
+cannot use the committed session), the oarepo-taxonomies handler refreshes the records.
+"""
+
+NRESULTS_REPLACE_TAXONOMY_REFRESH = False
+"""Disconnect the oarepo-taxonomies handlers refreshing every record referencing an updated term and locking the term.
+
+Set it only if no records of other models reference the taxonomies: the N-result
+refresh replacing them refreshes N-result records only and does not lock the
+term. Ignored with CELERY_TASK_ALWAYS_EAGER.
+"""
+
+NRESULTS_REFRESH_BATCH_SIZE = 100
+"""Number of records committed and reindexed together by the refresh."""
+
+NRESULTS_REFRESH_THROTTLE = 0.1
+"""Seconds the refresh waits between batches."""
+
+NRESULTS_ID_BLOCK_SIZE = 0
+"""Number of control numbers each process reserves at once, 0 mints them one by one."""
+
+NRESULTS_MEMOIZE_CANONICAL_URL = True
+"""Keep the computed canonical_url on the record instance."""
+
+NRESULTS_EXPORT_PAGE_SIZE = 1000
+"""Number of hits fetched from Elasticsearch in one request of the streaming export."""
+
+NRESULTS_EXPORT_USE_PIT = False
+"""Run the export inside a point in time (consistent view of the index), needs Elasticsearch 7.10+."""
+
+NRESULTS_EXPORT_PIT_KEEP_ALIVE = '1m'
+
+NRESULTS_EXPORT_CSV_FIELDS = [
+    'control_number', 'title', 'dateIssued', 'N_type', 'N_resultUsage', 'N_dateCertified',
+    '_administration.primaryCommunity'
+]
+"""Columns of the CSV export."""
+
+NRESULTS_SEARCH_CACHE_SIZE = 256
+"""Max number of cached responses of anonymous searches over published records, 0 disables the cache."""
+
+NRESULTS_SEARCH_CACHE_TTL = 60
+"""Seconds a cached search response is served.
+
+The cache is per process, its entries are keyed by the version of the published
+index shared through invenio-cache (Redis), which is bumped when Elasticsearch
+confirmed the indexing or deletion of a published record. Without invenio-cache the version is per process and
+other processes see the change after this time.
+"""
+
+NRESULTS_SEARCH_CACHE_SETTLE = 2.0
+"""Seconds after a change of an index during which its search responses and aggregations are not cached.
+
+Changed documents become searchable after the refresh interval of the index (1s
+by default), responses computed before may still miss them.
+"""
+
+NRESULTS_AGGREGATION_CACHE_SIZE = 256
+"""Max number of cached aggregations (facet counts) of list searches, 0 disables the cache."""
+
+NRESULTS_AGGREGATION_CACHE_TTL = 60
+"""Seconds cached aggregations are served.
+
+Keyed by the shared version of the searched index like NRESULTS_SEARCH_CACHE_TTL,
+changes of the draft index do not invalidate aggregations of the published one.
+"""
+
+NRESULTS_TRACK_TOTAL_HITS = True
+"""Total hits counted by list searches: True for the exact count or a number to count up to.
+
+A number (e.g. 10000, the max result window) lets Elasticsearch stop counting
+matching documents once it is reached.
+"""
+
+NRESULTS_COMPILED_SCHEMA_VALIDATION = True
+"""Validate records with the schema resolved and compiled once per process (nr_nresults.validation)."""
+
+NRESULTS_WARM_SCHEMA_VALIDATORS = False
+"""Compile the schema validators when the app loads instead of on the first validation.
+
+Turn on in the REST app only, CLI commands and Celery workers should not pay for it at start.
+"""
+
+NRESULTS_INCREMENTAL_PATCH_VALIDATION = True
+"""Validate only the fields touched by a JSON patch of a valid draft."""
+
+NRESULTS_CONTENT_FINGERPRINTS = True
+"""Skip validation and reindexing of records whose content did not change (nr_nresults.fingerprint)."""
+
+NRESULTS_METRICS = True
+"""Time the record lifecycle stages (nr_nresults.metrics), served in the Prometheus format by /nresults/metrics."""
+
+NRESULTS_METRICS_PERMISSION_FACTORY = 'invenio_records_rest.utils:deny_all'
+"""Permission factory of the metrics view, e.g. 'invenio_records_rest.utils:allow_all' behind a firewall."""
+
+NRESULTS_QUERY_LOG = True
+"""Keep latency histograms of the executed searches per query fingerprint (nr_nresults.querylog)."""
+
+NRESULTS_QUERY_LOG_MAX_FINGERPRINTS = 500
+"""Number of query fingerprints kept, the least recently executed are dropped."""
+
+NRESULTS_SLOW_QUERY_THRESHOLD = 1.0
+"""Searches taking more seconds are logged to the 'nr-nresults-slow-queries' logger, None disables the log."""
+
+NRESULTS_QUERY_STATS_PERMISSION_FACTORY = 'nr_nresults.querylog:admin_permission_factory'
+"""Permission factory of the /nresults/query-stats view."""
+
+NRESULTS_INDEX_QUEUE = 'nr-nresults-indexer'
+"""Broker queue of the records queued by NResultsQueuedIndexer (nr_nresults.index_queue), failed ones go to '<queue>-failed'."""
+
+NRESULTS_INDEX_QUEUE_WINDOW = 2.0
+"""Seconds a queued record waits for further saves before it is indexed, the saves are indexed once."""
+
+NRESULTS_INDEX_QUEUE_BACKOFF = 5.0
+"""Seconds before the first retry of a record that failed to index, doubled with every attempt."""
+
+NRESULTS_INDEX_QUEUE_BATCH_SIZE = 500
+"""Max number of queued operations sent by the process_index_queue task in one bulk request."""
+
+NRESULTS_INDEX_QUEUE_MAX_RETRIES = 5
+"""Attempts to index a failing record before it is moved to the failed queue."""
+
+CELERY_BEAT_SCHEDULE = {
+    'nr-nresults-index-queue': {
+        'task': 'nr_nresults.tasks.process_index_queue',
+        'schedule': timedelta(seconds=5),
+    },
+}
+"""Celery beat runs the index queue task, entries of the app configuration with the same name take precedence."""
+
+NRESULTS_MAPPING_ARTIFACT = 'mapping-artifacts/nr-nresults-v1.0.0.json'
+"""Resolved mapping built by ``invenio nresults build-mapping`` (relative to the instance path), None disables it.
+
+Used instead of expanding the source mapping when it exists and matches the
+sources (nr_nresults.mapping_artifact).
+"""
+
+NRESULTS_COMMUNITY_ROUTING = False
+"""Index N-result documents with routing by primary community and route community searches (nr_nresults.routing).
+
+Existing documents are not routed, reindex them (``invenio nresults reindex``)
+from the database after switching this on or off.
+"""
 
 RECORDS_DRAFT_ENDPOINTS = {
     'nresults-community': {
@@ -28,10 +179,10 @@ RECORDS_DRAFT_ENDPOINTS = {
         'pid_minter': 'nr_nresults',
         'pid_fetcher': 'nr_nresults',
         'default_endpoint_prefix': True,
-        'max_result_window': 500000,
+        'max_result_window': 10000,
         'record_class': PUBLISHED_NRESULT_RECORD,
         'search_index': published_index_name,
-        'search_factory_imp': community_search_factory,
+        'search_factory_imp': 'nr_nresults.search:nresults_community_search_factory',
 
         'list_route': '/<community_id>/nresults/',
         'item_route': f'/<commpid({PUBLISHED_NRESULT_PID_TYPE},model="nresults",record_class="{PUBLISHED_NRESULT_RECORD}"):pid_value>',
@@ -39,22 +190,28 @@ RECORDS_DRAFT_ENDPOINTS = {
         'publish_permission_factory_imp': 'nr_common.permissions.publish_draft_object_permission_impl',
         'unpublish_permission_factory_imp': 'nr_common.permissions.unpublish_draft_object_permission_impl',
         'edit_permission_factory_imp': 'nr_common.permissions.update_object_permission_impl',
-        'list_permission_factory_imp': allow_all,
-        'read_permission_factory_imp': allow_all,
-        'create_permission_factory_imp': deny_all,
-        'update_permission_factory_imp': deny_all,
-        'delete_permission_factory_imp': deny_all,
+        'list_permission_factory_imp': 'invenio_records_rest.utils:allow_all',
+        'read_permission_factory_imp': 'invenio_records_rest.utils:allow_all',
+        'create_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
+        'update_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
+        'delete_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
         'default_media_type': 'application/json',
-        'links_factory_imp': partial(community_record_links_factory, original_links_factory=nr_links_factory),
-        'search_class': NResultsRecordsSearch,
-        # 'indexer_class': CommitingRecordIndexer,
+        'links_factory_imp': 'nr_nresults.links:nresults_links_factory',
+        'search_class': 'nr_nresults.search:NResultsRecordsSearch',
+        'indexer_class': 'nr_nresults.indexer:NResultsBulkIndexer',
+        'search_serializers': {
+            'application/json': 'nr_nresults.serializers:json_search',
+        },
+        'record_serializers': {
+            'application/json': 'nr_nresults.serializers:json_response',
+        },
         'files': dict(
             # Who can upload attachments to a draft dataset record
-            put_file_factory=deny_all,
+            put_file_factory='invenio_records_rest.utils:deny_all',
             # Who can download attachments from a draft dataset record
-            get_file_factory=allow_all,
+            get_file_factory='invenio_records_rest.utils:allow_all',
             # Who can delete attachments from a draft dataset record
-            delete_file_factory=deny_all
+            delete_file_factory='invenio_records_rest.utils:deny_all'
         )
 
     },
@@ -65,14 +222,15 @@ RECORDS_DRAFT_ENDPOINTS = {
         'list_route': '/<community_id>/nresults/draft/',
         'item_route': f'/<commpid({DRAFT_NRESULT_PID_TYPE},model="nresults/draft",record_class="{DRAFT_NRESULT_RECORD}"):pid_value>',
         'search_index': draft_index_name,
-        'links_factory_imp': partial(community_record_links_factory, original_links_factory=nr_links_factory),
-        'search_factory_imp': community_search_factory,
-        'search_class': NResultsRecordsSearch,
+        'links_factory_imp': 'nr_nresults.links:nresults_links_factory',
+        'search_factory_imp': 'nr_nresults.search:nresults_community_search_factory',
+        'search_class': 'nr_nresults.search:NResultsRecordsSearch',
+        'indexer_class': 'nr_nresults.indexer:NResultsQueuedIndexer',
         'search_serializers': {
-            'application/json': 'oarepo_validate:json_search',
+            'application/json': 'nr_nresults.serializers:json_search',
         },
         'record_serializers': {
-            'application/json': 'oarepo_validate:json_response',
+            'application/json': 'nr_nresults.serializers:json_response',
         },
 
         'create_permission_factory_imp': 'nr_common.permissions.create_draft_object_permission_impl',
@@ -97,31 +255,38 @@ RECORDS_DRAFT_ENDPOINTS = {
         'pid_minter': 'nr_nresults',
         'pid_fetcher': 'nr_nresults',
         'default_endpoint_prefix': True,
-        'max_result_window': 500000,
+        'max_result_window': 10000,
         'record_class': ALL_NRESULTS_RECORD_CLASS,
         'search_index': published_index_name,
+        'search_factory_imp': 'nr_nresults.search:nresults_search_factory',
 
         'list_route': '/nresults/',
         'item_route': f'/not-really-used',
-        'publish_permission_factory_imp': deny_all,
-        'unpublish_permission_factory_imp': deny_all,
-        'edit_permission_factory_imp': deny_all,
-        'list_permission_factory_imp': allow_all,
-        'read_permission_factory_imp': allow_all,
-        'create_permission_factory_imp': deny_all,
-        'update_permission_factory_imp': deny_all,
-        'delete_permission_factory_imp': deny_all,
+        'publish_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
+        'unpublish_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
+        'edit_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
+        'list_permission_factory_imp': 'invenio_records_rest.utils:allow_all',
+        'read_permission_factory_imp': 'invenio_records_rest.utils:allow_all',
+        'create_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
+        'update_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
+        'delete_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
         'default_media_type': 'application/json',
-        'links_factory_imp': partial(community_record_links_factory, original_links_factory=nr_links_factory),
-        'search_class': NResultsRecordsSearch,
-        # 'indexer_class': CommitingRecordIndexer,
+        'links_factory_imp': 'nr_nresults.links:nresults_links_factory',
+        'search_class': 'nr_nresults.search:NResultsRecordsSearch',
+        'indexer_class': 'nr_nresults.indexer:NResultsBulkIndexer',
+        'search_serializers': {
+            'application/json': 'nr_nresults.serializers:json_search',
+        },
+        'record_serializers': {
+            'application/json': 'nr_nresults.serializers:json_response',
+        },
         'files': dict(
             # Who can upload attachments to a draft dataset record
-            put_file_factory=deny_all,
+            put_file_factory='invenio_records_rest.utils:deny_all',
             # Who can download attachments from a draft dataset record
-            get_file_factory=allow_all,
+            get_file_factory='invenio_records_rest.utils:allow_all',
             # Who can delete attachments from a draft dataset record
-            delete_file_factory=deny_all
+            delete_file_factory='invenio_records_rest.utils:deny_all'
         )
     },
     'draft-nresults': {
@@ -131,24 +296,25 @@ RECORDS_DRAFT_ENDPOINTS = {
         'list_route': '/nresults/draft/',
         'item_route': f'/not-really-used',
         'search_index': draft_index_name,
-        'links_factory_imp': partial(community_record_links_factory, original_links_factory=nr_links_factory),
-        'search_class': NResultsRecordsSearch,
+        'search_factory_imp': 'nr_nresults.search:nresults_search_factory',
+        'links_factory_imp': 'nr_nresults.links:nresults_links_factory',
+        'search_class': 'nr_nresults.search:NResultsRecordsSearch',
         'search_serializers': {
-            'application/json': 'oarepo_validate:json_search',
+            'application/json': 'nr_nresults.serializers:json_search',
         },
         'record_serializers': {
-            'application/json': 'oarepo_validate:json_response',
+            'application/json': 'nr_nresults.serializers:json_response',
         },
 
-        'create_permission_factory_imp': deny_all,
-        'update_permission_factory_imp': deny_all,
+        'create_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
+        'update_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
         'read_permission_factory_imp': 'nr_common.permissions.read_draft_object_permission_impl',
-        'delete_permission_factory_imp': deny_all,
+        'delete_permission_factory_imp': 'invenio_records_rest.utils:deny_all',
         'list_permission_factory_imp': 'nr_common.permissions.list_draft_object_permission_impl',
         'files': dict(
-            put_file_factory=deny_all,
+            put_file_factory='invenio_records_rest.utils:deny_all',
             get_file_factory='nr_common.permissions.get_draft_file_permission_impl',
-            delete_file_factory=deny_all
+            delete_file_factory='invenio_records_rest.utils:deny_all'
         )
     }
 }
@@ -161,25 +327,26 @@ RECORDS_REST_ENDPOINTS = {
         pid_fetcher='nr_all',
         default_endpoint_prefix=True,
         record_class=ALL_NRESULTS_RECORD_CLASS,
-        search_class=NResultsRecordsSearch,
+        search_class='nr_nresults.search:NResultsRecordsSearch',
         search_index=all_nresults_index_name,
+        search_factory_imp='nr_nresults.search:nresults_search_factory',
         search_serializers={
-            'application/json': 'oarepo_validate:json_search',
+            'application/json': 'nr_nresults.serializers:json_search',
         },
         list_route='/nresults/all/',
-        links_factory_imp=partial(community_record_links_factory, original_links_factory=nr_links_factory),
+        links_factory_imp='nr_nresults.links:nresults_links_factory',
         default_media_type='application/json',
         max_result_window=10000,
         # not used really
         item_route=f'/nresults/'
                    f'/not-used-but-must-be-present',
         list_permission_factory_imp='nr_common.permissions.list_all_object_permission_impl',
-        create_permission_factory_imp=deny_all,
-        delete_permission_factory_imp=deny_all,
-        update_permission_factory_imp=deny_all,
-        read_permission_factory_imp=deny_all,
+        create_permission_factory_imp='invenio_records_rest.utils:deny_all',
+        delete_permission_factory_imp='invenio_records_rest.utils:deny_all',
+        update_permission_factory_imp='invenio_records_rest.utils:deny_all',
+        read_permission_factory_imp='invenio_records_rest.utils:deny_all',
         record_serializers={
-            'application/json': 'oarepo_validate:json_response',
+            'application/json': 'nr_nresults.serializers:json_response',
         },
         use_options_view=False
     ),
@@ -189,44 +356,87 @@ RECORDS_REST_ENDPOINTS = {
         pid_fetcher='nr_all',
         default_endpoint_prefix=True,
         record_class=ALL_NRESULTS_RECORD_CLASS,
-        search_class=NResultsRecordsSearch,
+        search_class='nr_nresults.search:NResultsRecordsSearch',
         search_index=all_nresults_index_name,
-        search_factory_imp=community_search_factory,
+        search_factory_imp='nr_nresults.search:nresults_community_search_factory',
         search_serializers={
-            'application/json': 'oarepo_validate:json_search',
+            'application/json': 'nr_nresults.serializers:json_search',
         },
         list_route='/<community_id>/nresults/all/',
-        links_factory_imp=partial(community_record_links_factory, original_links_factory=nr_links_factory),
+        links_factory_imp='nr_nresults.links:nresults_links_factory',
         default_media_type='application/json',
         max_result_window=10000,
         # not used really
         item_route=f'/nresult/'
                    f'/not-used-but-must-be-present',
         list_permission_factory_imp='nr_common.permissions.list_all_object_permission_impl',
-        create_permission_factory_imp=deny_all,
-        delete_permission_factory_imp=deny_all,
-        update_permission_factory_imp=deny_all,
-        read_permission_factory_imp=deny_all,
+        create_permission_factory_imp='invenio_records_rest.utils:deny_all',
+        delete_permission_factory_imp='invenio_records_rest.utils:deny_all',
+        update_permission_factory_imp='invenio_records_rest.utils:deny_all',
+        read_permission_factory_imp='invenio_records_rest.utils:deny_all',
         record_serializers={
-            'application/json': 'oarepo_validate:json_response',
+            'application/json': 'nr_nresults.serializers:json_response',
         },
         use_options_view=False
     )
 }
 
 FILTERS = {
+    # year range, e.g. 2015--2020
+    'N_dateCertified': year_range_filter('N_dateCertified'),
 }
 
 POST_FILTERS = {
+    # self links of the terms, counts of the other terms of the field stay visible
+    field: taxonomy_term_filter(field) for field in TAXONOMY_FACET_FIELDS
 }
 
 RECORDS_REST_FACETS = {
+    index_name: {
+        'aggs': {
+            **{field: taxonomy_term_facet(field) for field in TAXONOMY_FACET_FIELDS},
+            'N_dateCertified': year_histogram_facet('N_dateCertified'),
+        },
+        'filters': FILTERS,
+        'post_filters': POST_FILTERS,
+    } for index_name in (published_index_name, draft_index_name, all_nresults_index_name)
 }
 
 RECORDS_REST_SORT_OPTIONS = {
+    index_name: {
+        'bestmatch': {
+            'title': 'Best match',
+            'fields': ['-_score'],
+            'default_order': 'desc',
+            'order': 1,
+        },
+        'dateIssued': {
+            'title': 'Date issued',
+            'fields': ['dateIssued.date', 'control_number.long'],
+            'default_order': 'desc',
+            'order': 2,
+        },
+        'N_dateCertified': {
+            'title': 'Date certified',
+            'fields': ['N_dateCertified'],
+            'default_order': 'desc',
+            'order': 3,
+        },
+        'control_number': {
+            # control_number is a keyword, its numeric subfield sorts "9" before "10"
+            'title': 'Control number',
+            'fields': ['control_number.long'],
+            'default_order': 'asc',
+            'order': 4,
+        },
+    } for index_name in (published_index_name, draft_index_name, all_nresults_index_name)
 }
 
 RECORDS_REST_DEFAULT_SORT = {
+    index_name: {
+        'query': 'bestmatch',
+        'noquery': '-dateIssued',
+    } for index_name in (published_index_name, draft_index_name, all_nresults_index_name)
 }
 
 """Set default sorting options."""
@@ -0,0 +1,125 @@
+"""Streaming export of N-result search results.
+
+Hits are read page by page with ``search_after`` (inside a point in time if
+``NRESULTS_EXPORT_USE_PIT`` is set, requires Elasticsearch 7.10+) instead of
+deep from/size paging, so only one page is kept in memory at a time. Every
+exported hit carries a resumption token; passing it back as the ``after``
+argument continues the export right after that hit.
+"""
+import base64
+import csv
+import io
+import json
+
+from elasticsearch_dsl import Q
+from flask import current_app
+
+EXPORT_SORT = ('control_number', '_index')
+"""Sort of the exported hits, must be unique per document for search_after to work."""
+
+
+def encode_resumption_token(sort_values):
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode('utf-8')).decode('ascii')
+
+
+def decode_resumption_token(token):
+    """Return sort values encoded in the resumption token, raises ValueError for invalid tokens."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except Exception as e:
+        raise ValueError(f'Invalid resumption token {token}') from e
+    if not isinstance(values, list) or len(values) != len(EXPORT_SORT):
+        raise ValueError(f'Invalid resumption token {token}')
+    return values
+
+
+def iter_export_hits(search, query=None, after=None, page_size=None, use_pit=None):
+    """Yield tuples (hit, resumption token) of all documents matching the search.
+
+    :param search: search instance, including the permission filters
+    :param query: optional query string
+    :param after: resumption token, the export continues after the hit it was issued for
+    :param page_size: number of hits fetched in one request
+    :param use_pit: run the export inside a point in time
+    """
+    config = current_app.config
+    page_size = page_size or config['NRESULTS_EXPORT_PAGE_SIZE']
+    if use_pit is None:
+        use_pit = config['NRESULTS_EXPORT_USE_PIT']
+
+    search = search.without_response_cache().source(True).sort(*EXPORT_SORT) \
+        .extra(size=page_size, track_total_hits=False)
+    search._highlight = {}
+    if query:
+        search = search.query(Q('query_string', query=query))
+    search_after = decode_resumption_token(after) if after else None
+
+    pit_id = None
+    client = search._using
+    index = search._index
+    if use_pit:
+        pit_id = client.open_point_in_time(
+            index=','.join(index), keep_alive=config['NRESULTS_EXPORT_PIT_KEEP_ALIVE'])['id']
+        search = search.index()
+    try:
+        while True:
+            page = search
+            if pit_id:
+                page = page.extra(pit={'id': pit_id,
+                                       'keep_alive': config['NRESULTS_EXPORT_PIT_KEEP_ALIVE']})
+            if search_after:
+                page = page.extra(search_after=search_after)
+            response = page.execute()
+            hits = response.hits
+            for hit in hits:
+                search_after = list(hit.meta.sort)
+                yield hit, encode_resumption_token(search_after)
+            if len(hits) < page_size:
+                break
+            if pit_id:
+                pit_id = getattr(response, 'pit_id', pit_id)
+    finally:
+        if pit_id:
+            client.close_point_in_time(body={'id': pit_id})
+
+
+def ndjson_lines(hits):
+    """Format exported hits as JSON lines."""
+    for hit, token in hits:
+        yield json.dumps({
+            'id': hit.meta.id,
+            'metadata': hit.to_dict(),
+            'resumption_token': token
+        }, ensure_ascii=False) + '\n'
+
+
+def csv_lines(hits, fields=None):
+    """Format exported hits as CSV, one column per (dotted) field plus the resumption token.
+
+    Non-scalar values are serialized as JSON.
+    """
+    fields = fields or current_app.config['NRESULTS_EXPORT_CSV_FIELDS']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow([*fields, 'resumption_token'])
+    yield flush()
+    for hit, token in hits:
+        data = hit.to_dict()
+        row = []
+        for field in fields:
+            value = data
+            for part in field.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            row.append('' if value is None else value)
+        row.append(token)
+        writer.writerow(row)
+        yield flush()
@@ -1,10 +1,223 @@
 import logging
+from functools import cached_property, partial
+
+from flask_taxonomies.signals import after_taxonomy_deleted, after_taxonomy_term_deleted, \
+    after_taxonomy_term_moved, after_taxonomy_term_updated, after_taxonomy_updated, \
+    before_taxonomy_term_updated
+from invenio_base.signals import app_loaded
 
 from . import config
+from .after_commit import defer, register_session_events
+from .cache import SharedVersions, TTLCache
+from .fingerprint import FingerprintStats
+from .index_queue import queue_depth, queue_lag
+from .mapping_artifact import use_artifact
+from .metrics import MetricsRegistry
+from .querylog import QueryLog
+from .constants import NRESULTS_ALLOWED_SCHEMAS, published_index_name, \
+    prefixed_published_index_name, draft_index_name, prefixed_draft_index_name
 
 log = logging.getLogger('nr-events')
 
 
+class NRNresultsState:
+    """State of the nr-nresults extension.
+
+    Parts depending on the record, marshmallow and PID modules are created on
+    first use, so that loading the extension does not import them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.search_cache = TTLCache(
+            max_size=app.config['NRESULTS_SEARCH_CACHE_SIZE'],
+            ttl=app.config['NRESULTS_SEARCH_CACHE_TTL'])
+        self.aggregation_cache = TTLCache(
+            max_size=app.config['NRESULTS_AGGREGATION_CACHE_SIZE'],
+            ttl=app.config['NRESULTS_AGGREGATION_CACHE_TTL'])
+        self.cache_versions = SharedVersions('nr-nresults:search-version')
+        self.id_block_allocator = None
+        block_size = app.config['NRESULTS_ID_BLOCK_SIZE']
+        if block_size:
+            from .providers import IdBlockAllocator
+            self.id_block_allocator = IdBlockAllocator(block_size)
+        self.mapping_artifact = None
+        self.taxonomy_refresh_replaced = False
+        self.url_templates = {}
+        self.schema_validators = {}
+        self.fingerprint_stats = FingerprintStats()
+        self.metrics = MetricsRegistry() if app.config['NRESULTS_METRICS'] else None
+        if self.metrics is not None:
+            self.metrics.register_gauge('nr_nresults_index_queue_depth',
+                                        'Operations waiting in the index queue.', queue_depth)
+            self.metrics.register_gauge('nr_nresults_index_queue_failed_depth',
+                                        'Operations given up by the index queue.',
+                                        partial(queue_depth, failed=True))
+            self.metrics.register_gauge('nr_nresults_index_queue_lag_seconds',
+                                        'Seconds the oldest operation waits in the index queue.',
+                                        queue_lag)
+        self.query_log = QueryLog(
+            threshold=app.config['NRESULTS_SLOW_QUERY_THRESHOLD'],
+            max_fingerprints=app.config['NRESULTS_QUERY_LOG_MAX_FINGERPRINTS']
+        ) if app.config['NRESULTS_QUERY_LOG'] else None
+
+    @cached_property
+    def taxonomy_cache(self):
+        from .marshmallow.taxonomy import TaxonomyTermCache
+
+        return TaxonomyTermCache(
+            max_size=self.app.config['NRESULTS_TAXONOMY_CACHE_SIZE'],
+            ttl=self.app.config['NRESULTS_TAXONOMY_CACHE_TTL'])
+
+    def schema_validator(self, url):
+        """Return the compiled validator of the schema or None to validate the usual way."""
+        if not self.app.config['NRESULTS_COMPILED_SCHEMA_VALIDATION']:
+            return None
+        try:
+            return self.schema_validators[url]
+        except KeyError:
+            pass
+        from .validation import CompiledSchemaValidator
+
+        validator = None
+        try:
+            validator = CompiledSchemaValidator(
+                url, self.app.extensions['invenio-jsonschemas'],
+                types=self.app.config.get('RECORDS_VALIDATION_TYPES'))
+        except Exception:
+            log.exception('Could not compile schema %s, records are validated the usual way', url)
+        self.schema_validators[url] = validator
+        return validator
+
+    def warm_schema_validators(self, *args, **kwargs):
+        """Compile validators of the N-results schemas, otherwise each is compiled on first use."""
+        jsonschemas = self.app.extensions['invenio-jsonschemas']
+        for path in NRESULTS_ALLOWED_SCHEMAS:
+            url = jsonschemas.path_to_url(path)
+            if url:
+                self.schema_validator(url)
+
+    def use_mapping_artifact(self, *args, **kwargs):
+        """Register the resolved mapping artifact as the published index mapping if it is valid."""
+        self.mapping_artifact = use_artifact(self.app)
+
+    def taxonomy_changed(self, sender, taxonomy=None, term=None, **kwargs):
+        """Signal handler dropping cached terms of a changed taxonomy."""
+        if taxonomy is None:
+            # after_taxonomy_deleted sends the taxonomy, after_taxonomy_term_moved the term
+            taxonomy = getattr(term or sender, 'taxonomy', sender)
+        code = getattr(taxonomy, 'code', None)
+        log.debug('Taxonomy %s changed, invalidating cached terms', code)
+        if 'taxonomy_cache' in self.__dict__:
+            # nothing cached until the cache was created
+            self.taxonomy_cache.invalidate(code)
+
+    def term_updated(self, sender, taxonomy=None, term=None, **kwargs):
+        """Signal handler scheduling refresh of records embedding the updated term once the update commits."""
+        if not self.app.config['NRESULTS_REFRESH_ON_TERM_CHANGE'] or term is None:
+            return
+        from invenio_db import db
+
+        from .tasks import refresh_term_references, schedule_term_refresh
+        if not self.taxonomy_refresh_replaced and refresh_term_references.app.conf.task_always_eager:
+            # the oarepo-taxonomies handler refreshes the records right away
+            return
+        term_url = term.links().envelope['self']
+        defer(db.session, 'term-refresh', term_url, term_url, schedule_term_refresh)
+
+    def replace_taxonomy_refresh(self, *args, **kwargs):
+        """Disconnect the refresh of all referencing records by oarepo-taxonomies, term_updated replaces it.
+
+        Kept in eager Celery mode, where term_updated does not refresh the records.
+        """
+        from oarepo_taxonomies.signals import lock_term, taxonomy_term_update
+
+        from .tasks import refresh_term_references
+        if refresh_term_references.app.conf.task_always_eager:
+            log.warning('Keeping the oarepo-taxonomies refresh of records referencing updated terms '
+                        'in eager Celery mode')
+            return
+        after_taxonomy_term_updated.disconnect(taxonomy_term_update)
+        # the term is unlocked by the disconnected refresh only
+        before_taxonomy_term_updated.disconnect(lock_term)
+        self.taxonomy_refresh_replaced = True
+
+    def records_unpublished(self, sender, **kwargs):
+        """Signal handler deleting documents of unpublished records with their routing after commit.
+
+        oarepo-records-draft deletes them without routing, which the mapping rejects.
+        """
+        from invenio_db import db
+
+        from .indexer import NResultsBulkIndexer
+        indexer = NResultsBulkIndexer()
+        for pair in sender:
+            record = pair.published_context.record
+            if getattr(record, 'index_name', None) == published_index_name:
+                defer(db.session, 'unpublished', str(record.id), indexer.delete_action(record),
+                      partial(indexer.send_actions, refresh=True))
+
+    def route_record(self, sender, record=None, index=None, arguments=None, **kwargs):
+        """Signal handler adding the routing of the record to its index arguments.
+
+        The mapping requires routing, this routes the documents written by other
+        indexers too (``invenio index run``, reindexing of referencing records).
+        """
+        if arguments is not None and index in (published_index_name, prefixed_published_index_name,
+                                               draft_index_name, prefixed_draft_index_name):
+            from .routing import record_routing
+            arguments.setdefault('routing', record_routing(record))
+
+    def record_indexed(self, sender, index=None, **kwargs):
+        """Signal handler invalidating cached search responses and aggregations when a record is reindexed.
+
+        Sent before the document is written, covers indexers other than
+        NResultsBulkIndexer, which calls :meth:`index_written` once Elasticsearch
+        confirmed the write.
+        """
+        self.index_written(index)
+
+    @staticmethod
+    def index_type(index):
+        """Return 'published' or 'draft' for the (prefixed) N-results index name, None for other indices."""
+        if index in (published_index_name, prefixed_published_index_name):
+            return 'published'
+        if index in (draft_index_name, prefixed_draft_index_name):
+            return 'draft'
+        return None
+
+    def index_written(self, index):
+        """Invalidate cached search responses and aggregations of the index after a write."""
+        index_type = self.index_type(index)
+        if index_type:
+            self.index_changed(index_type)
+
+    def record_deleted(self, sender, record=None, **kwargs):
+        """Signal handler invalidating cached search responses and aggregations when a record is deleted."""
+        index_name = getattr(record, 'index_name', None)
+        if index_name == published_index_name:
+            self.index_changed('published')
+        elif index_name == draft_index_name:
+            self.index_changed('draft')
+
+    def index_changed(self, index_type):
+        """Bump the shared version of the 'published' or 'draft' index, the caches of all processes miss."""
+        self.cache_versions.bump(index_type)
+        if index_type == 'published':
+            self.search_cache.clear()
+        # aggregations are keyed by the types of the searched indices (NResultsRecordsSearch)
+        self.aggregation_cache.invalidate_matching(lambda key: index_type in key[0])
+
+    def index_settled(self, *index_types):
+        """True if none of the indices changed within NRESULTS_SEARCH_CACHE_SETTLE, searches may be cached."""
+        settle = self.app.config['NRESULTS_SEARCH_CACHE_SETTLE']
+        for index_type in index_types:
+            age = self.cache_versions.age(index_type)
+            if age is not None and age < settle:
+                return False
+        return True
+
+
 class NRNresults(object):
     """CIS theses repository extension."""
 
@@ -16,12 +229,48 @@ class NRNresults(object):
     def init_app(self, app):
         """Flask application initialization."""
         self.init_config(app)
+        state = NRNresultsState(app)
+        app.extensions['nr-nresults'] = state
+
+        for signal in (after_taxonomy_updated, after_taxonomy_deleted, after_taxonomy_term_updated,
+                       after_taxonomy_term_deleted, after_taxonomy_term_moved):
+            signal.connect(state.taxonomy_changed, weak=False)
+        after_taxonomy_term_updated.connect(state.term_updated, weak=False)
+        if app.config['NRESULTS_REFRESH_ON_TERM_CHANGE'] and app.config['NRESULTS_REPLACE_TAXONOMY_REFRESH']:
+            if 'flask-taxonomies' in app.extensions:
+                state.replace_taxonomy_refresh()
+            else:
+                app_loaded.connect(state.replace_taxonomy_refresh, sender=app, weak=False)
+        # imported here, importing the package does not import the record modules
+        from invenio_indexer.signals import before_record_index
+        from invenio_records.signals import after_record_delete
+        from oarepo_records_draft.signals import after_unpublish
+        before_record_index.connect(state.route_record, weak=False)
+        before_record_index.connect(state.record_indexed, weak=False)
+        after_record_delete.connect(state.record_deleted, weak=False)
+        after_unpublish.connect(state.records_unpublished, weak=False)
+        register_session_events()
+
+        if 'invenio-search' in app.extensions:
+            state.use_mapping_artifact()
+        else:
+            app_loaded.connect(state.use_mapping_artifact, sender=app, weak=False)
+
+        if app.config['NRESULTS_COMPILED_SCHEMA_VALIDATION'] and app.config['NRESULTS_WARM_SCHEMA_VALIDATORS']:
+            if 'invenio-jsonschemas' in app.extensions:
+                state.warm_schema_validators()
+            else:
+                app_loaded.connect(state.warm_schema_validators, sender=app, weak=False)
 
     def init_config(self, app):
         """Initialize configuration.
 
         Override configuration variables with the values in this package.
         """
+        for k in dir(config):
+            if k.startswith('NRESULTS_'):
+                app.config.setdefault(k, getattr(config, k))
+
         app.config.setdefault('RECORDS_DRAFT_ENDPOINTS', {}).update(config.RECORDS_DRAFT_ENDPOINTS)
         app.config.setdefault('RECORDS_REST_ENDPOINTS', {}).update(config.RECORDS_REST_ENDPOINTS)
         app.config.setdefault('RECORDS_REST_FACETS', {}).update(config.RECORDS_REST_FACETS)
@@ -31,3 +280,7 @@ class NRNresults(object):
 
         app.config.setdefault('RECORDS_REST_DEFAULT_SORT', {}).update(
             config.RECORDS_REST_DEFAULT_SORT)
+
+        beat_schedule = app.config.setdefault('CELERY_BEAT_SCHEDULE', {})
+        for name, entry in config.CELERY_BEAT_SCHEDULE.items():
+            beat_schedule.setdefault(name, entry)
@@ -0,0 +1,45 @@
+"""Facets and filters of the N-results list endpoints (used in RECORDS_REST_FACETS).
+
+Taxonomy fields are nested ``taxonomy-term`` objects (see
+``mapping_includes/v7/nr-taxonomies-Nresults-v1.0.0.json``), they are
+aggregated (``oarepo_taxonomies.facets.taxonomy_term_facet``) and filtered by
+the ``links.self`` keyword of the terms.
+
+The module is imported with the configuration, query builders are imported
+when a filter is applied.
+"""
+
+TAXONOMY_FACET_FIELDS = ('N_type', 'N_resultUsage', 'N_certifyingAuthority')
+
+
+def taxonomy_term_filter(field):
+    """Filter of records linking any of the terms, values are the self links of the terms."""
+
+    def inner(values):
+        from elasticsearch_dsl import Q
+
+        return Q('nested', path=field, query=Q('terms', **{f'{field}.links.self': values}))
+
+    return inner
+
+
+def year_histogram_facet(field):
+    return {
+        'date_histogram': {
+            'field': field,
+            'calendar_interval': 'year',
+            'format': 'yyyy',
+            'min_doc_count': 1
+        }
+    }
+
+
+def year_range_filter(field):
+    """Filter of a date field by a range of years, e.g. ``2015--2020``."""
+
+    def inner(values):
+        from invenio_records_rest.facets import range_filter
+
+        return range_filter(field, format='yyyy', end_date_math='/y')(values)
+
+    return inner
@@ -31,6 +31,7 @@ from invenio_pidstore.fetchers import FetchedPID
 from oarepo_communities.converters import CommunityPIDValue
 from oarepo_communities.proxies import current_oarepo_communities
 
+from .metrics import stage_timer
 from .providers import NRNresultsIdProvider
 
 
@@ -42,10 +43,11 @@ def nr_nresults_id_fetcher(record_uuid, data):
     :returns: A :data:`invenio_pidstore.fetchers.FetchedPID` instance.
     """
     id_field = "control_number"
-    return FetchedPID(  # FetchedPID je obyčejný namedtuple
-        provider=NRNresultsIdProvider,
-        pid_type=NRNresultsIdProvider.pid_type,
-        pid_value=CommunityPIDValue(
-            str(data[id_field]),
-            current_oarepo_communities.get_primary_community_field(data))
-    )
+    with stage_timer('fetch'):
+        return FetchedPID(  # FetchedPID je obyčejný namedtuple
+            provider=NRNresultsIdProvider,
+            pid_type=NRNresultsIdProvider.pid_type,
+            pid_value=CommunityPIDValue(
+                str(data[id_field]),
+                current_oarepo_communities.get_primary_community_field(data))
+        )
@@ -0,0 +1,99 @@
+"""Content fingerprints of N-result records.
+
+A record loaded from the database keeps hashes of its stored content, one per
+concern:
+
+* ``metadata`` - the validated metadata, input of the marshmallow validation
+  (taxonomy dereferencing) and of the reference extraction,
+* ``administration`` - community and workflow fields, checked by the JSON schema only,
+* ``index`` - the whole document, input of the indexed projection. It is not
+  taken at load (the index may be missing or stale), only after Elasticsearch
+  confirmed the document was indexed.
+
+A validation stage whose input hash did not change since the record was loaded
+(or last validated) is skipped. Bulk indexing skips records already indexed by
+the same instance with the same content, an explicit
+:meth:`~nr_nresults.indexer.NResultsBulkIndexer.index` is never skipped. :class:`FingerprintStats` counts the
+performed and skipped stages.
+"""
+import hashlib
+import json
+import threading
+from collections import Counter
+
+ADMINISTRATIVE_FIELDS = ('_administration', '_communities')
+"""Top level fields not validated by the marshmallow schema."""
+
+BOOKKEEPING_FIELDS = ('oarepo:validity', 'oarepo:draft')
+"""Top level fields written by the validation and indexing themselves."""
+
+FINGERPRINT_CONCERNS = {
+    # concern: (hashed top level fields or None for all, fields left out)
+    'metadata': (None, ADMINISTRATIVE_FIELDS + BOOKKEEPING_FIELDS),
+    'administration': (ADMINISTRATIVE_FIELDS, ()),
+    'index': (None, ()),
+}
+
+
+def content_fingerprint(data, include=None, exclude=()):
+    """Return a hash of the JSON data, independent of the order of the keys.
+
+    :param include: top level keys to hash, all if None
+    :param exclude: top level keys not hashed
+    """
+    selected = {
+        k: v for k, v in data.items()
+        if k not in exclude and (include is None or k in include)
+    }
+    serialized = json.dumps(selected, sort_keys=True, ensure_ascii=False,
+                            separators=(',', ':'), default=str)
+    return hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def content_fingerprints(data, concerns=tuple(FINGERPRINT_CONCERNS)):
+    """Return {concern: fingerprint} of the record data."""
+    return {
+        concern: content_fingerprint(data, *FINGERPRINT_CONCERNS[concern])
+        for concern in concerns
+    }
+
+
+def stored_references(record_uuid):
+    """Return references of the record registered in the oarepo-references table."""
+    from oarepo_references.models import RecordReference, ReferencingRecord
+
+    rows = RecordReference.query \
+        .join(ReferencingRecord, RecordReference.record_id == ReferencingRecord.id) \
+        .filter(ReferencingRecord.record_uuid == record_uuid) \
+        .with_entities(RecordReference.reference, RecordReference.reference_uuid,
+                       RecordReference.inline)
+    return [
+        {'reference': reference, 'reference_uuid': reference_uuid, 'inline': inline}
+        for reference, reference_uuid, inline in rows
+    ]
+
+
+class FingerprintStats:
+    """Thread safe counters of performed and skipped stages per concern."""
+
+    def __init__(self):
+        self.performed = Counter()
+        self.skipped = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, concern, skipped):
+        with self._lock:
+            (self.skipped if skipped else self.performed)[concern] += 1
+
+    def clear(self):
+        with self._lock:
+            self.performed.clear()
+            self.skipped.clear()
+
+    def as_dict(self):
+        """Return {concern: {'performed': n, 'skipped': n}}."""
+        with self._lock:
+            return {
+                concern: {'performed': self.performed[concern], 'skipped': self.skipped[concern]}
+                for concern in FINGERPRINT_CONCERNS
+            }
@@ -0,0 +1,227 @@
+"""Synthetic N-result records for load and scale testing.
+
+The generated records are valid against ``nr-nresults-v1.0.0.json`` and
+:class:`nr_nresults.marshmallow.NResultsMetadataSchemaV1` provided the taxonomy
+terms they link to exist (see :func:`create_taxonomy_terms`). The output is
+deterministic for a given seed, so the same dataset can be regenerated for
+every benchmark run instead of being stored.
+"""
+import datetime
+import json
+import random
+
+from flask_taxonomies.proxies import current_flask_taxonomies
+from flask_taxonomies.term_identification import TermIdentification
+
+DEFAULT_TAXONOMY_URL = 'http://127.0.0.1:5000/2.0/taxonomies'
+
+N_TYPES = {
+    # code: (weight, title, resource type)
+    'a': (40, {'cs': 'certifikovaná metodika (NmetC)', 'en': 'certified methodology'},
+          'certified-methodologies'),
+    'b': (5, {'cs': 'léčebný postup (Nlec)', 'en': 'treatment procedure'},
+          'certified-methodologies'),
+    'c': (8, {'cs': 'památkový postup (Npam)', 'en': 'preservation procedure'},
+          'preservation-procedures'),
+    'd': (15, {'cs': 'specializovaná mapa s odborným obsahem (Nmap)', 'en': 'specialized map'},
+          'specialized-maps'),
+    'e': (25, {'cs': 'schválená metodika (NmetS)', 'en': 'approved methodology'},
+          'certified-methodologies'),
+    'f': (7, {'cs': 'akreditovaná metodika (NmetA)', 'en': 'accredited methodology'},
+          'certified-methodologies'),
+}
+"""N_type codes A-F with their relative frequency."""
+
+TAXONOMY_TERMS = {
+    'Ntype': {code: {'title': title} for code, (_, title, _) in N_TYPES.items()},
+    'NresultUsage': {
+        'a': {'title': {'cs': 'Výsledek využívá pouze poskytovatel'}},
+        'b': {'title': {'cs': 'Výsledek je využíván orgány státní nebo veřejné správy'}},
+        'c': {'title': {'cs': 'Výsledek je užíván bez omezení okruhu uživatelů'}},
+    },
+    'resourceType': {
+        'certified-methodologies': {'title': {'cs': 'Certifikované metodiky',
+                                              'en': 'Certified methodologies'}},
+        'preservation-procedures': {'title': {'cs': 'Památkové postupy',
+                                              'en': 'Preservation procedures'}},
+        'specialized-maps': {'title': {'cs': 'Specializované mapy', 'en': 'Specialized maps'}},
+    },
+    'accessRights': {
+        'c-abf2': {'title': {'cs': 'otevřený přístup', 'en': 'open access'}},
+        'c-16ec': {'title': {'cs': 'omezený přístup', 'en': 'restricted access'}},
+    },
+    'languages': {
+        'cze': {'title': {'cs': 'čeština', 'en': 'Czech'}},
+        'eng': {'title': {'cs': 'angličtina', 'en': 'English'}},
+        'slo': {'title': {'cs': 'slovenština', 'en': 'Slovak'}},
+    },
+    'institutions': {
+        '00216208': {'title': {'cs': 'Univerzita Karlova', 'en': 'Charles University'}},
+        '68407700': {'title': {'cs': 'České vysoké učení technické v Praze',
+                               'en': 'Czech Technical University in Prague'}},
+        '00216305': {'title': {'cs': 'Vysoké učení technické v Brně',
+                               'en': 'Brno University of Technology'}},
+        '62156489': {'title': {'cs': 'Mendelova univerzita v Brně', 'en': 'Mendel University in Brno'}},
+        '44994575': {'title': {'cs': 'Centrum dopravního výzkumu', 'en': 'Transport Research Centre'}},
+        '00027049': {'title': {'cs': 'Výzkumný ústav rostlinné výroby',
+                               'en': 'Crop Research Institute'}},
+        'mdcr': {'title': {'cs': 'Ministerstvo dopravy', 'en': 'Ministry of transport'}},
+        'mze': {'title': {'cs': 'Ministerstvo zemědělství', 'en': 'Ministry of agriculture'}},
+        'mzp': {'title': {'cs': 'Ministerstvo životního prostředí', 'en': 'Ministry of the environment'}},
+        'mk': {'title': {'cs': 'Ministerstvo kultury', 'en': 'Ministry of culture'}},
+        'mzd': {'title': {'cs': 'Ministerstvo zdravotnictví', 'en': 'Ministry of health'}},
+    },
+}
+"""Taxonomy terms the generated records link to, {taxonomy code: {slug: extra data}}."""
+
+PROVIDERS = ['00216208', '68407700', '00216305', '62156489', '44994575', '00027049']
+CERTIFYING_AUTHORITIES = {
+    # N_type: authorities certifying it
+    'a': ['mdcr', 'mze', 'mzp'],
+    'b': ['mzd'],
+    'c': ['mk'],
+    'e': ['mdcr', 'mze', 'mzp', 'mk'],
+    'f': ['mze', 'mzp'],
+}
+
+SUBJECTS = [
+    ('diagnostika vozovek', 'pavement diagnostics'),
+    ('georadar', 'ground penetrating radar'),
+    ('ochrana rostlin', 'plant protection'),
+    ('kvalita vody', 'water quality'),
+    ('památková péče', 'heritage preservation'),
+    ('geologické mapování', 'geological mapping'),
+    ('půdní eroze', 'soil erosion'),
+    ('bezpečnost silničního provozu', 'road safety'),
+    ('lesní hospodářství', 'forestry'),
+    ('odpadové hospodářství', 'waste management'),
+    ('veřejné zdraví', 'public health'),
+    ('stavební materiály', 'building materials'),
+]
+ACTIVITIES = [
+    ('hodnocení', 'assessment of'),
+    ('monitoring', 'monitoring of'),
+    ('stanovení', 'determination of'),
+    ('ochrana', 'protection of'),
+    ('obnova', 'restoration of'),
+    ('mapování', 'mapping of'),
+]
+WORDS = (
+    'metodika postup zařízení měření hodnocení výsledky data analýza vzorek parametr '
+    'kvalita vrstva konstrukce model výpočet povrch prostředí ochrana údržba oprava '
+    'rekonstrukce sledování kontrola zásady návrh použití kombinace přínos podklad '
+    'zpracování odběr stanovení limit norma terén laboratoř dokumentace plán riziko'
+).split()
+GIVEN_NAMES = ['Jan', 'Petr', 'Jana', 'Eva', 'Martin', 'Lucie', 'Tomáš', 'Hana', 'Pavel', 'Marie']
+SURNAMES = ['Novák', 'Svoboda', 'Dvořák', 'Černá', 'Procházka', 'Kučerová', 'Veselý',
+            'Horák', 'Němcová', 'Marek']
+
+
+def taxonomy_link(taxonomy_url, taxonomy, slug):
+    return {
+        'is_ancestor': False,
+        'links': {
+            'self': f'{taxonomy_url}/{taxonomy}/{slug}'
+        }
+    }
+
+
+def _text(rnd, max_length):
+    """Random sentences of the technical vocabulary, up to max_length characters."""
+    length = rnd.randint(max_length // 4, max_length)
+    sentences = []
+    size = 0
+    while True:
+        words = rnd.choices(WORDS, k=rnd.randint(6, 20))
+        sentence = ' '.join(words).capitalize() + '.'
+        if size + len(sentence) + 1 > length:
+            break
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    return ' '.join(sentences) or rnd.choice(WORDS)
+
+
+def generate_record(rnd, control_number, taxonomy_url=DEFAULT_TAXONOMY_URL, community='nr'):
+    """Return one synthetic N-result record drawn from the random generator ``rnd``."""
+    n_type = rnd.choices(list(N_TYPES), weights=[v[0] for v in N_TYPES.values()])[0]
+    resource_type = N_TYPES[n_type][2]
+    subjects = rnd.sample(SUBJECTS, rnd.randint(3, 6))
+    activity = rnd.choice(ACTIVITIES)
+    date_issued = datetime.date(2005, 1, 1) + datetime.timedelta(days=rnd.randint(0, 16 * 365))
+
+    title = {'cs': f'{N_TYPES[n_type][1]["cs"].split(" (")[0].capitalize()}: '
+                   f'{activity[0]} - {subjects[0][0]}'}
+    if rnd.random() < 0.7:
+        title['en'] = f'{N_TYPES[n_type][1]["en"].capitalize()}: {activity[1]} {subjects[0][1]}'
+
+    data = {
+        '_primary_community': community,
+        'control_number': str(control_number),
+        'title': [title],
+        'creator': [{'name': f'{rnd.choice(SURNAMES)}, {rnd.choice(GIVEN_NAMES)}'}
+                    for _ in range(rnd.randint(1, 5))],
+        'dateIssued': date_issued.isoformat(),
+        'keywords': [{'cs': cs, 'en': en} for cs, en in subjects],
+        'accessRights': [taxonomy_link(taxonomy_url, 'accessRights',
+                                       'c-abf2' if rnd.random() < 0.85 else 'c-16ec')],
+        'language': [taxonomy_link(taxonomy_url, 'languages',
+                                   rnd.choices(['cze', 'eng', 'slo'], weights=[80, 17, 3])[0])],
+        'provider': [taxonomy_link(taxonomy_url, 'institutions', rnd.choice(PROVIDERS))],
+        'resourceType': [taxonomy_link(taxonomy_url, 'resourceType', resource_type)],
+        'N_type': [taxonomy_link(taxonomy_url, 'Ntype', n_type)],
+        'N_resultUsage': [taxonomy_link(taxonomy_url, 'NresultUsage',
+                                        rnd.choices('abc', weights=[15, 45, 40])[0])],
+        'N_internalID': f'N-{date_issued.year}-{control_number}',
+        'N_technicalParameters': _text(rnd, 3000),
+        'N_economicalParameters': _text(rnd, 1024),
+    }
+    reference_number = f'{rnd.randint(1, 9999)}/{date_issued.year}-{rnd.randint(100, 999)}'
+    if n_type == 'd':
+        # maps have no certification, an ISBN may follow the reference number
+        if rnd.random() < 0.3:
+            reference_number += f' (ISBN 978-80-{rnd.randint(7000, 7999)}-{rnd.randint(100, 999)}-0)'
+    else:
+        certified = date_issued - datetime.timedelta(days=rnd.randint(0, 180))
+        data['N_certifyingAuthority'] = [
+            taxonomy_link(taxonomy_url, 'institutions', rnd.choice(CERTIFYING_AUTHORITIES[n_type]))]
+        data['N_dateCertified'] = certified.isoformat()
+    data['N_referenceNumber'] = reference_number
+    return data
+
+
+def generate_records(count, seed=0, start=1, taxonomy_url=DEFAULT_TAXONOMY_URL, community='nr'):
+    """Yield ``count`` synthetic records with control numbers from ``start``.
+
+    The records depend only on the seed, generating them lazily keeps the
+    memory use constant for any count.
+    """
+    rnd = random.Random(seed)
+    for control_number in range(start, start + count):
+        yield generate_record(rnd, control_number, taxonomy_url=taxonomy_url, community=community)
+
+
+def write_ndjson(stream, records):
+    """Write records to a text stream as JSON lines, returns the number of records written."""
+    written = 0
+    for record in records:
+        stream.write(json.dumps(record, ensure_ascii=False))
+        stream.write('\n')
+        written += 1
+    return written
+
+
+def create_taxonomy_terms(terms=None):
+    """Create taxonomies and terms the generated records link to, existing ones are kept.
+
+    The caller commits the session.
+    """
+    terms = TAXONOMY_TERMS if terms is None else terms
+    for code, taxonomy_terms in terms.items():
+        taxonomy = current_flask_taxonomies.get_taxonomy(code, fail=False)
+        if taxonomy is None:
+            taxonomy = current_flask_taxonomies.create_taxonomy(code, extra_data={
+                'title': {'cs': code, 'en': code}})
+        for slug, extra_data in taxonomy_terms.items():
+            ti = TermIdentification(taxonomy=taxonomy, slug=slug)
+            if current_flask_taxonomies.filter_term(ti).one_or_none() is None:
+                current_flask_taxonomies.create_term(ti, extra_data=extra_data)
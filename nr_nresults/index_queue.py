@@ -0,0 +1,256 @@
+"""Durable, coalescing queue of N-result records waiting to be indexed.
+
+:class:`nr_nresults.indexer.NResultsQueuedIndexer` does not index saved
+records itself. Its operations are published to the ``NRESULTS_INDEX_QUEUE``
+queue of the Celery broker only when the outermost transaction commits, a
+rollback discards them (:mod:`nr_nresults.after_commit`). Records are thus
+never read before they are committed.
+
+The :func:`nr_nresults.tasks.process_index_queue` task (run by Celery beat,
+see ``CELERY_BEAT_SCHEDULE`` in the config) consumes the queue in batches of
+``NRESULTS_INDEX_QUEUE_BATCH_SIZE`` messages, collapses the messages of one
+record into one operation, loads the committed state of the records and sends
+them in one bulk request. Messages are acknowledged after Elasticsearch
+confirmed the batch.
+
+An operation is sent ``NRESULTS_INDEX_QUEUE_WINDOW`` seconds after the record
+was first queued, saves in the meantime are collapsed into it. Operations not
+due yet are published again for a later run. Failed records are retried after
+``NRESULTS_INDEX_QUEUE_BACKOFF`` seconds, doubled with every attempt; after
+``NRESULTS_INDEX_QUEUE_MAX_RETRIES`` attempts they are moved to the
+``<queue>-failed`` queue and logged, from where ``invenio nresults
+requeue-failed`` returns them.
+
+:func:`queue_depth` and :func:`queue_lag` are exposed as metrics gauges.
+"""
+import logging
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+from invenio_base.utils import obj_or_import_string
+from sqlalchemy.orm.exc import NoResultFound
+
+from nr_nresults.after_commit import defer
+
+log = logging.getLogger('nr-nresults-index-queue')
+
+QueueRunResult = namedtuple('QueueRunResult', ['sent', 'coalesced', 'waiting', 'retried', 'failed'])
+"""Summary of one run of the queue task."""
+
+
+def record_class_name(record):
+    return f'{type(record).__module__}:{type(record).__qualname__}'
+
+
+def _merge_operations(previous, operation):
+    # the latest operation wins, the routing indexed before the first one and the first enqueue time are kept
+    return {**operation, 'stale_routing': previous['stale_routing'] or operation['stale_routing'],
+            'enqueued': previous['enqueued']}
+
+
+def queue_operation(session, record, op='index', delete_action=None, stale_routing=None):
+    """Queue the operation on the record when the session commits (see :mod:`nr_nresults.after_commit`)."""
+    operation = {
+        'id': str(record.id),
+        'op': op,
+        'record_class': record_class_name(record),
+        'delete_action': delete_action,
+        'stale_routing': stale_routing,
+        'attempts': 0,
+        'enqueued': time.time(),
+    }
+    defer(session, 'index-queue', operation['id'], operation, publish, merge=_merge_operations)
+
+
+def mq_queue(failed=False):
+    """Return the (durable) kombu queue of the index operations or of the failed ones."""
+    from kombu import Exchange, Queue
+
+    name = current_app.config['NRESULTS_INDEX_QUEUE']
+    exchange = Exchange(name, type='direct', durable=True)
+    if failed:
+        name = f'{name}-failed'
+    return Queue(name, exchange=exchange, routing_key=name, durable=True)
+
+
+def publish(payloads, failed=False):
+    """Publish the operations as persistent messages."""
+    from celery import current_app as current_celery_app
+    from kombu import Producer
+
+    queue = mq_queue(failed)
+    with current_celery_app.pool.acquire(block=True) as conn:
+        producer = Producer(conn, exchange=queue.exchange, routing_key=queue.routing_key)
+        for payload in payloads:
+            producer.publish(payload, declare=[queue], delivery_mode='persistent')
+
+
+def consume(batch_size, failed=False):
+    """Yield lists of at most ``batch_size`` unacknowledged messages until the queue is empty."""
+    from celery import current_app as current_celery_app
+
+    with current_celery_app.pool.acquire(block=True) as conn:
+        queue = mq_queue(failed)(conn.default_channel)
+        queue.declare()
+        while True:
+            messages = []
+            while len(messages) < batch_size:
+                message = queue.get(no_ack=False)
+                if message is None:
+                    break
+                messages.append(message)
+            if not messages:
+                return
+            yield messages
+
+
+def queue_depth(failed=False):
+    """Return the number of messages in the index queue (or the failed one), 0 if it does not exist."""
+    from celery import current_app as current_celery_app
+
+    with current_celery_app.pool.acquire(block=True) as conn:
+        with conn.channel() as channel:
+            try:
+                _, count, _ = mq_queue(failed)(channel).queue_declare(passive=True)
+            except conn.channel_errors:
+                return 0
+    return count
+
+
+def queue_lag():
+    """Return the seconds the message at the head of the index queue waits, 0 if it is empty."""
+    from celery import current_app as current_celery_app
+
+    with current_celery_app.pool.acquire(block=True) as conn:
+        with conn.channel() as channel:
+            try:
+                message = mq_queue()(channel).get(no_ack=False)
+            except conn.channel_errors:
+                return 0.0
+            if message is None:
+                return 0.0
+            try:
+                enqueued = message.decode().get('enqueued')
+            finally:
+                message.requeue()
+    return max(0.0, time.time() - enqueued) if enqueued else 0.0
+
+
+def coalesce(payloads):
+    """Return {record id: operation} collapsing the operations of each record, the latest wins."""
+    operations = OrderedDict()
+    for payload in payloads:
+        previous = operations.pop(payload['id'], None)
+        if previous is not None:
+            payload = {**payload,
+                       'stale_routing': previous.get('stale_routing') or payload.get('stale_routing'),
+                       'attempts': max(previous.get('attempts', 0), payload.get('attempts', 0)),
+                       'enqueued': min(previous.get('enqueued') or 0, payload.get('enqueued') or 0),
+                       'not_before': max(previous.get('not_before') or 0, payload.get('not_before') or 0)}
+        operations[payload['id']] = payload
+    return operations
+
+
+def is_due(operation, now, window):
+    """True if the window of the operation passed and it does not wait for a retry."""
+    return (operation.get('enqueued') or 0) + window <= now \
+        and (operation.get('not_before') or 0) <= now
+
+
+def operation_actions(indexer, operation):
+    """Return the bulk actions of the operation, [] if the record does not exist any more."""
+    if operation['op'] == 'delete':
+        return [operation['delete_action']]
+    try:
+        record = obj_or_import_string(operation['record_class']).get_record(operation['id'])
+    except NoResultFound:
+        # operations are queued after commit, the record was deleted since and its deletion queued
+        return []
+    action = indexer.index_action(record)
+    stale_routing = operation.get('stale_routing')
+    if stale_routing and stale_routing != action.get('routing'):
+        return [{'_op_type': 'delete', '_index': action['_index'], '_id': action['_id'],
+                 '_routing': stale_routing}, action]
+    return [action]
+
+
+def send_operations(indexer, operations):
+    """Send the operations in one bulk request, return the failed ones.
+
+    :raises Exception: if Elasticsearch could not be reached, nothing was confirmed
+    """
+    actions = []
+    failed = []
+    for operation in operations.values():
+        try:
+            actions.extend(operation_actions(indexer, operation))
+        except Exception:
+            log.exception('Could not prepare %s of record %s', operation['op'], operation['id'])
+            failed.append(operation)
+    success, errors = indexer.send_actions(actions)
+    failed_ids = {str(next(iter(e.values()), {}).get('_id')) for e in errors}
+    failed.extend(operation for record_id, operation in operations.items() if record_id in failed_ids)
+    return failed
+
+
+def process_index_queue(batch_size=None, max_retries=None):
+    """Index the queued records, see the module documentation.
+
+    :returns: :class:`QueueRunResult`
+    """
+    from nr_nresults.indexer import NResultsBulkIndexer
+
+    config = current_app.config
+    batch_size = batch_size or config['NRESULTS_INDEX_QUEUE_BATCH_SIZE']
+    max_retries = config['NRESULTS_INDEX_QUEUE_MAX_RETRIES'] if max_retries is None else max_retries
+    window = config['NRESULTS_INDEX_QUEUE_WINDOW']
+    backoff = config['NRESULTS_INDEX_QUEUE_BACKOFF']
+    indexer = NResultsBulkIndexer()
+    now = time.time()
+    sent = coalesced = 0
+    waiting, retry, given_up, unacked = [], [], [], []
+    try:
+        for messages in consume(batch_size):
+            operations = coalesce(message.decode() for message in messages)
+            coalesced += len(messages) - len(operations)
+            not_due = [operations.pop(k) for k, operation in list(operations.items())
+                       if not is_due(operation, now, window)]
+            try:
+                failed = send_operations(indexer, operations)
+            except Exception:
+                # nothing confirmed, the batch stays in the queue
+                for message in messages:
+                    message.requeue()
+                raise
+            sent += len(operations) - len(failed)
+            waiting.extend(not_due)
+            for operation in failed:
+                operation['attempts'] = operation.get('attempts', 0) + 1
+                operation['not_before'] = now + backoff * 2 ** (operation['attempts'] - 1)
+                (retry if operation['attempts'] <= max_retries else given_up).append(operation)
+            # acknowledged at the end of the run, so that republished records are not consumed again
+            unacked.extend(messages)
+    finally:
+        # waiting and failed records are published before their messages are acknowledged
+        if waiting or retry:
+            publish(waiting + retry)
+        for operation in given_up:
+            log.error('Giving up %s of record %s after %s attempts, moved to the failed queue',
+                      operation['op'], operation['id'], operation['attempts'])
+        if given_up:
+            publish(given_up, failed=True)
+        for message in unacked:
+            message.ack()
+    return QueueRunResult(sent, coalesced, len(waiting), len(retry), len(given_up))
+
+
+def requeue_failed(batch_size=500):
+    """Move the operations of the failed queue back to the index queue, return their number."""
+    moved = 0
+    for messages in consume(batch_size, failed=True):
+        publish([{**message.decode(), 'attempts': 0, 'not_before': None} for message in messages])
+        for message in messages:
+            message.ack()
+        moved += len(messages)
+    return moved
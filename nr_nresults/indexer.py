@@ -0,0 +1,197 @@
+import logging
+
+from elasticsearch.helpers import bulk
+from flask import current_app
+from invenio_db import db
+from invenio_indexer.api import RecordIndexer
+
+from nr_nresults.index_queue import queue_operation
+from nr_nresults.metrics import stage_timer
+from nr_nresults.routing import community_routing, record_routing, routing_enabled
+
+log = logging.getLogger('nr-nresults-indexer')
+
+
+class NResultsBulkIndexer(RecordIndexer):
+    """Indexer sending already loaded records to Elasticsearch in a single bulk request.
+
+    Unlike :meth:`RecordIndexer.bulk_index` it does not go through the message
+    queue and does not fetch the records from the database again.
+
+    :meth:`bulk_index_records` does not send records already indexed by this
+    instance whose content did not change since (see :mod:`nr_nresults.fingerprint`).
+
+    Every write is routed (see :mod:`nr_nresults.routing`), other indexers get
+    the routing from the ``before_record_index`` receiver of the extension. With
+    ``NRESULTS_COMMUNITY_ROUTING`` the documents are routed by community and the
+    document of a record whose routing changed is deleted from its old shard.
+    """
+
+    @staticmethod
+    def needs_indexing(record):
+        """False if the record instance was indexed and its document did not change since."""
+        if not current_app.config['NRESULTS_CONTENT_FINGERPRINTS'] \
+                or not hasattr(record, 'fingerprint_changed'):
+            return True
+        changed = record.fingerprint_changed('index')
+        current_app.extensions['nr-nresults'].fingerprint_stats.record('index', skipped=not changed)
+        return changed
+
+    @staticmethod
+    def mark_indexed(record):
+        if hasattr(record, 'update_fingerprint'):
+            record.update_fingerprint('index')
+        if hasattr(record, 'indexed_routing') and routing_enabled():
+            record.indexed_routing = community_routing(record)
+
+    @staticmethod
+    def routing_arguments(record, arguments=None):
+        """Return the index arguments with the routing of the record added."""
+        return {'routing': record_routing(record), **(arguments or {})}
+
+    @staticmethod
+    def stored_routing(record):
+        """Return the routing the document of the record was indexed with."""
+        return getattr(record, 'indexed_routing', None) or record_routing(record)
+
+    @staticmethod
+    def moved_routing(record, arguments):
+        """Return the routing the record was indexed with if the new routing differs, else None."""
+        old = getattr(record, 'indexed_routing', None)
+        return old if old and arguments.get('routing') not in (None, old) else None
+
+    def index(self, record, arguments=None, **kwargs):
+        """Index the record, deleting its document from the shard of its previous routing."""
+        arguments = self.routing_arguments(record, arguments)
+        moved = self.moved_routing(record, arguments)
+        if moved:
+            index, doc_type = self._prepare_index(*self.record_to_index(record))
+            self.client.delete(index=index, id=str(record.id), routing=moved, ignore=[404])
+        with stage_timer('index', record):
+            result = super().index(record, arguments=arguments, **kwargs)
+        self.mark_indexed(record)
+        self.index_written(self.record_to_index(record)[0])
+        return result
+
+    def delete(self, record, **kwargs):
+        kwargs.setdefault('routing', self.stored_routing(record))
+        result = super().delete(record, **kwargs)
+        self.index_written(self.record_to_index(record)[0])
+        return result
+
+    @staticmethod
+    def index_written(index):
+        """Invalidate the cached searches of the index, called when Elasticsearch confirmed a write."""
+        state = current_app.extensions.get('nr-nresults')
+        if state is not None:
+            state.index_written(index)
+
+    def index_action(self, record, arguments=None):
+        """Return Elasticsearch bulk 'index' action for the record."""
+        index, doc_type = self.record_to_index(record)
+        arguments = self.routing_arguments(record, arguments)
+        body = self._prepare_record(record, index, doc_type, arguments)
+        index, doc_type = self._prepare_index(index, doc_type)
+
+        action = {
+            '_op_type': 'index',
+            '_index': index,
+            '_id': str(record.id),
+            '_version': record.revision_id,
+            '_version_type': self._version_type,
+            '_source': body
+        }
+        action.update(arguments)
+        return action
+
+    def delete_action(self, record):
+        """Return Elasticsearch bulk 'delete' action for the record."""
+        index, doc_type = self.record_to_index(record)
+        index, doc_type = self._prepare_index(index, doc_type)
+        action = {
+            '_op_type': 'delete',
+            '_index': index,
+            '_id': str(record.id),
+            '_routing': self.stored_routing(record),
+        }
+        return action
+
+    def _delete_action(self, payload):
+        """Bulk 'delete' action of a record queued by :meth:`bulk_delete`, routed like its document."""
+        record = self.record_cls.get_record(payload['id'], with_deleted=True)
+        action = self.delete_action(record)
+        if payload.get('index'):
+            action['_index'], doc_type = self._prepare_index(payload['index'], payload.get('doc_type'))
+        return action
+
+    def bulk_index_records(self, records, **es_bulk_kwargs):
+        """Index records with one bulk request.
+
+        :param records: committed record instances, those indexed unchanged before are skipped
+        :param es_bulk_kwargs: passed to :func:`elasticsearch.helpers.bulk`
+        :returns: tuple (number of indexed records, list of errors)
+        """
+        records = [record for record in records if self.needs_indexing(record)]
+        actions = []
+        for record in records:
+            action = self.index_action(record)
+            moved = self.moved_routing(record, action)
+            if moved:
+                actions.append({'_op_type': 'delete', '_index': action['_index'],
+                                '_id': action['_id'], '_routing': moved})
+            actions.append(action)
+        success, errors = self.send_actions(actions, **es_bulk_kwargs)
+        failed = {next(iter(e.values()), {}).get('_id') for e in errors}
+        for record in records:
+            if str(record.id) not in failed:
+                self.mark_indexed(record)
+        return success, errors
+
+    def send_actions(self, actions, **es_bulk_kwargs):
+        """Send the actions as one bulk request.
+
+        Version conflicts (a newer revision is already indexed) and deletions of
+        missing documents are not reported as errors.
+        """
+        if not actions:
+            return 0, []
+        es_bulk_kwargs.setdefault('chunk_size', len(actions))
+        es_bulk_kwargs.setdefault('max_chunk_bytes', 1024 * 1024 * 1024)
+        es_bulk_kwargs.setdefault('request_timeout',
+                                  current_app.config['INDEXER_BULK_REQUEST_TIMEOUT'])
+        with stage_timer('index'):
+            success, errors = bulk(self.client, actions, raise_on_error=False, **es_bulk_kwargs)
+        for index in {action.get('_index') for action in actions}:
+            self.index_written(index)
+        errors = [
+            e for e in errors
+            if next(iter(e.values()), {}).get('status') != 409
+            and not ('delete' in e and e['delete'].get('status') == 404)
+        ]
+        for error in errors:
+            log.error('Bulk indexing error: %s', error)
+        return success, errors
+
+
+class NResultsQueuedIndexer(NResultsBulkIndexer):
+    """Indexer queueing the records to be indexed after the transaction commits.
+
+    The operations are published to the durable index queue when the outermost
+    transaction commits and indexed by the ``process_index_queue`` task in bulk
+    requests, repeated saves of a record are indexed once (see
+    :mod:`nr_nresults.index_queue`). With index arguments the record is indexed
+    right away.
+    """
+
+    def index(self, record, arguments=None, **kwargs):
+        if arguments or kwargs:
+            return super().index(record, arguments=arguments, **kwargs)
+        queue_operation(db.session, record,
+                        stale_routing=self.moved_routing(record, self.routing_arguments(record)))
+        return None
+
+    def delete(self, record, **kwargs):
+        if kwargs:
+            return super().delete(record, **kwargs)
+        queue_operation(db.session, record, op='delete', delete_action=self.delete_action(record))
+        return None
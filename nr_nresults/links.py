@@ -0,0 +1,13 @@
+"""Links factory of the N-results endpoints.
+
+Referenced by its import string from the endpoint configuration, the
+oarepo-communities and nr-common links modules are imported on first use.
+"""
+
+
+def nresults_links_factory(*args, **kwargs):
+    """Links of the record (nr-common links) in its primary community."""
+    from nr_common.links import nr_links_factory
+    from oarepo_communities.links import community_record_links_factory
+
+    return community_record_links_factory(*args, original_links_factory=nr_links_factory, **kwargs)
@@ -0,0 +1,174 @@
+"""Build-time resolved mapping of the N-results index.
+
+``mappings/v7/nr_nresults/nr-nresults-v1.0.0.json`` extends the nr-common
+mapping (``oarepo:extends``) and uses the taxonomy types of
+``mapping_includes``, oarepo-mapping-includes expands them on every app load.
+``invenio nresults build-mapping`` writes the expanded mapping to
+``NRESULTS_MAPPING_ARTIFACT``, with its hash and the hash of the source files
+and of the versions of the packages providing mapping includes in ``mappings._meta``. When the artifact exists and was built from the current
+sources, the extension registers it as the mapping of the published index
+(the draft mapping is derived from it by oarepo-records-draft); otherwise the
+source mapping is expanded at runtime as before. The artifact itself is not
+hashed at app load, ``check-mapping`` detects its modifications.
+
+Indices created from the artifact keep the hash in their ``_meta``,
+``invenio nresults check-mapping`` compares it with the artifact and with a
+fresh expansion of the sources.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import namedtuple
+from importlib import metadata
+
+from nr_nresults.constants import published_index_name
+
+log = logging.getLogger('nr-nresults-mappings')
+
+MAPPINGS_DIR = os.path.join(os.path.dirname(__file__), 'mappings', 'v7')
+INCLUDES_DIR = os.path.join(os.path.dirname(__file__), 'mapping_includes', 'v7')
+SOURCE_MAPPING = os.path.join(MAPPINGS_DIR, 'nr_nresults', 'nr-nresults-v1.0.0.json')
+
+META_KEY = 'nr-nresults'
+"""Key of the artifact hashes in ``mappings._meta``."""
+
+MAPPING_ENTRY_POINT_GROUPS = ('oarepo_mapping_includes', 'oarepo_mapping_handlers')
+"""Entry point groups of the packages whose versions are part of the source hash."""
+
+ArtifactStatus = namedtuple('ArtifactStatus', ['path', 'valid', 'reason', 'mapping_hash',
+                                               'source_hash'])
+"""Result of the artifact verification, ``reason`` tells why an artifact is not valid."""
+
+
+def artifact_path(app):
+    """Return the absolute path of the artifact, None if disabled."""
+    path = app.config['NRESULTS_MAPPING_ARTIFACT']
+    if not path:
+        return None
+    return path if os.path.isabs(path) else os.path.join(app.instance_path, path)
+
+
+def mapping_package_versions():
+    """Return sorted [(package, version)] of the installed packages providing mapping includes or handlers.
+
+    The expanded mapping changes with them, e.g. with an upgrade of nr-common
+    (the ``oarepo:extends`` target) or oarepo-multilingual.
+    """
+    versions = {}
+    for dist in metadata.distributions():
+        if any(ep.group in MAPPING_ENTRY_POINT_GROUPS for ep in dist.entry_points):
+            versions[dist.metadata['Name'].lower()] = dist.version
+    try:
+        versions['oarepo-mapping-includes'] = metadata.version('oarepo-mapping-includes')
+    except metadata.PackageNotFoundError:
+        pass
+    return sorted(versions.items())
+
+
+def source_hash():
+    """Hash of the source mapping, of the mapping includes of this package and of the mapping package versions.
+
+    Includes of other packages are not read at app load, their installed
+    versions are hashed instead; ``check-mapping`` compares the expanded mappings.
+    """
+    includes = sorted(f for f in os.listdir(INCLUDES_DIR) if f.endswith('.json'))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(mapping_package_versions()).encode('utf-8'))
+    for path in [SOURCE_MAPPING] + [os.path.join(INCLUDES_DIR, f) for f in includes]:
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def mapping_hash(mapping):
+    """Hash of the mapping (aliases, mappings and settings) without the artifact hashes."""
+    mappings = dict(mapping.get('mappings', {}))
+    meta = {k: v for k, v in mappings.pop('_meta', {}).items() if k != META_KEY}
+    if meta:
+        mappings['_meta'] = meta
+    canonical = json.dumps({**mapping, 'mappings': mappings}, sort_keys=True,
+                           separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def resolve_mapping(app, source=SOURCE_MAPPING):
+    """Return the source mapping expanded by oarepo-mapping-includes."""
+    from oarepo_mapping_includes.mapping_transformer import process
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(process(app.extensions['oarepo-mapping-includes'], tmpdir, source)) as f:
+            return json.load(f)
+
+
+def build_artifact(app, path=None):
+    """Expand the source mapping and write it with its hashes to the artifact path.
+
+    :returns: :class:`ArtifactStatus` of the written artifact
+    """
+    path = path or artifact_path(app)
+    mapping = resolve_mapping(app)
+    hashes = {'mapping_hash': mapping_hash(mapping), 'source_hash': source_hash()}
+    mapping['mappings'].setdefault('_meta', {})[META_KEY] = hashes
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written next to the artifact and renamed, starting workers never read a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(mapping, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+    return ArtifactStatus(path, True, None, hashes['mapping_hash'], hashes['source_hash'])
+
+
+def artifact_status(path, verify_content=True):
+    """Verify the artifact: readable, not modified since built and built from the current sources.
+
+    :param verify_content: hash the artifact to detect changes since it was built,
+        app load skips it and compares the (small) source files only
+    """
+    try:
+        with open(path) as f:
+            mapping = json.load(f)
+    except (OSError, ValueError) as e:
+        return ArtifactStatus(path, False, f'unreadable: {e}', None, None)
+    hashes = mapping.get('mappings', {}).get('_meta', {}).get(META_KEY, {})
+    stored_hash, stored_source_hash = hashes.get('mapping_hash'), hashes.get('source_hash')
+    if not stored_hash:
+        return ArtifactStatus(path, False, 'no mapping hash', None, stored_source_hash)
+    if verify_content and mapping_hash(mapping) != stored_hash:
+        return ArtifactStatus(path, False, 'modified after it was built', stored_hash,
+                              stored_source_hash)
+    if stored_source_hash != source_hash():
+        return ArtifactStatus(path, False, 'source mapping changed, rebuild it', stored_hash,
+                              stored_source_hash)
+    return ArtifactStatus(path, True, None, stored_hash, stored_source_hash)
+
+
+def use_artifact(app):
+    """Register the valid artifact as the mapping of the published index.
+
+    :returns: :class:`ArtifactStatus` or None if there is no artifact
+    """
+    path = artifact_path(app)
+    if not path or not os.path.exists(path):
+        return None
+    status = artifact_status(path, verify_content=False)
+    if not status.valid:
+        log.warning('Mapping artifact %s not used (%s), the mapping is expanded at runtime',
+                    path, status.reason)
+        return status
+    mappings = app.extensions['invenio-search'].mappings
+    if published_index_name in mappings:
+        mappings[published_index_name] = path
+    return status
+
+
+def index_mapping_hashes(index):
+    """Return {index: mapping hash in its _meta or None} of the indices behind the alias."""
+    from invenio_search import current_search_client
+
+    return {
+        name: value.get('mappings', {}).get('_meta', {}).get(META_KEY, {}).get('mapping_hash')
+        for name, value in current_search_client.indices.get_mapping(index=index).items()
+    }
@@ -9,6 +9,7 @@
 
 from __future__ import absolute_import, print_function
 
+from .batch import LoadResult, load_many
 from .json import NResultsMetadataSchemaV1
 
-__all__ = ('NResultsMetadataSchemaV1',)
+__all__ = ('NResultsMetadataSchemaV1', 'load_many', 'LoadResult')
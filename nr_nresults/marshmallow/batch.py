@@ -0,0 +1,87 @@
+"""Validation and dereferencing of many records in one call."""
+from collections import namedtuple
+
+from marshmallow import ValidationError
+from oarepo_taxonomies.marshmallow import TaxonomyNested, get_slug_from_link
+from sqlalchemy.orm.exc import NoResultFound
+
+from nr_nresults.marshmallow.json import NResultsMetadataSchemaV1
+from nr_nresults.marshmallow.taxonomy import get_taxonomy_cache
+
+LoadResult = namedtuple('LoadResult', ['data', 'errors'])
+"""Result of loading one record: loaded data or marshmallow error messages."""
+
+
+def collect_taxonomy_references(records, schema_class=NResultsMetadataSchemaV1):
+    """Return the set of ``(taxonomy_code, slug)`` referenced by taxonomy fields of the records."""
+    fields = [
+        field.data_key or name
+        for name, field in schema_class._declared_fields.items()
+        if isinstance(field, TaxonomyNested)
+    ]
+    references = set()
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        for field in fields:
+            terms = record.get(field)
+            if terms is None:
+                continue
+            if not isinstance(terms, (list, tuple)):
+                terms = [terms]
+            for term in terms:
+                if isinstance(term, dict):
+                    if term.get('is_ancestor', False):
+                        continue
+                    term = term.get('links', {}).get('self')
+                if not isinstance(term, str):
+                    continue
+                try:
+                    slug, taxonomy_code = get_slug_from_link(term)
+                except ValueError:
+                    continue
+                references.add((taxonomy_code, slug))
+    return references
+
+
+def prefetch_taxonomy_terms(records, schema_class=NResultsMetadataSchemaV1):
+    """Resolve every taxonomy term referenced in records once, storing it in the term cache.
+
+    Unknown terms are skipped here, they are reported by the validation of the
+    records that reference them.
+    """
+    cache = get_taxonomy_cache()
+    if cache is None:
+        return
+    for taxonomy_code, slug in sorted(collect_taxonomy_references(records, schema_class)):
+        try:
+            cache.get(taxonomy_code, slug)
+        except NoResultFound:
+            pass
+
+
+def load_many(records, schema_class=NResultsMetadataSchemaV1, context=None, **kwargs):
+    """Validate and dereference many records.
+
+    Taxonomy terms referenced across the whole batch are resolved up front, so
+    loading the individual records hits the taxonomy term cache only. The term
+    cache (``NRESULTS_TAXONOMY_CACHE_SIZE``) should be larger than the number of
+    distinct terms in the batch.
+
+    :param records: iterable of record metadata
+    :param schema_class: marshmallow schema used to load each record
+    :param context: schema context, copied for each record
+    :param kwargs: passed to ``Schema.load``
+    :returns: list of :data:`LoadResult`, in the order of ``records``
+    """
+    records = list(records)
+    prefetch_taxonomy_terms(records, schema_class)
+
+    results = []
+    for record in records:
+        schema = schema_class(context=dict(context or {}))
+        try:
+            results.append(LoadResult(schema.load(record, **kwargs), None))
+        except ValidationError as e:
+            results.append(LoadResult(None, e.messages))
+    return results
@@ -0,0 +1,95 @@
+"""Patch-aware validation of N-result records.
+
+A JSON patch usually touches one or two fields of a record that has been
+validated (and its taxonomy terms dereferenced) before. :func:`incremental_schema`
+derives a schema in which only the touched fields (and the fields sharing a
+cross-field rule with them) are validated by their original fields, the other
+fields pass their stored, already validated values through. Schema level hooks
+(required fields, keywords/subjects, strict keys, ...) still run over the whole
+record.
+"""
+from functools import lru_cache
+
+from marshmallow.fields import List, Nested, Raw
+from oarepo_taxonomies.marshmallow import TaxonomyNested
+
+PATCH_DEPENDENT_FIELDS = {
+    'keywords': {'subject'},
+    'subject': {'keywords'},
+    'provider': {'entities'},
+    'entities': {'provider'},
+}
+"""Fields validated together with a patched field because of a cross-field rule."""
+
+
+def patched_fields(patch):
+    """Return top level fields touched by a JSON patch, None if it replaces the whole document."""
+    touched = set()
+    for operation in patch:
+        for key in ('path', 'from'):
+            path = operation.get(key)
+            if path is None:
+                continue
+            if path in ('', '/'):
+                return None
+            touched.add(path.split('/')[1].replace('~1', '/').replace('~0', '~'))
+    return touched
+
+
+class PrevalidatedField(Raw):
+    """Takes the stored value of a field not touched by the patch as it is."""
+
+
+class PrevalidatedTaxonomyField(PrevalidatedField):
+    """Stored value of a taxonomy field, its (already dereferenced) terms are registered as references."""
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        for term in value if isinstance(value, (list, tuple)) else [value]:
+            if not isinstance(term, dict) or term.get('is_ancestor'):
+                continue
+            link = term.get('links', {}).get('self')
+            if link:
+                self.context.setdefault('references', []).append({
+                    'reference': link,
+                    'reference_uuid': None,
+                    'inline': True
+                })
+        return value
+
+
+def _contains_references(field):
+    """True if the field has nested taxonomy fields, those must always be validated."""
+    if isinstance(field, TaxonomyNested):
+        return True
+    if isinstance(field, List):
+        return _contains_references(field.inner)
+    if isinstance(field, Nested):
+        schema = field.schema
+        return any(_contains_references(f) for f in schema.fields.values())
+    return False
+
+
+def _prevalidated(field):
+    field_class = PrevalidatedTaxonomyField if isinstance(field, TaxonomyNested) else PrevalidatedField
+    return field_class(required=field.required, allow_none=field.allow_none,
+                       data_key=field.data_key, attribute=field.attribute)
+
+
+@lru_cache(maxsize=256)
+def incremental_schema(schema_class, validated_fields):
+    """Return subclass of the schema validating only ``validated_fields`` (a frozenset).
+
+    Fields sharing a rule with the validated ones (:data:`PATCH_DEPENDENT_FIELDS`)
+    are validated as well.
+    """
+    validated = set(validated_fields)
+    for field_name in validated_fields:
+        validated |= PATCH_DEPENDENT_FIELDS.get(field_name, set())
+
+    overrides = {}
+    for field_name, field in schema_class._declared_fields.items():
+        if field_name in validated:
+            continue
+        if isinstance(field, TaxonomyNested) or not _contains_references(field):
+            overrides[field_name] = _prevalidated(field)
+    return type(f'Incremental{schema_class.__name__}', (schema_class,), overrides)
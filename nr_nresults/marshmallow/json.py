@@ -14,8 +14,10 @@ from marshmallow.validate import Length
 from oarepo_taxonomies.marshmallow import TaxonomyField
 
 from nr_nresults.marshmallow.subschemas import NcertifyingAuthorityMixin
+from nr_nresults.marshmallow.taxonomy import cache_taxonomy_fields
 
 
+@cache_taxonomy_fields
 class NResultsMetadataSchemaV1(CommonMetadataSchemaV2):
     N_certifyingAuthority = TaxonomyField(mixins=[TitledMixin, NcertifyingAuthorityMixin])
     N_dateCertified = DateString()
@@ -0,0 +1,147 @@
+"""Cached dereferencing of taxonomy terms.
+
+Every :func:`oarepo_taxonomies.marshmallow.TaxonomyField` resolves its links
+with a separate taxonomy query. N-result records reference a handful of terms
+over and over (NmetC, Nlec, usage codes A/B/C, ...), so the schemas in this
+package resolve them through a bounded, time limited :class:`TaxonomyTermCache`
+shared by all taxonomy fields of the schema.
+"""
+from flask import current_app
+from marshmallow import ValidationError, pre_load
+from oarepo_taxonomies.marshmallow import TaxonomyTermMerger, TaxonomySchema, TaxonomyNested, \
+    get_slug_from_link
+from oarepo_taxonomies.utils import get_taxonomy_json
+from sqlalchemy.orm.exc import NoResultFound
+
+from nr_nresults.cache import TTLCache
+from nr_nresults.metrics import stage_timer
+
+
+class TaxonomyTermCache(TTLCache):
+    """LRU cache of resolved taxonomy terms with a per-entry time to live.
+
+    Keys are ``(taxonomy_code, slug)`` tuples, values are the term arrays
+    (the term with its ancestors) as returned by ``get_taxonomy_json``.
+    """
+
+    def get(self, taxonomy_code, slug):
+        """Return the term array for the term, querying the taxonomy on a miss.
+
+        :raises NoResultFound: if the term does not exist. Missing terms are not cached.
+        """
+        key = (taxonomy_code, slug)
+        term_array = self.lookup(key)
+        if term_array is None:
+            term_array = self.fetch(taxonomy_code, slug)
+            self.store(key, term_array)
+        return term_array
+
+    def fetch(self, taxonomy_code, slug):
+        return get_taxonomy_json(code=taxonomy_code, slug=slug).paginated_data
+
+    def invalidate(self, taxonomy_code=None):
+        """Drop cached terms of the given taxonomy, or all terms if no taxonomy is given.
+
+        Changing a term changes the ancestor arrays of its descendants as well,
+        so the whole taxonomy is dropped, not only the changed term.
+        """
+        if taxonomy_code is None:
+            self.clear()
+        else:
+            self.invalidate_matching(lambda key: key[0] == taxonomy_code)
+
+
+def get_taxonomy_cache():
+    """Return the taxonomy term cache of the current app or None if caching is not set up."""
+    state = current_app.extensions.get('nr-nresults')
+    return state.taxonomy_cache if state is not None else None
+
+
+class CachedTaxonomyTermMerger(TaxonomyTermMerger):
+    """Term merger that takes the referenced terms from :class:`TaxonomyTermCache`."""
+
+    def add_reference(self, ref):
+        cache = get_taxonomy_cache()
+        if cache is None:
+            with stage_timer('taxonomy'):
+                return super().add_reference(ref)
+        slug, taxonomy_code = get_slug_from_link(ref)
+        try:
+            with stage_timer('taxonomy'):
+                term_array = cache.get(taxonomy_code, slug)
+        except NoResultFound:
+            raise ValidationError(f"Taxonomy term '{taxonomy_code}/{slug}' has not been found")
+        for term in term_array:
+            link = self.term_link(term)
+            self._add_term_internal(link, term)
+            self.validated_terms.add(link)
+
+
+class CachedTaxonomySchemaMixin:
+    """Mixin for :class:`TaxonomySchema` resolving links through the term cache.
+
+    Mirrors ``TaxonomySchema.resolve_links`` which has the merger class hardcoded.
+    """
+    term_merger_class = CachedTaxonomyTermMerger
+
+    @pre_load(pass_many=True)
+    def resolve_links(self, in_data, **kwargs):
+        if in_data is None:
+            return None
+
+        if not isinstance(in_data, (list, tuple)):
+            in_data = [in_data]
+
+        changes = self.context.get('changed_reference', None)
+        if changes:
+            for d in in_data:
+                if d['links']['self'] == changes['url']:
+                    break
+            else:
+                return in_data
+
+        changes = self.context.get('renamed_reference', None)
+        if changes:
+            in_data = [
+                changes['new_url']
+                if isinstance(x, dict) and x.get('links', {}).get('self') == changes['old_url']
+                else x
+                for x in in_data
+            ]
+
+        term_merger = self.term_merger_class()
+        for term in in_data:
+            if isinstance(term, str):
+                term_merger.add_reference(term)
+            else:
+                term_merger.add_term(term)
+
+        in_data = term_merger.get_merged_terms()
+
+        for term in in_data:
+            if not term.get('is_ancestor'):
+                self.register(term['links']['self'], inline=True)
+
+        return in_data
+
+
+def cache_taxonomy_fields(schema_class):
+    """Class decorator switching all taxonomy fields of the schema to the term cache.
+
+    Handles fields inherited from base schemas (``CommonMetadataSchemaV2`` etc.)
+    that were declared with the plain ``TaxonomyField``.
+    """
+    declared_fields = schema_class._declared_fields
+    for field_name, field in list(declared_fields.items()):
+        if not isinstance(field, TaxonomyNested):
+            continue
+        nested = field.nested
+        if isinstance(nested, CachedTaxonomySchemaMixin) or not isinstance(nested, TaxonomySchema):
+            continue
+        nested_class = type(nested)
+        cached_class = type('Cached' + nested_class.__name__,
+                            (CachedTaxonomySchemaMixin, nested_class), {})
+        declared_fields[field_name] = TaxonomyNested(
+            cached_class(many=nested.internal_many),
+            required=field.required, many=True)
+    return schema_class
@@ -0,0 +1,186 @@
+"""Durations of the stages of the N-result record lifecycle.
+
+With ``NRESULTS_METRICS`` enabled the instrumented stages (see
+:data:`STAGES`) are timed into the :class:`MetricsRegistry` of the extension
+state and announced with the :data:`nr_nresults.signals.stage_timed` signal.
+The registry is rendered in the Prometheus text format by the metrics view.
+When disabled, :func:`stage_timer` returns a shared no-op timer.
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+
+from flask import current_app
+
+from nr_nresults.signals import stage_timed
+
+log = logging.getLogger('nr-nresults-metrics')
+
+STAGES = {
+    'create': 'Record.create including validation',
+    'commit': 'Record.commit including validation',
+    'validate': 'validation performed on create and commit (not skipped by fingerprints)',
+    'marshmallow': 'marshmallow load: taxonomy dereferencing and reference extraction',
+    'jsonschema': 'JSON schema validation',
+    'taxonomy': 'dereferencing of a taxonomy term link',
+    'persist': 'commit after validation: model flush and after-update receivers (references table)',
+    'mint': 'minting of the control number',
+    'fetch': 'fetching of the persistent identifier',
+    'index': 'sending records to Elasticsearch',
+}
+"""Instrumented stages and what they measure."""
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+"""Upper bounds (seconds) of the histogram buckets."""
+
+
+class Histogram:
+    """Counts of observed durations per bucket, their sum and count."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the q-quantile, 0 if empty."""
+        rank = q * self.count
+        for bound, count in self.cumulative():
+            if count and count >= rank:
+                return bound
+        return 0.0
+
+    def cumulative(self):
+        """Return [(upper bound, number of values <= bound)], the last bound is infinity."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsRegistry:
+    """Thread safe registry of stage duration histograms and gauges."""
+
+    metric_name = 'nr_nresults_stage_duration_seconds'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def register_gauge(self, name, description, callback):
+        """Register a gauge whose value is returned by the callback when rendered, skipped if it raises."""
+        self._gauges[name] = (description, callback)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def as_dict(self):
+        """Return {stage: {'count': n, 'sum': seconds}}."""
+        with self._lock:
+            return {
+                stage: {'count': histogram.count, 'sum': histogram.sum}
+                for stage, histogram in self._histograms.items()
+            }
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        name = self.metric_name
+        lines = [
+            f'# HELP {name} Duration of N-result record lifecycle stages.',
+            f'# TYPE {name} histogram',
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum!r}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        for gauge, (description, callback) in sorted(self._gauges.items()):
+            try:
+                value = float(callback())
+            except Exception:
+                # e.g. the broker of the index queue is not reachable, the other metrics are rendered
+                log.exception('Could not read gauge %s', gauge)
+                continue
+            lines.append(f'# HELP {gauge} {description}')
+            lines.append(f'# TYPE {gauge} gauge')
+            lines.append(f'{gauge} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+
+def record_stage(registry, stage, duration, sender=None, failed=False):
+    """Observe the duration of the stage and send the :data:`~nr_nresults.signals.stage_timed` signal."""
+    registry.observe(stage, duration)
+    if stage_timed.receivers:
+        stage_timed.send(sender, stage=stage, duration=duration, failed=failed)
+
+
+class StageTimer:
+    """Context manager observing the duration of its block, kept in ``duration``."""
+
+    __slots__ = ('registry', 'stage', 'sender', 'start', 'duration')
+
+    def __init__(self, registry, stage, sender):
+        self.registry = registry
+        self.stage = stage
+        self.sender = sender
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.perf_counter() - self.start
+        record_stage(self.registry, self.stage, self.duration, self.sender, exc_type is not None)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+    duration = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+def stage_timer(stage, sender=None):
+    """Return a context manager timing the stage, a no-op one if metrics are disabled.
+
+    :param sender: sender of the :data:`~nr_nresults.signals.stage_timed` signal, e.g. the record
+    """
+    state = current_app.extensions.get('nr-nresults')
+    registry = state.metrics if state is not None else None
+    if registry is None:
+        return NULL_TIMER
+    return StageTimer(registry, stage, sender)
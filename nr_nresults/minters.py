@@ -10,10 +10,32 @@
 
 from __future__ import absolute_import, print_function
 
-from nr_common.minters import nr_id_minter
+from flask import current_app
+from nr_common.minters import nr_id_minter, get_pid_type
 
+from nr_nresults.metrics import stage_timer
 from nr_nresults.providers import NRNresultsIdProvider
 
 
 def nr_nresults_id_minter(record_uuid, data):
-    return nr_id_minter(record_uuid, data, nr_id_provider=NRNresultsIdProvider)
+    """Mint N-result control number.
+
+    If ``NRESULTS_ID_BLOCK_SIZE`` is set, new control numbers are taken from
+    a block reserved by the process (see :class:`nr_nresults.providers.IdBlockAllocator`),
+    otherwise one at a time from the ``nr_id`` sequence.
+    """
+    state = current_app.extensions.get('nr-nresults')
+    with stage_timer('mint'):
+        if state is not None and state.id_block_allocator is not None \
+                and 'control_number' not in data:
+            return nr_block_id_minter(record_uuid, data, state.id_block_allocator)
+        return nr_id_minter(record_uuid, data, nr_id_provider=NRNresultsIdProvider)
+
+
+def nr_block_id_minter(record_uuid, data, allocator, nr_id_provider=NRNresultsIdProvider):
+    """Mint a new control number taken from the allocator's reserved block."""
+    pid_type = get_pid_type(data)
+    provider = nr_id_provider.create_reserved(
+        allocator.next(), pid_type=pid_type, object_type='rec', object_uuid=record_uuid)
+    data['control_number'] = provider.pid.pid_value
+    return provider.pid
@@ -10,8 +10,88 @@
 
 from __future__ import absolute_import, print_function
 
+import os
+import threading
+from collections import deque
+
+from invenio_db import db
+from invenio_pidstore.models import PIDStatus
+from nr_common.models import NRIdentifier
 from nr_common.providers import NRIdProvider
+from sqlalchemy import text
 
 
 class NRNresultsIdProvider(NRIdProvider):
     pid_type = 'nrnrs'
+
+    @classmethod
+    def create_reserved(cls, pid_value, object_type=None, object_uuid=None, **kwargs):
+        """Register a PID whose value has already been taken from the sequence.
+
+        Used for values handed out by :class:`IdBlockAllocator`, their ``nr_id``
+        row already exists so it must not be inserted again.
+        """
+        kwargs.setdefault('status', cls.default_status)
+        if object_type and object_uuid:
+            kwargs['status'] = PIDStatus.REGISTERED
+        # skip NRIdProvider.create which allocates/inserts the nr_id
+        return super(NRIdProvider, cls).create(
+            object_type=object_type, object_uuid=object_uuid, pid_value=str(pid_value), **kwargs)
+
+
+class IdBlockAllocator:
+    """Reserves blocks of control numbers from the ``nr_id`` sequence and hands them out locally.
+
+    A block is reserved in one database round trip (on PostgreSQL) and in its own
+    transaction, so the values are unique across processes even if the record that
+    uses them is rolled back. Values left unused when the process ends are lost,
+    control numbers may therefore have gaps.
+    """
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self.blocks_reserved = 0
+        self.ids_reserved = 0
+        self.ids_issued = 0
+        self._ids = deque()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def next(self):
+        """Return next reserved control number, reserving a new block if needed."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked worker must not hand out values reserved by the parent
+                self._ids.clear()
+                self._pid = os.getpid()
+            if not self._ids:
+                block = self.reserve_block(self.block_size)
+                self._ids.extend(block)
+                self.blocks_reserved += 1
+                self.ids_reserved += len(block)
+            self.ids_issued += 1
+            return self._ids.popleft()
+
+    def reserve_block(self, size):
+        """Take size values from the ``nr_id`` sequence, returns them sorted."""
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.begin() as connection:
+                result = connection.execute(text(
+                    "INSERT INTO {0} (nr_id) "
+                    "SELECT nextval(pg_get_serial_sequence('{0}', 'nr_id')) "
+                    "FROM generate_series(1, :size) "
+                    "RETURNING nr_id".format(NRIdentifier.__tablename__)),
+                    size=size)
+                return sorted(row[0] for row in result)
+        # no sequences, take the values one by one in the current transaction
+        return [NRIdentifier.next() for _ in range(size)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'block_size': self.block_size,
+                'blocks_reserved': self.blocks_reserved,
+                'ids_reserved': self.ids_reserved,
+                'ids_issued': self.ids_issued,
+                'ids_available': len(self._ids),
+            }
@@ -0,0 +1,8 @@
+from __future__ import absolute_import, print_function
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+current_nresults = LocalProxy(
+    lambda: current_app.extensions['nr-nresults'])
+"""Helper proxy to access nr-nresults state object."""
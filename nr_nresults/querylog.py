@@ -0,0 +1,155 @@
+"""Latency of the N-result searches per query shape, and the slow query log.
+
+Every search :class:`nr_nresults.search.NResultsRecordsSearch` sends to
+Elasticsearch is timed. Its request body is normalized (literal values
+replaced by ``?``, page and size left out) and hashed into a fingerprint, the
+duration is added to the histogram of the fingerprint. Searches taking longer
+than ``NRESULTS_SLOW_QUERY_THRESHOLD`` seconds are logged with the endpoint,
+community, hit count and the size of the returned ``_source``.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from flask import has_request_context, request
+
+from nr_nresults.metrics import Histogram
+
+log = logging.getLogger('nr-nresults-slow-queries')
+
+QUERY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+"""Upper bounds (seconds) of the per fingerprint histogram buckets."""
+
+STRUCTURAL_KEYS = frozenset(('field', 'fields', 'path', 'order', 'type', 'operator',
+                             'default_operator', 'calendar_interval', 'interval', 'format'))
+"""Keys whose values (field names, options) are kept in the normalized query."""
+
+IGNORED_KEYS = ('from', 'size')
+
+
+def normalize_query(value, key=None):
+    """Replace literal values of the query DSL with ``?``, keeping its structure and field names.
+
+    Lists of literals (e.g. values of a ``terms`` query) normalize to ``['?']``
+    regardless of their length.
+    """
+    if isinstance(value, dict):
+        return {k: normalize_query(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        normalized = [normalize_query(v, key) for v in value]
+        if normalized and all(v == '?' for v in normalized):
+            return ['?']
+        return normalized
+    if key in STRUCTURAL_KEYS:
+        return value
+    return '?'
+
+
+def query_fingerprint(index, body):
+    """Return (fingerprint, normalized query) of the search request."""
+    normalized = normalize_query({k: v for k, v in body.items() if k not in IGNORED_KEYS})
+    normalized = json.dumps([index, normalized], sort_keys=True, default=str)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest(), normalized
+
+
+def admin_permission_factory(*args, **kwargs):
+    """Permission of the query statistics view, superusers only."""
+    from invenio_access import Permission
+    from invenio_access.permissions import superuser_access
+
+    return Permission(superuser_access)
+
+
+class FingerprintLatency:
+    """Latency histogram of one query shape."""
+
+    __slots__ = ('query', 'histogram', 'max', 'endpoint')
+
+    def __init__(self, query):
+        self.query = query
+        self.histogram = Histogram(QUERY_BUCKETS)
+        self.max = 0.0
+        self.endpoint = None
+
+    def as_dict(self):
+        histogram = self.histogram
+        return {
+            'query': self.query,
+            'endpoint': self.endpoint,
+            'count': histogram.count,
+            'total_ms': histogram.sum * 1000,
+            'mean_ms': histogram.sum * 1000 / histogram.count if histogram.count else 0,
+            'max_ms': self.max * 1000,
+            # bucket bounds, the last bucket is bounded by the max
+            'p50_ms': min(histogram.quantile(0.5), self.max) * 1000,
+            'p95_ms': min(histogram.quantile(0.95), self.max) * 1000,
+            'p99_ms': min(histogram.quantile(0.99), self.max) * 1000,
+            'buckets': {
+                ('+Inf' if bound == float('inf') else repr(bound)): count
+                for bound, count in histogram.cumulative()
+            }
+        }
+
+
+class QueryLog:
+    """Thread safe per fingerprint latencies, the least recently used fingerprints are dropped.
+
+    :param threshold: seconds over which a search is logged, None to log none
+    :param max_fingerprints: number of kept fingerprints
+    """
+
+    def __init__(self, threshold=1.0, max_fingerprints=500):
+        self.threshold = threshold
+        self.max_fingerprints = max_fingerprints
+        self._fingerprints = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, search, response, duration):
+        """Add the duration of the executed search, log it if it was slow."""
+        index = search._index
+        fingerprint, query = query_fingerprint(index, search.to_dict())
+        endpoint = request.endpoint if has_request_context() else None
+        with self._lock:
+            entry = self._fingerprints.get(fingerprint)
+            if entry is None:
+                entry = self._fingerprints[fingerprint] = FingerprintLatency(query)
+                while len(self._fingerprints) > self.max_fingerprints:
+                    self._fingerprints.popitem(last=False)
+            else:
+                self._fingerprints.move_to_end(fingerprint)
+            entry.histogram.observe(duration)
+            entry.max = max(entry.max, duration)
+            entry.endpoint = endpoint or entry.endpoint
+
+        if self.threshold is not None and duration >= self.threshold:
+            self.log_slow(fingerprint, query, endpoint, response, duration)
+
+    @staticmethod
+    def log_slow(fingerprint, query, endpoint, response, duration):
+        raw = response.to_dict()
+        hits = raw.get('hits', {})
+        total = hits.get('total')
+        if isinstance(total, dict):
+            total = total.get('value')
+        source_size = sum(
+            len(json.dumps(hit.get('_source', {}), ensure_ascii=False).encode('utf-8'))
+            for hit in hits.get('hits', [])
+        )
+        community = (request.view_args or {}).get('community_id') if has_request_context() else None
+        log.warning('Slow search %s: %.0f ms (took %s ms), endpoint %s, community %s, %s hits, '
+                    '%s bytes of _source, query %s',
+                    fingerprint, duration * 1000, raw.get('took'), endpoint, community, total,
+                    source_size, query)
+
+    def clear(self):
+        with self._lock:
+            self._fingerprints.clear()
+
+    def as_dict(self):
+        """Return {fingerprint: latencies}, the fingerprints taking most time in total first."""
+        with self._lock:
+            entries = [(k, v.as_dict()) for k, v in self._fingerprints.items()]
+        entries.sort(key=lambda x: x[1]['total_ms'], reverse=True)
+        return dict(entries)
@@ -1,8 +1,7 @@
 import os
 
-from flask import url_for
+from flask import current_app
 from invenio_records.api import Record
-from oarepo_communities.converters import CommunityPIDValue
 from oarepo_communities.proxies import current_oarepo_communities
 from oarepo_communities.record import CommunityRecordMixin
 from oarepo_records_draft.record import InvalidRecordAllowedMixin, DraftRecordMixin
@@ -11,13 +10,216 @@ from oarepo_validate import SchemaKeepingRecordMixin, MarshmallowValidatedRecord
 
 from nr_nresults.constants import NRESULTS_ALLOWED_SCHEMAS, NRESULTS_PREFERRED_SCHEMA, published_index_name, \
     draft_index_name, all_nresults_index_name
+from nr_nresults.fingerprint import content_fingerprints, stored_references
 from nr_nresults.marshmallow import NResultsMetadataSchemaV1
+from nr_nresults.marshmallow.incremental import incremental_schema, patched_fields
+from nr_nresults.metrics import NULL_TIMER, record_stage, stage_timer
+from nr_nresults.routing import community_routing, routing_enabled
+from nr_nresults.urls import build_record_url
 
 
-class NResultBaseRecord(SchemaKeepingRecordMixin,
+class CompiledSchemaValidationMixin:
+    """Validates against the compiled ``$schema`` (see :mod:`nr_nresults.validation`).
+
+    Falls back to the invenio validation if a custom validator or format checker
+    is requested or the schema could not be compiled.
+    """
+
+    def validate(self, **kwargs):
+        schema = self.get('$schema')
+        state = current_app.extensions.get('nr-nresults')
+        validator = state.schema_validator(schema) if schema and state and not kwargs else None
+        with stage_timer('jsonschema', self):
+            if validator is None:
+                return super().validate(**kwargs)
+            validator.validate(self)
+
+
+class CanonicalUrlMixin:
+    """Builds ``canonical_url`` from a precompiled URL template of ``canonical_url_endpoint``.
+
+    If ``NRESULTS_MEMOIZE_CANONICAL_URL`` is set, the URL is kept on the record
+    instance until its control number or primary community changes.
+    """
+    canonical_url_endpoint = None
+
+    @property
+    def canonical_url(self):
+        endpoint = self.canonical_url_endpoint
+        pid_value = self['control_number']
+        community_id = current_oarepo_communities.get_primary_community_field(self)
+        if not current_app.config['NRESULTS_MEMOIZE_CANONICAL_URL']:
+            return build_record_url(endpoint, pid_value, community_id)
+
+        key = (endpoint, pid_value, community_id)
+        memoized = getattr(self, '_canonical_url', None)
+        if memoized is None or memoized[0] != key:
+            memoized = (key, build_record_url(endpoint, pid_value, community_id))
+            self._canonical_url = memoized
+        return memoized[1]
+
+
+class IncrementalPatchValidationMixin:
+    """Validates only the fields touched by a JSON patch of a valid record.
+
+    The schema returned by :func:`nr_nresults.marshmallow.incremental.incremental_schema`
+    is used for the validation in :meth:`patch` and in the following :meth:`commit`.
+    Invalid records are validated whole, their untouched fields can not be trusted.
+    """
+
+    def patch(self, patch):
+        schema = None
+        if current_app.config['NRESULTS_INCREMENTAL_PATCH_VALIDATION'] \
+                and self.get('oarepo:validity', {}).get('valid') is True:
+            fields = patched_fields(patch)
+            if fields is not None:
+                schema = incremental_schema(type(self).MARSHMALLOW_SCHEMA, frozenset(fields))
+        if schema is None:
+            return super().patch(patch)
+
+        self.MARSHMALLOW_SCHEMA = schema
+        try:
+            record = super().patch(patch)
+        finally:
+            del self.MARSHMALLOW_SCHEMA
+        record.MARSHMALLOW_SCHEMA = schema
+        return record
+
+    def commit(self, **kwargs):
+        try:
+            return super().commit(**kwargs)
+        finally:
+            self.__dict__.pop('MARSHMALLOW_SCHEMA', None)
+
+
+class ContentFingerprintMixin:
+    """Skips validation stages whose input did not change (see :mod:`nr_nresults.fingerprint`).
+
+    Fingerprints of the stored content are taken when the record is loaded with
+    its model. On commit, if the metadata are unchanged, the marshmallow validation
+    is skipped and the references registered for the record are kept; the JSON
+    schema validation runs only if the administrative fields changed. Records
+    with validation errors and commits with validation arguments (e.g. a changed
+    reference) are always validated whole.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fingerprints = {}
+        if self.model is not None and self.model.json is not None \
+                and current_app.config['NRESULTS_CONTENT_FINGERPRINTS']:
+            # nested values are shared with model.json, the stored state must be hashed now;
+            # the stored state says nothing about the indexed one, 'index' is set once indexed
+            self._fingerprints = content_fingerprints(self.model.json, ('metadata', 'administration'))
+
+    def fingerprint_changed(self, concern):
+        """True if the content of the concern changed since it was stored, validated or indexed.
+
+        Always True for 'index' until the record was indexed by this instance.
+        """
+        stored = self._fingerprints.get(concern)
+        return stored is None or stored != content_fingerprints(self, (concern,))[concern]
+
+    def update_fingerprint(self, concern):
+        self._fingerprints.update(content_fingerprints(self, (concern,)))
+
+    def patch(self, patch):
+        record = super().patch(patch)
+        record._fingerprints = dict(self._fingerprints)
+        return record
+
+    def validate(self, **kwargs):
+        state = current_app.extensions.get('nr-nresults')
+        if kwargs or state is None or not current_app.config['NRESULTS_CONTENT_FINGERPRINTS'] \
+                or 'metadata' not in self._fingerprints \
+                or not self.get('oarepo:validity', {}).get('valid', True):
+            return self._validate_whole(state, **kwargs)
+
+        fingerprints = content_fingerprints(self, ('metadata', 'administration'))
+        if fingerprints['metadata'] != self._fingerprints['metadata']:
+            return self._validate_whole(state, **kwargs)
+
+        state.fingerprint_stats.record('metadata', skipped=True)
+        self.oarepo_references = stored_references(self.id)
+        ret = None
+        administration_changed = fingerprints['administration'] != self._fingerprints['administration']
+        state.fingerprint_stats.record('administration', skipped=not administration_changed)
+        if administration_changed:
+            ret = super().validate(validate_marshmallow=False)
+        self._fingerprints['administration'] = fingerprints['administration']
+        return ret
+
+    def _validate_whole(self, state, **kwargs):
+        ret = super().validate(**kwargs)
+        if state is not None:
+            state.fingerprint_stats.record('metadata', skipped=False)
+            state.fingerprint_stats.record('administration', skipped=False)
+        if self.get('oarepo:validity', {}).get('valid', True):
+            self._fingerprints.update(content_fingerprints(self, ('metadata', 'administration')))
+        else:
+            self._fingerprints.pop('metadata', None)
+            self._fingerprints.pop('administration', None)
+        return ret
+
+
+class CommunityRoutingMixin:
+    """Remembers the shard routing of the stored record (see :mod:`nr_nresults.routing`).
+
+    ``indexed_routing`` is the routing the record was indexed with, None if
+    unknown (new record or routing disabled).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.indexed_routing = None
+        if self.model is not None and self.model.json is not None and routing_enabled():
+            self.indexed_routing = community_routing(self.model.json)
+
+    def patch(self, patch):
+        record = super().patch(patch)
+        record.indexed_routing = self.indexed_routing
+        return record
+
+
+class StageTimingMixin:
+    """Times the lifecycle stages of the record (see :mod:`nr_nresults.metrics`).
+
+    The ``persist`` stage is the part of a commit outside the validation.
+    """
+
+    @classmethod
+    def create(cls, data, id_=None, **kwargs):
+        with stage_timer('create', cls):
+            return super().create(data, id_=id_, **kwargs)
+
+    def commit(self, **kwargs):
+        timer = stage_timer('commit', self)
+        if timer is NULL_TIMER:
+            return super().commit(**kwargs)
+        self._validation_time = 0.0
+        with timer:
+            ret = super().commit(**kwargs)
+        record_stage(timer.registry, 'persist', timer.duration - self._validation_time, self)
+        return ret
+
+    def validate(self, **kwargs):
+        timer = stage_timer('validate', self)
+        with timer:
+            ret = super().validate(**kwargs)
+        self._validation_time = getattr(self, '_validation_time', 0.0) + timer.duration
+        return ret
+
+    def validate_marshmallow(self, data=None, validate_kwargs=None):
+        with stage_timer('marshmallow', self):
+            return super().validate_marshmallow(data=data, validate_kwargs=validate_kwargs)
+
+
+class NResultBaseRecord(StageTimingMixin,
+                        SchemaKeepingRecordMixin,
                         MarshmallowValidatedRecordMixin,
                         ReferenceEnabledRecordMixin,
                         CommunityRecordMixin,
+                        CompiledSchemaValidationMixin,
                         Record,
                         ):
     ALLOWED_SCHEMAS = NRESULTS_ALLOWED_SCHEMAS
@@ -25,44 +227,25 @@ class NResultBaseRecord(SchemaKeepingRecordMixin,
     MARSHMALLOW_SCHEMA = NResultsMetadataSchemaV1
 
 
-class PublishedNResultRecord(InvalidRecordAllowedMixin, NResultBaseRecord):
+class PublishedNResultRecord(CanonicalUrlMixin, ContentFingerprintMixin, CommunityRoutingMixin,
+                             InvalidRecordAllowedMixin, NResultBaseRecord):
     index_name = published_index_name
-
-    @property
-    def canonical_url(self):
-        return url_for('invenio_records_rest.nresults-community_item',
-                       pid_value=CommunityPIDValue(
-                           self['control_number'],
-                           current_oarepo_communities.get_primary_community_field(self)),
-                       _external=True)
+    canonical_url_endpoint = 'invenio_records_rest.nresults-community_item'
 
 
-class DraftNResultRecord(DraftRecordMixin, NResultBaseRecord):
+class DraftNResultRecord(CanonicalUrlMixin, ContentFingerprintMixin, CommunityRoutingMixin,
+                         IncrementalPatchValidationMixin, DraftRecordMixin, NResultBaseRecord):
     index_name = draft_index_name
-
-    @property
-    def canonical_url(self):
-        return url_for('invenio_records_rest.draft-nresults-community_item',
-                       pid_value=CommunityPIDValue(
-                           self['control_number'],
-                           current_oarepo_communities.get_primary_community_field(self)),
-                       _external=True)
+    canonical_url_endpoint = 'invenio_records_rest.draft-nresults-community_item'
 
 
-class AllNResultRecord(SchemaKeepingRecordMixin, CommunityRecordMixin, Record):
+class AllNResultRecord(CanonicalUrlMixin, SchemaKeepingRecordMixin, CommunityRecordMixin, Record):
     ALLOWED_SCHEMAS = NRESULTS_ALLOWED_SCHEMAS
     PREFERRED_SCHEMA = NRESULTS_PREFERRED_SCHEMA
     index_name = all_nresults_index_name
 
     @property
-    def canonical_url(self):
+    def canonical_url_endpoint(self):
         if not self.get('oarepo:draft'):
-            endpoint = 'invenio_records_rest.nresults-community_item'
-        else:
-            endpoint = 'invenio_records_rest.draft-nresults-community_item'
-
-        return url_for(endpoint,
-                       pid_value=CommunityPIDValue(
-                           self['control_number'],
-                           current_oarepo_communities.get_primary_community_field(self)),
-                       _external=True)
+            return 'invenio_records_rest.nresults-community_item'
+        return 'invenio_records_rest.draft-nresults-community_item'
@@ -0,0 +1,133 @@
+"""Targeted refresh of N-result records embedding a changed taxonomy term.
+
+Records keep dereferenced copies of the terms they link to (titles of
+``N_type``, ``N_resultUsage``, ...). When a term changes, only the records
+registered in the oarepo-references table as referencing the term (or one of
+its descendants, whose ancestor arrays contain the term) are loaded,
+dereferenced again and reindexed, in batches.
+"""
+import logging
+import time
+from collections import namedtuple
+
+from invenio_base.utils import obj_or_import_string
+from invenio_db import db
+from oarepo_references.models import ClassName, RecordReference, ReferencingRecord
+from oarepo_taxonomies.marshmallow import get_slug_from_link
+from oarepo_taxonomies.utils import get_taxonomy_json
+from sqlalchemy import or_
+
+from nr_nresults.constants import DRAFT_NRESULT_RECORD, PUBLISHED_NRESULT_RECORD
+from nr_nresults.indexer import NResultsBulkIndexer
+from nr_nresults.marshmallow.taxonomy import get_taxonomy_cache
+
+log = logging.getLogger('nr-nresults-refresh')
+
+REFRESHED_RECORD_CLASSES = (PUBLISHED_NRESULT_RECORD, DRAFT_NRESULT_RECORD)
+
+RefreshError = namedtuple('RefreshError', ['record_uuid', 'error'])
+"""Record that could not be refreshed or indexed."""
+
+RefreshResult = namedtuple('RefreshResult', ['total', 'refreshed', 'indexed', 'errors'])
+"""Summary of a refresh."""
+
+
+def referencing_records(term_url, record_classes=REFRESHED_RECORD_CLASSES):
+    """Return {record uuid: (record class name, references)} of records referencing the term.
+
+    :param term_url: self link of the term
+    :param record_classes: import strings of the record classes to refresh
+    :returns: references are the matched links, the term itself and/or its descendants
+    """
+    class_names = [x.replace(':', '.') for x in record_classes]
+    rows = db.session.query(ReferencingRecord.record_uuid, ClassName.name,
+                            RecordReference.reference) \
+        .join(RecordReference, RecordReference.record_id == ReferencingRecord.id) \
+        .join(ClassName, ReferencingRecord.class_id == ClassName.id) \
+        .filter(ClassName.name.in_(class_names)) \
+        .filter(or_(RecordReference.reference == term_url,
+                    RecordReference.reference.startswith(term_url.rstrip('/') + '/')))
+
+    affected = {}
+    for record_uuid, class_name, reference in rows:
+        affected.setdefault(record_uuid, (class_name, set()))[1].add(reference)
+    return affected
+
+
+def refresh_record(record, references, contents):
+    """Dereference the taxonomy terms of the record again and commit it.
+
+    If the record references a single affected term, only the field holding it
+    is dereferenced, otherwise the whole record is revalidated.
+    """
+    if len(references) == 1:
+        reference = next(iter(references))
+        if reference not in contents:
+            slug, taxonomy_code = get_slug_from_link(reference)
+            contents[reference] = get_taxonomy_json(code=taxonomy_code, slug=slug).paginated_data
+        record.commit(changed_reference={
+            'url': reference,
+            'uuid': None,
+            'content': contents[reference]
+        })
+    else:
+        record.commit()
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def refresh_records(term_url, batch_size=100, throttle=0, index=True, progress=None,
+                    record_classes=REFRESHED_RECORD_CLASSES):
+    """Refresh and reindex records referencing the term.
+
+    Every batch is committed in one transaction and indexed with one bulk request.
+
+    :param term_url: self link of the changed term
+    :param batch_size: number of records refreshed together
+    :param throttle: seconds to wait between batches, to spread the load
+    :param index: reindex the refreshed records
+    :param progress: callable receiving the partial :class:`RefreshResult` after every batch
+    :returns: :class:`RefreshResult`
+    """
+    cache = get_taxonomy_cache()
+    if cache is not None:
+        # the term may have been changed in another process
+        cache.invalidate(get_slug_from_link(term_url)[1])
+
+    affected = referencing_records(term_url, record_classes=record_classes)
+    record_uuids = sorted(affected, key=str)
+    indexer = NResultsBulkIndexer() if index else None
+    contents = {}
+    refreshed = indexed = 0
+    errors = []
+    log.info('Refreshing %s records referencing %s', len(record_uuids), term_url)
+
+    for batch_no, batch in enumerate(_chunks(record_uuids, batch_size)):
+        if batch_no and throttle:
+            time.sleep(throttle)
+        records = []
+        for record_uuid in batch:
+            class_name, references = affected[record_uuid]
+            try:
+                with db.session.begin_nested():
+                    record = obj_or_import_string(class_name).get_record(record_uuid)
+                    refresh_record(record, references, contents)
+                records.append(record)
+            except Exception as e:
+                log.exception('Could not refresh record %s', record_uuid)
+                errors.append(RefreshError(record_uuid, e))
+        db.session.commit()
+        refreshed += len(records)
+
+        if indexer is not None:
+            success, index_errors = indexer.bulk_index_records(records)
+            indexed += success
+            errors.extend(RefreshError(next(iter(e.values()), {}).get('_id'), e)
+                          for e in index_errors)
+        if progress:
+            progress(RefreshResult(len(record_uuids), refreshed, indexed, errors))
+
+    return RefreshResult(len(record_uuids), refreshed, indexed, errors)
@@ -0,0 +1,307 @@
+"""Zero-downtime rebuild of the N-results indices.
+
+A new index (with a new timestamp suffix) is created from the current
+mapping and filled while searches and writes still go to the old index
+through its aliases:
+
+* from the database, in ``slices`` parallel workers, each reading the records
+  of one range of record UUIDs in batches, or
+* from the old index with the Elasticsearch ``_reindex`` API sliced in the
+  same way.
+
+Records written or deleted during the fill are caught up from the database
+(``RecordMetadata.updated``) until the document counts agree and all aliases
+of the old index are moved to the new one in a single atomic request. Writes
+that happened just before the swap are caught up once more afterwards.
+Documents are indexed with external versions (record revisions), so a
+document is never overwritten by an older revision.
+"""
+import json
+import logging
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from invenio_db import db
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+from invenio_records.models import RecordMetadata
+from invenio_search import current_search, current_search_client
+from invenio_search.utils import build_alias_name, build_index_name, timestamp_suffix
+
+from nr_nresults.constants import DRAFT_NRESULT_PID_TYPE, DRAFT_NRESULT_RECORD, \
+    PUBLISHED_NRESULT_PID_TYPE, PUBLISHED_NRESULT_RECORD, draft_index_name, published_index_name
+from nr_nresults.indexer import NResultsBulkIndexer
+
+log = logging.getLogger('nr-nresults-reindex')
+
+REINDEXED_INDICES = {
+    # index: (pid type, record class)
+    published_index_name: (PUBLISHED_NRESULT_PID_TYPE, PUBLISHED_NRESULT_RECORD),
+    draft_index_name: (DRAFT_NRESULT_PID_TYPE, DRAFT_NRESULT_RECORD),
+}
+
+CATCH_UP_MARGIN = timedelta(seconds=5)
+"""Records updated this long before a catch up started are caught up again (clock skew, open transactions)."""
+
+CATCH_UP_ROUNDS = 5
+"""Catch ups repeated until the new index has as many documents as the source while it is written to."""
+
+FILL_SETTINGS = {'index.refresh_interval': '-1', 'index.number_of_replicas': 0}
+"""Settings of the new index while it is filled."""
+
+ReindexResult = namedtuple('ReindexResult', ['old_index', 'new_index', 'indexed', 'caught_up',
+                                             'expected', 'count', 'aliases'])
+"""Summary of a reindex."""
+
+
+class ReindexError(Exception):
+    """The new index is not complete, the aliases were not swapped."""
+
+
+def alias_indices(alias):
+    """Return {index: {alias: alias properties}} of the indices behind the alias or index name."""
+    client = current_search_client
+    if client.indices.exists_alias(name=alias):
+        indices = list(client.indices.get_alias(name=alias))
+    elif client.indices.exists(index=alias):
+        # an index created without suffix, its name is used by the searches
+        indices = [alias]
+    else:
+        return {}
+    return {
+        index: value.get('aliases', {})
+        for index, value in client.indices.get_alias(index=','.join(indices)).items()
+    }
+
+
+def create_new_index(index):
+    """Create the new suffixed index without aliases, set up for a fast fill."""
+    with open(current_search.mappings[index]) as f:
+        body = json.load(f)
+    # the mapping aliases (nr-all, nr-all-nresults) are added at the swap, not to the empty index
+    body.pop('aliases', None)
+    settings = body.setdefault('settings', {})
+    restored = {k: settings.get(k) for k in FILL_SETTINGS}
+    settings.update(FILL_SETTINGS)
+    new_index = build_index_name(index, suffix=timestamp_suffix())
+    current_search_client.indices.create(index=new_index, body=body)
+    return new_index, restored
+
+
+def _record_query(pid_type):
+    return db.session.query(RecordMetadata, PersistentIdentifier.status) \
+        .join(PersistentIdentifier, PersistentIdentifier.object_uuid == RecordMetadata.id) \
+        .filter(PersistentIdentifier.pid_type == pid_type,
+                PersistentIdentifier.object_type == 'rec')
+
+
+def uuid_slices(slices):
+    """Split the UUID space into ``slices`` ranges (lower bound inclusive, upper exclusive)."""
+    bounds = [uuid.UUID(int=i * (2 ** 128 // slices)) for i in range(slices)]
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def _send(indexer, new_index, rows):
+    """Index (or delete) the rows of (model, pid status) into the new index, returns number sent."""
+    record_class = indexer.record_cls
+    actions = []
+    deleted = []
+    for model, status in rows:
+        if model.json is None or status != PIDStatus.REGISTERED:
+            deleted.append(str(model.id))
+            continue
+        action = indexer.index_action(record_class(model.json, model=model))
+        action['_index'] = new_index
+        actions.append(action)
+    success, errors = indexer.send_actions(actions)
+    if errors:
+        raise ReindexError(f'Could not index into {new_index}: {errors[:10]}')
+    if deleted:
+        # the routing of a deleted record is not known, the documents are looked up by id
+        current_search_client.delete_by_query(index=new_index, body={'query': {'ids': {'values': deleted}}},
+                                              conflicts='proceed', refresh=False)
+    return len(actions) + len(deleted)
+
+
+def fill_slice(app, index, new_index, lower, upper, batch_size):
+    """Index the records with UUIDs in [lower, upper) into the new index, returns their count."""
+    with app.app_context():
+        pid_type, record_class = REINDEXED_INDICES[index]
+        indexer = NResultsBulkIndexer(record_cls=record_class)
+        indexed = 0
+        last = None
+        try:
+            while True:
+                query = _record_query(pid_type) \
+                    .filter(PersistentIdentifier.status == PIDStatus.REGISTERED)
+                query = query.filter(RecordMetadata.id > last) if last else \
+                    query.filter(RecordMetadata.id >= lower)
+                if upper:
+                    query = query.filter(RecordMetadata.id < upper)
+                rows = query.order_by(RecordMetadata.id).limit(batch_size).all()
+                if not rows:
+                    return indexed
+                indexed += _send(indexer, new_index, rows)
+                last = rows[-1][0].id
+                db.session.expunge_all()
+        finally:
+            db.session.remove()
+
+
+def fill_from_database(index, new_index, slices, batch_size):
+    app = current_app._get_current_object()
+    with ThreadPoolExecutor(max_workers=slices) as executor:
+        futures = [executor.submit(fill_slice, app, index, new_index, lower, upper, batch_size)
+                   for lower, upper in uuid_slices(slices)]
+        return sum(f.result() for f in futures)
+
+
+UNROUTED_DOCUMENT_SCRIPT = 'if (ctx._routing == null) { ctx._routing = ctx._id }'
+"""Routes documents of indices created before routing was required by id, where they were."""
+
+
+def fill_from_index(old_index, new_index, slices):
+    response = current_search_client.reindex(body={
+        'source': {'index': old_index},
+        'dest': {'index': new_index, 'version_type': 'external'},
+        'script': {'lang': 'painless', 'source': UNROUTED_DOCUMENT_SCRIPT},
+        'conflicts': 'proceed'
+    }, slices=slices, wait_for_completion=True, refresh=False, request_timeout=24 * 3600)
+    if response.get('failures'):
+        raise ReindexError(f'Could not reindex {old_index}: {response["failures"][:10]}')
+    return response.get('created', 0) + response.get('updated', 0)
+
+
+def catch_up(index, new_index, since, batch_size):
+    """Index records changed (or deleted) since ``since`` into the new index, returns their count."""
+    pid_type, record_class = REINDEXED_INDICES[index]
+    indexer = NResultsBulkIndexer(record_cls=record_class)
+    query = _record_query(pid_type).filter(RecordMetadata.updated >= since - CATCH_UP_MARGIN) \
+        .order_by(RecordMetadata.id)
+    caught_up = 0
+    for offset in range(0, query.count(), batch_size):
+        caught_up += _send(indexer, new_index, query.offset(offset).limit(batch_size).all())
+    return caught_up
+
+
+def catch_up_until_complete(index, old_index, new_index, source, since, batch_size,
+                            rounds=CATCH_UP_ROUNDS, progress=None):
+    """Catch up writes and compare the document counts until they agree or ``rounds`` run out.
+
+    Writes between a catch up and the counting make the counts differ, every
+    round catches up the writes since the previous one.
+
+    :returns: tuple (caught up documents, expected count, count, start of the last catch up)
+    """
+    progress = progress or log.info
+    caught_up = 0
+    for round_no in range(rounds):
+        started = datetime.utcnow()
+        caught_up += catch_up(index, new_index, since, batch_size)
+        current_search_client.indices.refresh(index=new_index)
+        expected = expected_count(index, old_index, source)
+        count = current_search_client.count(index=new_index)['count']
+        if count == expected:
+            break
+        progress(f'{new_index} has {count} documents, expected {expected}, catching up again')
+        since = started
+    return caught_up, expected, count, started
+
+
+def expected_count(index, old_index, source):
+    if source == 'index':
+        return current_search_client.count(index=old_index)['count']
+    pid_type, _ = REINDEXED_INDICES[index]
+    return _record_query(pid_type).filter(
+        PersistentIdentifier.status == PIDStatus.REGISTERED,
+        RecordMetadata.json.isnot(None)).count()
+
+
+def mapping_aliases(index):
+    """Return {alias: properties} of the mapping, ``{PREFIX}`` replaced by the search index prefix."""
+    with open(current_search.mappings[index]) as f:
+        aliases = json.load(f).get('aliases', {})
+    return {build_alias_name(name.replace('{PREFIX}', '')): properties
+            for name, properties in aliases.items()}
+
+
+def alias_actions(old_index, old_aliases, new_index, aliases, alias):
+    """Return update_aliases actions moving the aliases from the old index to the new one.
+
+    :param old_aliases: names of the aliases of the old index
+    :param aliases: {alias: alias properties} the new index gets
+    :param alias: the alias searches and writes go through
+    """
+    actions = []
+    if old_index == alias:
+        # the searched name is the (unsuffixed) index itself, it must go away in the same request
+        actions.append({'remove_index': {'index': old_index}})
+    elif old_index:
+        actions.extend({'remove': {'index': old_index, 'alias': name}} for name in old_aliases)
+    actions.extend({'add': {'index': new_index, 'alias': name, **properties}}
+                   for name, properties in aliases.items())
+    return actions
+
+
+def reindex(index=published_index_name, source='database', slices=4, batch_size=500,
+            delete_old=False, force=False, progress=None):
+    """Rebuild the index into a new one and swap the aliases.
+
+    :param index: name of the mapping, one of :data:`REINDEXED_INDICES`
+    :param source: ``database`` or ``index`` (the old index)
+    :param slices: number of parallel readers
+    :param batch_size: documents sent in one bulk request (database source)
+    :param delete_old: delete the old index after the swap
+    :param force: swap the aliases even if the document counts differ
+    :param progress: callable receiving progress messages
+    :raises ReindexError: if the counts differ; the new index is kept for inspection
+    :returns: :class:`ReindexResult`
+    """
+    progress = progress or log.info
+    client = current_search_client
+    alias = build_alias_name(index)
+    old = alias_indices(alias)
+    if len(old) > 1:
+        raise ReindexError(f'{alias} points to more indices: {", ".join(old)}')
+    old_index, old_aliases = next(iter(old.items()), (None, {}))
+    if old_index is None and source == 'index':
+        raise ReindexError(f'There is no index {alias} to reindex from')
+
+    new_index, restored_settings = create_new_index(index)
+    progress(f'Filling {new_index} from the {source}')
+    started = datetime.utcnow()
+    if source == 'index':
+        indexed = fill_from_index(old_index, new_index, slices)
+    else:
+        indexed = fill_from_database(index, new_index, slices, batch_size)
+
+    progress(f'Indexed {indexed} documents, catching up writes since {started.isoformat()}')
+    client.indices.put_settings(index=new_index, body=restored_settings)
+    caught_up, expected, count, started = catch_up_until_complete(
+        index, old_index, new_index, source, started, batch_size, progress=progress)
+    if count != expected and not force:
+        raise ReindexError(f'{new_index} has {count} documents, expected {expected}; '
+                           f'aliases of {old_index} were not swapped')
+
+    aliases = {**mapping_aliases(index), **old_aliases, alias: {}}
+    if old_index == alias:
+        log.warning('Index %s has no suffix, it is deleted by the swap', old_index)
+    # one request, searches see either the old or the new index
+    client.indices.update_aliases(body={
+        'actions': alias_actions(old_index, old_aliases, new_index, aliases, alias)
+    })
+    progress(f'Aliases {", ".join(sorted(aliases))} moved to {new_index}')
+
+    caught_up += catch_up(index, new_index, started, batch_size)
+    client.indices.refresh(index=new_index)
+    state = current_app.extensions.get('nr-nresults')
+    if state is not None:
+        # bumps the shared version, the caches of all processes miss
+        state.index_written(index)
+
+    if delete_old and old_index and old_index != alias:
+        client.indices.delete(index=old_index)
+        progress(f'Deleted {old_index}')
+    return ReindexResult(old_index, new_index, indexed, caught_up, expected, count, sorted(aliases))
@@ -0,0 +1,54 @@
+"""Shard routing of N-result documents by community (``NRESULTS_COMMUNITY_ROUTING``).
+
+A record belonging to its primary community only is indexed with the
+community as the routing value, so the community list searches
+(``/<community_id>/nresults/``) query a single shard. Records shared with other
+communities are indexed with :data:`SHARED_ROUTING`; community searches are
+routed to both values, they find every record the community filter matches.
+
+The routing of a stored record is remembered when the record is loaded. When
+it changes (the record moved to another community or got shared), the indexer
+deletes the document indexed with the old routing.
+
+The mapping requires routing, writes without it fail. The extension adds the
+routing to the index arguments of every indexer (``before_record_index``),
+deletions are routed by :class:`nr_nresults.indexer.NResultsBulkIndexer`. Without community
+routing the documents are routed by the record id, which is where Elasticsearch
+puts documents indexed without routing.
+"""
+from flask import current_app
+from oarepo_communities.proxies import current_oarepo_communities
+
+SHARED_ROUTING = '_shared'
+"""Routing value of records belonging to more communities or to none."""
+
+
+def routing_enabled():
+    return current_app.config['NRESULTS_COMMUNITY_ROUTING']
+
+
+def _field_value(data, path):
+    for key in path.split('.'):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def community_routing(data):
+    """Return the routing value of the record data."""
+    primary = current_oarepo_communities.get_primary_community_field(data)
+    communities = _field_value(data, current_oarepo_communities.communities_field) or ()
+    if not primary or set(communities) - {primary}:
+        return SHARED_ROUTING
+    return primary
+
+
+def record_routing(record):
+    """Return the routing of the record document, the record id if community routing is disabled."""
+    return community_routing(record) if routing_enabled() else str(record.id)
+
+
+def community_search_routing(community_id):
+    """Return the routing of a search of the community records."""
+    return f'{community_id},{SHARED_ROUTING}'
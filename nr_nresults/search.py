@@ -1,5 +1,16 @@
+import copy
+import json
+import time
+
+from flask import current_app, has_app_context, has_request_context, request
+from flask_login import current_user
+from invenio_records_rest.errors import InvalidQueryRESTError
+from invenio_records_rest.query import es_search_factory
 from invenio_search import RecordsSearch
-from nr_common.search import NRRecordsSearch
+from nr_common.search import NRRecordsSearch, community_search_factory
+
+from nr_nresults.constants import prefixed_published_index_name
+from nr_nresults.routing import community_search_routing, routing_enabled
 
 
 class NResultsRecordsSearch(NRRecordsSearch):
@@ -12,8 +23,256 @@ class NResultsRecordsSearch(NRRecordsSearch):
         '_administration.communities',
         '$schema'
     ]
-    HIGHLIGHT_FIELDS = {
-        'title.cs': None,
-        'title._': None,
-        'title.en': None
+    LIST_REQUIRED_FIELDS = [
+        'control_number', 'oarepo:draft', '_administration.primaryCommunity', '$schema'
+    ]
+    """Fields always returned, needed to build the links of the hits."""
+    LIST_PROJECTIONS = {
+        'minimal': ['title'],
+        'card': [
+            'oarepo:validity.valid', 'title', 'dateIssued', 'creator', 'resourceType', 'N_type',
+            'accessRights', 'state', '_administration.communities'
+        ],
+        'full': LIST_SOURCE_FIELDS,
     }
+    """Named sets of fields selected by the ``projection`` argument of list requests."""
+    LIST_ALLOWED_FIELDS = [
+        *LIST_SOURCE_FIELDS,
+        'titleAlternate', 'provider', 'N_type', 'N_resultUsage', 'N_certifyingAuthority',
+        'N_dateCertified', 'N_internalID', 'N_referenceNumber', 'rights', 'entities', 'persistentId'
+    ]
+    """Fields (and their subfields) that may be selected by the ``fields`` argument."""
+    HIGHLIGHT_FIELDS = {}
+    """Nothing is highlighted unless a list request asks for it, see :meth:`with_list_args`."""
+    LIST_HIGHLIGHT_FIELDS = ['title.cs', 'title._', 'title.en']
+    HIGHLIGHT_OPTIONS = {'type': 'unified'}
+    """The title fields are indexed with offsets, the unified highlighter does not analyze them again."""
+
+    _use_response_cache = True
+
+    def with_list_args(self, args):
+        """Return the search selecting the fields and highlighting the titles as asked by list arguments.
+
+        :raises InvalidQueryRESTError: on unknown projection or not allowed field
+        """
+        s = self
+        source = self.list_source_fields(args)
+        if source is not None:
+            s = s.source(source)
+        if self.highlight_requested(args):
+            s = s.highlight(*self.LIST_HIGHLIGHT_FIELDS).highlight_options(**self.HIGHLIGHT_OPTIONS)
+        return s
+
+    @staticmethod
+    def highlight_requested(args):
+        """True if the ``highlight`` argument of a list request asks for highlighted titles."""
+        return args.get('highlight', '').lower() in ('1', 'true', 'yes')
+
+    @classmethod
+    def list_source_fields(cls, args):
+        """Return the fields selected by ``projection`` and ``fields`` arguments, None if not given.
+
+        ``fields`` is a comma separated list of fields added to the projection
+        (or the required fields only if no projection is given).
+
+        :raises InvalidQueryRESTError: on unknown projection or not allowed field
+        """
+        projection = args.get('projection')
+        fields = args.get('fields')
+        if not projection and not fields:
+            return None
+        if projection and projection not in cls.LIST_PROJECTIONS:
+            raise InvalidQueryRESTError(f'Unknown projection "{projection}", use one of '
+                                        f'{", ".join(cls.LIST_PROJECTIONS)}')
+        selected = list(cls.LIST_REQUIRED_FIELDS)
+        requested = [*cls.LIST_PROJECTIONS.get(projection, ()),
+                     *(f.strip() for f in (fields or '').split(',') if f.strip())]
+        for field in requested:
+            if not any(field == allowed or field.startswith(allowed + '.')
+                       for allowed in cls.LIST_ALLOWED_FIELDS):
+                raise InvalidQueryRESTError(f'Field "{field}" can not be requested')
+            if field not in selected:
+                selected.append(field)
+        return selected
+
+    def extra(self, **kwargs):
+        """Add extra keys to the request body, exact total hits are counted as configured."""
+        if kwargs.get('track_total_hits') is True and has_app_context():
+            kwargs['track_total_hits'] = current_app.config.get('NRESULTS_TRACK_TOTAL_HITS', True)
+        return super().extra(**kwargs)
+
+    def _clone(self):
+        s = super()._clone()
+        s._use_response_cache = self._use_response_cache
+        return s
+
+    def without_response_cache(self):
+        """Return a copy of the search that always goes to Elasticsearch."""
+        s = self._clone()
+        s._use_response_cache = False
+        return s
+
+    def execute(self, ignore_cache=False):
+        """Execute the search, serving anonymous searches of published records from the response cache."""
+        cache = self._response_cache()
+        if cache is None:
+            return self._execute_with_cached_aggregations(ignore_cache=ignore_cache)
+
+        key = self._response_cache_key()
+        raw = cache.lookup(key)
+        if raw is None:
+            response = self._execute_with_cached_aggregations(ignore_cache=ignore_cache)
+            if self._index_settled('published'):
+                cache.store(key, copy.deepcopy(response.to_dict()))
+            return response
+        self._response = self._response_class(self, copy.deepcopy(raw))
+        return self._response
+
+    def _execute_with_cached_aggregations(self, ignore_cache=False):
+        """Execute the search, taking the aggregations from the cache if they were computed before.
+
+        Aggregations depend on the index, the query (including the permission
+        and community filters) and the aggregation definitions only, not on the
+        page, sort or post filters, so the facet counts are shared by all pages
+        and post filtered variants of a list request.
+        """
+        cache = self._aggregation_cache()
+        if cache is None or not self.aggs._params.get('aggs'):
+            return self._execute_in_elasticsearch(ignore_cache=ignore_cache)
+        if not ignore_cache and hasattr(self, '_response'):
+            return self._response
+
+        key = self._aggregation_cache_key()
+        aggregations = cache.lookup(key)
+        if aggregations is None:
+            response = self._execute_in_elasticsearch(ignore_cache=ignore_cache)
+            if self._index_settled(*self._searched_index_types()):
+                cache.store(key, copy.deepcopy(response.to_dict().get('aggregations', {})))
+            return response
+
+        s = self._clone()
+        s.aggs._params = {'aggs': {}}
+        raw = s._execute_in_elasticsearch().to_dict()
+        raw['aggregations'] = copy.deepcopy(aggregations)
+        self._response = self._response_class(self, raw)
+        return self._response
+
+    def _execute_in_elasticsearch(self, ignore_cache=False):
+        """Send the search to Elasticsearch, timing it into the query log (nr_nresults.querylog)."""
+        query_log = self._query_log()
+        if query_log is None or (not ignore_cache and hasattr(self, '_response')):
+            return super().execute(ignore_cache=ignore_cache)
+        start = time.perf_counter()
+        response = super().execute(ignore_cache=ignore_cache)
+        query_log.record(self, response, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def _query_log():
+        if not has_app_context():
+            return None
+        state = current_app.extensions.get('nr-nresults')
+        return state.query_log if state is not None else None
+
+    def _aggregation_cache(self):
+        if not self._use_response_cache:
+            return None
+        state = current_app.extensions.get('nr-nresults')
+        if state is None or not state.aggregation_cache.max_size:
+            return None
+        return state.aggregation_cache
+
+    @staticmethod
+    def _index_versions(*index_types):
+        versions = current_app.extensions['nr-nresults'].cache_versions
+        return [versions.get(index_type) for index_type in index_types]
+
+    @staticmethod
+    def _index_settled(*index_types):
+        # responses computed before recent writes are searchable are not cached
+        return current_app.extensions['nr-nresults'].index_settled(*index_types)
+
+    def _searched_index_types(self):
+        """Return the sorted types ('draft', 'published') of the searched indices, both for other indices."""
+        state = current_app.extensions['nr-nresults']
+        index_types = set()
+        for index in self._index or ():
+            index_type = state.index_type(index)
+            index_types.update([index_type] if index_type else ('draft', 'published'))
+        return tuple(sorted(index_types or ('draft', 'published')))
+
+    def _aggregation_cache_key(self):
+        """Return (searched index types, key), the entries are dropped when one of the indices changes."""
+        index_types = self._searched_index_types()
+        body = self.to_dict()
+        return index_types, json.dumps([self._index_versions(*index_types), self._index, body.get('query'),
+                                        body.get('aggs'), body.get('min_score'),
+                                        self._params.get('typed_keys')],
+                                       sort_keys=True, default=str)
+
+    def _response_cache(self):
+        """Return the search response cache if this search may be cached.
+
+        Only anonymous GET searches over the published index are cached: their
+        results depend on the query only. Searches filtered by the permissions
+        of a user (drafts, all-nresults) always go to Elasticsearch.
+        """
+        if not self._use_response_cache:
+            return None
+        if not has_request_context() or request.method != 'GET' or current_user.is_authenticated:
+            return None
+        if list(self._index or ()) != [prefixed_published_index_name]:
+            return None
+        state = current_app.extensions.get('nr-nresults')
+        if state is None or not state.search_cache.max_size:
+            return None
+        return state.search_cache
+
+    def _response_cache_key(self):
+        # preference is derived from the client address, it does not change the result
+        params = {k: v for k, v in self._params.items() if k != 'preference'}
+        return json.dumps([self._index_versions('published'), self._index, self.to_dict(), params],
+                          sort_keys=True, default=str)
+
+
+LIST_LINK_ARGS = ('projection', 'fields', 'highlight')
+"""List arguments of NResultsRecordsSearch kept in the pagination links."""
+
+
+def list_args_search_factory(search_factory):
+    """Wrap a search factory to apply the :data:`LIST_LINK_ARGS` and keep them in the pagination links.
+
+    See :meth:`NResultsRecordsSearch.with_list_args`.
+    """
+
+    def factory(list_resource, records_search, **kwargs):
+        records_search = records_search.with_list_args(request.args)
+        query, params = search_factory(list_resource, records_search, **kwargs)
+        list_params = {k: request.values[k] for k in LIST_LINK_ARGS if request.values.get(k)}
+        if list_params:
+            params = params.copy()
+            params.update(list_params)
+        return query, params
+
+    return factory
+
+
+def community_routing_search_factory(search_factory):
+    """Wrap a community search factory to route the search to the shards of the community.
+
+    Does nothing unless ``NRESULTS_COMMUNITY_ROUTING`` is set, see :mod:`nr_nresults.routing`.
+    """
+
+    def factory(list_resource, records_search, **kwargs):
+        query, params = search_factory(list_resource, records_search, **kwargs)
+        community_id = (request.view_args or {}).get('community_id')
+        if community_id and routing_enabled():
+            query = query.params(routing=community_search_routing(community_id))
+        return query, params
+
+    return factory
+
+
+nresults_search_factory = list_args_search_factory(es_search_factory)
+nresults_community_search_factory = list_args_search_factory(
+    community_routing_search_factory(community_search_factory))
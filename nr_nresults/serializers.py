@@ -0,0 +1,95 @@
+"""JSON serializers of the N-results record and search responses.
+
+They produce the same documents as ``oarepo_validate:json_response`` and
+``oarepo_validate:json_search`` with less work per hit:
+
+* the ``_source`` of a hit is encoded as it came from Elasticsearch, it is
+  neither copied nor modified (``_created`` / ``_updated`` are left out of a
+  shallow copy only if present),
+* every hit is encoded as soon as it is transformed and the encoded hits are
+  joined into the response body, no response-wide structure is built,
+* the encoding is done by orjson if it is installed, the Flask JSON encoder
+  is used otherwise.
+"""
+from flask import json, request
+from invenio_records_rest.serializers import record_responsify, search_responsify
+from oarepo_validate import JSONSerializer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+HIT_TIMESTAMPS = ('_created', '_updated')
+
+
+def _orjson_default(obj):
+    # the types orjson does not encode natively and the Flask encoder does
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def pretty_print():
+    return bool(request and request.args.get('prettyprint'))
+
+
+def dumps(obj, pretty=False):
+    """Encode the object to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_orjson_default,
+                            option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(obj, indent=2, separators=(', ', ': ')).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class NResultsJSONSerializer(JSONSerializer):
+    """JSON serializer encoding the search hits one by one without copying their sources."""
+
+    def serialize(self, pid, record, links_factory=None, **kwargs):
+        return dumps(self.transform_record(pid, record, links_factory, **kwargs), pretty_print())
+
+    def transform_search_hit(self, pid, record_hit, links_factory=None, **kwargs):
+        source = record_hit['_source']
+        metadata = source
+        if '_created' in source or '_updated' in source:
+            metadata = {k: v for k, v in source.items() if k not in HIT_TIMESTAMPS}
+        ret = {
+            'metadata': metadata,
+            'links': links_factory(pid, record_hit=record_hit, **kwargs) if links_factory else {},
+            'revision': record_hit['_version'],
+            'created': source.get('_created'),
+            'updated': source.get('_updated'),
+            'id': pid.pid_value,
+        }
+        if 'highlight' in record_hit:
+            ret['highlight'] = record_hit['highlight']
+        return ret
+
+    def serialize_search(self, pid_fetcher, search_result, links=None,
+                         item_links_factory=None, **kwargs):
+        total = search_result['hits']['total']
+        if isinstance(total, dict):
+            total = total['value']
+        hits = (
+            self.transform_search_hit(pid_fetcher(hit['_id'], hit['_source']), hit,
+                                      links_factory=item_links_factory, **kwargs)
+            for hit in search_result['hits']['hits']
+        )
+        aggregations = search_result.get('aggregations', {})
+        if pretty_print():
+            return dumps({'hits': {'hits': list(hits), 'total': total},
+                          'links': links or {}, 'aggregations': aggregations}, pretty=True)
+        return b''.join((
+            b'{"hits":{"hits":[', b','.join(dumps(hit) for hit in hits),
+            b'],"total":', dumps(total),
+            b'},"links":', dumps(links or {}),
+            b',"aggregations":', dumps(aggregations), b'}'
+        ))
+
+
+json_serializer = NResultsJSONSerializer(replace_refs=False)
+
+json_response = record_responsify(json_serializer, 'application/json')
+json_search = search_responsify(json_serializer, 'application/json')
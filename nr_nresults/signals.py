@@ -0,0 +1,13 @@
+"""Signals of the nr-nresults extension."""
+from blinker import Namespace
+
+_signals = Namespace()
+
+stage_timed = _signals.signal('nr-nresults-stage-timed')
+"""Signal sent after a lifecycle stage of a record was timed (``NRESULTS_METRICS`` enabled).
+
+:param sender: the record, record class or None
+:param stage: name of the stage, see :data:`nr_nresults.metrics.STAGES`
+:param duration: seconds the stage took
+:param failed: True if the stage raised an exception
+"""
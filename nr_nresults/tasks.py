@@ -0,0 +1,36 @@
+import logging
+
+from celery import shared_task
+from flask import current_app
+
+log = logging.getLogger('nr-nresults-refresh')
+
+
+@shared_task(ignore_result=True)
+def refresh_term_references(term_url):
+    """Refresh and reindex N-result records referencing the changed taxonomy term."""
+    from nr_nresults.refresh import refresh_records
+
+    config = current_app.config
+    result = refresh_records(term_url,
+                             batch_size=config['NRESULTS_REFRESH_BATCH_SIZE'],
+                             throttle=config['NRESULTS_REFRESH_THROTTLE'])
+    return result.refreshed
+
+
+def schedule_term_refresh(term_urls):
+    """Schedule the refresh of the terms whose update was committed."""
+    if refresh_term_references.app.conf.task_always_eager:
+        log.warning('Not refreshing records referencing %s in eager Celery mode, '
+                    'run invenio nresults refresh-term', ', '.join(term_urls))
+        return
+    for term_url in term_urls:
+        refresh_term_references.delay(term_url)
+
+
+@shared_task(ignore_result=True)
+def process_index_queue():
+    """Index the N-result records queued by NResultsQueuedIndexer (run by Celery beat, see CELERY_BEAT_SCHEDULE)."""
+    from nr_nresults.index_queue import process_index_queue as _process_index_queue
+
+    return _process_index_queue().sent
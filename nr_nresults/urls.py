@@ -0,0 +1,35 @@
+"""Fast building of record URLs.
+
+``url_for`` goes through the whole werkzeug URL map and the community PID
+converter on every call. Record URLs differ only in the control number and
+the primary community, so the URL of an endpoint is built with ``url_for``
+just once (per host) with placeholder values and then filled in with plain
+string replacement.
+"""
+from flask import current_app, has_request_context, request, url_for
+from oarepo_communities.converters import CommunityPIDValue
+from werkzeug.urls import url_quote
+
+PID_PLACEHOLDER = '__nresults_pid_value__'
+COMMUNITY_PLACEHOLDER = '__nresults_community_id__'
+
+
+def url_template(endpoint):
+    """Return the external URL of endpoint with pid value and community placeholders."""
+    host = request.host_url if has_request_context() else None
+    templates = current_app.extensions['nr-nresults'].url_templates
+    try:
+        return templates[(endpoint, host)]
+    except KeyError:
+        template = url_for(endpoint,
+                           pid_value=CommunityPIDValue(PID_PLACEHOLDER, COMMUNITY_PLACEHOLDER),
+                           _external=True)
+        templates[(endpoint, host)] = template
+        return template
+
+
+def build_record_url(endpoint, pid_value, community_id):
+    """Same as ``url_for(endpoint, pid_value=CommunityPIDValue(pid_value, community_id), _external=True)``."""
+    return url_template(endpoint) \
+        .replace(PID_PLACEHOLDER, url_quote(str(pid_value))) \
+        .replace(COMMUNITY_PLACEHOLDER, url_quote(str(community_id)))
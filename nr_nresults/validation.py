@@ -0,0 +1,81 @@
+"""Compiled JSON schema validation of N-result records.
+
+Invenio validates records with ``jsonschema.validate({'$ref': url})``: on every
+call the meta schema is checked, a new resolver is created and the ``$ref``
+chain (nr-nresults -> nr-common -> taxonomy, multilingual) is resolved again.
+Here the schema is resolved once into a single document with all ``$ref``
+replaced by the referenced subschemas and a validator instance is kept per
+process, so validating a record only walks the schema.
+"""
+import logging
+from urllib.parse import urldefrag, urljoin
+
+from invenio_jsonschemas.errors import JSONSchemaNotFound
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+log = logging.getLogger(__name__)
+
+
+def _resolve_pointer(document, pointer):
+    for part in pointer.strip('/').split('/') if pointer.strip('/') else ():
+        part = part.replace('~1', '/').replace('~0', '~')
+        document = document[int(part)] if isinstance(document, list) else document[part]
+    return document
+
+
+def inline_schema(url, jsonschemas, id_of=lambda schema: ''):
+    """Return the schema at ``url`` with all ``$ref`` replaced by the referenced subschemas.
+
+    :param url: absolute URL of a schema registered in invenio-jsonschemas
+    :param jsonschemas: invenio-jsonschemas state used to load the schemas
+    :param id_of: function returning the resolution scope (id) of a subschema, the same
+        the validator uses
+    :raises ValueError: if the schema is recursive and can not be inlined
+    """
+
+    def load(document_url):
+        path = jsonschemas.url_to_path(document_url)
+        if path is None:
+            raise JSONSchemaNotFound(document_url)
+        return jsonschemas.get_schema(path)
+
+    def inline(node, base, stack):
+        if isinstance(node, list):
+            return [inline(x, base, stack) for x in node]
+        if not isinstance(node, dict):
+            return node
+        scope = id_of(node)
+        if scope:
+            base = urljoin(base, scope)
+        ref = node.get('$ref')
+        if isinstance(ref, str):
+            # as in the validator, keywords next to $ref are ignored
+            target = urljoin(base, ref)
+            if target in stack:
+                raise ValueError(f'Schema {url} is recursive ({target}), it can not be inlined')
+            document_url, pointer = urldefrag(target)
+            return inline(_resolve_pointer(load(document_url), pointer), document_url,
+                          stack + (target,))
+        return {k: inline(v, base, stack) for k, v in node.items()}
+
+    return inline(load(url), url, (url,))
+
+
+class CompiledSchemaValidator:
+    """Validator of one schema with the ``$ref`` chain resolved in advance."""
+
+    def __init__(self, url, jsonschemas, types=None):
+        # the class invenio-records gets for {'$ref': url}, the $schema of the document is not used
+        cls = validator_for({})
+        self.url = url
+        self.schema = inline_schema(url, jsonschemas, id_of=getattr(cls, 'ID_OF', lambda s: ''))
+        # not checked against the meta schema: invenio-records checks only the {'$ref': url}
+        # wrapper and nr-nresults-v1.0.0.json itself is not a valid draft 7 schema
+        self.validator = cls(self.schema, **({'types': types} if types else {}))
+
+    def validate(self, data):
+        """Raise :class:`jsonschema.ValidationError` if data are not valid, like ``jsonschema.validate``."""
+        error = best_match(self.validator.iter_errors(data))
+        if error is not None:
+            raise error
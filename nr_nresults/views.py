@@ -0,0 +1,82 @@
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from invenio_base.utils import obj_or_import_string
+
+from nr_nresults.constants import prefixed_published_index_name, prefixed_all_nresults_index_name
+
+blueprint = Blueprint('nr_nresults', __name__)
+
+
+def export_view(index_name, list_permission_factory):
+    def view(**kwargs):
+        from invenio_records_rest.views import verify_record_permission
+        from nr_nresults.export import iter_export_hits, ndjson_lines, csv_lines, \
+            decode_resumption_token
+        from nr_nresults.search import NResultsRecordsSearch
+
+        verify_record_permission(obj_or_import_string(list_permission_factory), None)
+
+        after = request.args.get('after')
+        if after:
+            try:
+                decode_resumption_token(after)
+            except ValueError as e:
+                abort(400, str(e))
+
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            abort(400, f'Unsupported export format {fmt}')
+        page_size = request.args.get('size', current_app.config['NRESULTS_EXPORT_PAGE_SIZE'],
+                                     type=int)
+        if page_size < 1:
+            abort(400, f'Export page size must be positive, got {page_size}')
+        page_size = min(page_size, current_app.config['NRESULTS_EXPORT_PAGE_SIZE'])
+
+        hits = iter_export_hits(NResultsRecordsSearch(index=index_name),
+                                query=request.args.get('q'), after=after, page_size=page_size)
+        if fmt == 'csv':
+            return Response(stream_with_context(csv_lines(hits)), mimetype='text/csv')
+        return Response(stream_with_context(ndjson_lines(hits)), mimetype='application/x-ndjson')
+
+    return view
+
+
+blueprint.add_url_rule(
+    '/nresults/export/', 'nresults_export',
+    export_view(prefixed_published_index_name, 'invenio_records_rest.utils:allow_all'))
+blueprint.add_url_rule(
+    '/<community_id>/nresults/export/', 'nresults_community_export',
+    export_view(prefixed_published_index_name, 'invenio_records_rest.utils:allow_all'))
+blueprint.add_url_rule(
+    '/nresults/all/export/', 'all_nresults_export',
+    export_view(prefixed_all_nresults_index_name,
+                'nr_common.permissions.list_all_object_permission_impl'))
+blueprint.add_url_rule(
+    '/<community_id>/nresults/all/export/', 'community_nresults_export',
+    export_view(prefixed_all_nresults_index_name,
+                'nr_common.permissions.list_all_object_permission_impl'))
+
+
+@blueprint.route('/nresults/metrics')
+def metrics():
+    """Durations of the record lifecycle stages in the Prometheus text format."""
+    from invenio_records_rest.views import verify_record_permission
+
+    verify_record_permission(
+        obj_or_import_string(current_app.config['NRESULTS_METRICS_PERMISSION_FACTORY']), None)
+    registry = current_app.extensions['nr-nresults'].metrics
+    if registry is None:
+        abort(404, 'Metrics are disabled (NRESULTS_METRICS)')
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@blueprint.route('/nresults/query-stats')
+def query_stats():
+    """Latencies of the executed searches per query fingerprint, slowest in total first."""
+    from invenio_records_rest.views import verify_record_permission
+
+    verify_record_permission(
+        obj_or_import_string(current_app.config['NRESULTS_QUERY_STATS_PERMISSION_FACTORY']), None)
+    query_log = current_app.extensions['nr-nresults'].query_log
+    if query_log is None:
+        abort(404, 'Query log is disabled (NRESULTS_QUERY_LOG)')
+    return jsonify(query_log.as_dict())
@@ -0,0 +1,33 @@
+import io
+import json
+
+from nr_nresults.bulk import bulk_ingest, read_checkpoint
+from nr_nresults.record import PublishedNResultRecord
+
+
+def test_bulk_ingest(app, db, taxonomy_tree, base_json, base_nresult, tmp_path):
+    lines = []
+    for control_number in ("511100", "511101", "511102"):
+        lines.append(json.dumps({**base_json, **base_nresult, "control_number": control_number}))
+    lines.insert(1, "not a json")
+    source = "\n".join(lines)
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    result = bulk_ingest(io.StringIO(source), chunk_size=2, checkpoint=checkpoint, index=False)
+    assert result.processed == 4
+    assert result.created == 3
+    assert len(result.errors) == 1
+    assert result.errors[0].line == 1
+    assert read_checkpoint(checkpoint) == 4
+    assert len(PublishedNResultRecord.get_records(
+        [r.id for r in PublishedNResultRecord.model_cls.query.all()])) >= 3
+
+    # resuming from the checkpoint does nothing
+    result = bulk_ingest(io.StringIO(source), chunk_size=2, checkpoint=checkpoint, index=False)
+    assert result.processed == 0
+
+    # starting from scratch skips already ingested records
+    result = bulk_ingest(io.StringIO(source), chunk_size=2, checkpoint=checkpoint, resume=False,
+                         index=False)
+    assert result.created == 0
+    assert result.skipped == 3
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+
+import pytest
+from elasticsearch_dsl.response import Hit
+from werkzeug.exceptions import BadRequest
+
+from nr_nresults.export import encode_resumption_token, decode_resumption_token, csv_lines, \
+    ndjson_lines
+from nr_nresults.views import export_view
+
+
+def make_hits():
+    hits = []
+    for control_number in ("1", "2"):
+        hit = Hit({
+            "_id": f"uuid-{control_number}",
+            "_index": "nr_nresults-nr-nresults-v1.0.0",
+            "_source": {
+                "control_number": control_number,
+                "title": [{"cs": "Záznam"}],
+                "_administration": {"primaryCommunity": "nr"}
+            },
+            "sort": [control_number, "nr_nresults-nr-nresults-v1.0.0"]
+        })
+        hits.append((hit, encode_resumption_token(list(hit.meta.sort))))
+    return hits
+
+
+def test_resumption_token():
+    token = encode_resumption_token(["411100", "nr_nresults-nr-nresults-v1.0.0"])
+    assert decode_resumption_token(token) == ["411100", "nr_nresults-nr-nresults-v1.0.0"]
+    with pytest.raises(ValueError):
+        decode_resumption_token("not a token")
+    with pytest.raises(ValueError):
+        decode_resumption_token(encode_resumption_token(["411100"]))
+
+
+def test_ndjson_lines(app):
+    lines = list(ndjson_lines(make_hits()))
+    assert len(lines) == 2
+    first = json.loads(lines[0])
+    assert first["id"] == "uuid-1"
+    assert first["metadata"]["control_number"] == "1"
+    assert decode_resumption_token(first["resumption_token"])[0] == "1"
+
+
+def test_csv_lines(app):
+    rows = list(csv.reader(io.StringIO(
+        "".join(csv_lines(make_hits(), fields=["control_number", "title",
+                                               "_administration.primaryCommunity"])))))
+    assert rows[0] == ["control_number", "title", "_administration.primaryCommunity",
+                       "resumption_token"]
+    assert rows[1][:3] == ["1", '[{"cs": "Záznam"}]', "nr"]
+    assert len(rows) == 3
+
+
+@pytest.mark.parametrize("size", ["0", "-5"])
+def test_export_rejects_non_positive_size(app, size):
+    view = export_view("nr_nresults-nr-nresults-v1.0.0", "invenio_records_rest.utils:allow_all")
+    with app.test_request_context(f"/nresults/export/?size={size}"):
+        with pytest.raises(BadRequest):
+            view()
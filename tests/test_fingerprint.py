@@ -0,0 +1,83 @@
+import uuid
+
+from invenio_db import db as db_
+from oarepo_references.models import RecordReference, ReferencingRecord
+
+from nr_nresults.fingerprint import content_fingerprint, content_fingerprints
+from nr_nresults.indexer import NResultsBulkIndexer
+from nr_nresults.proxies import current_nresults
+from nr_nresults.record import DraftNResultRecord
+
+
+def record_references(record_uuid):
+    return {
+        r.reference for r in RecordReference.query.join(
+            ReferencingRecord, RecordReference.record_id == ReferencingRecord.id)
+        .filter(ReferencingRecord.record_uuid == record_uuid)
+    }
+
+
+def test_content_fingerprint():
+    assert content_fingerprint({'a': 1, 'b': [1, {'c': 2}]}) == \
+           content_fingerprint({'b': [1, {'c': 2}], 'a': 1})
+    assert content_fingerprint({'a': 1, 'b': 2}, exclude=('b',)) == content_fingerprint({'a': 1})
+    fingerprints = content_fingerprints({'title': 'x', '_communities': ['a']})
+    assert fingerprints['metadata'] == content_fingerprint({'title': 'x'})
+    assert fingerprints['administration'] == content_fingerprint({'_communities': ['a']})
+
+
+def test_unchanged_commit_skips_validation(app, db, taxonomy_tree, base_json, base_nresult):
+    data = {**base_json, **base_nresult, 'control_number': '411500'}
+    record = DraftNResultRecord.create(data=data, id_=uuid.uuid4())
+    db_.session.commit()
+    references = record_references(record.id)
+    assert references
+
+    stats = current_nresults.fingerprint_stats
+    stats.clear()
+    cache = current_nresults.taxonomy_cache
+    cache.invalidate()
+
+    record = DraftNResultRecord.get_record(record.id)
+    record.commit()
+    assert stats.as_dict()['metadata'] == {'performed': 0, 'skipped': 1}
+    assert stats.as_dict()['administration'] == {'performed': 0, 'skipped': 1}
+    assert len(cache) == 0
+    assert record['oarepo:validity']['valid']
+    assert record_references(record.id) == references
+
+    # community re-assignment validates only against the JSON schema
+    record['_communities'] = ['other']
+    record.commit()
+    assert stats.as_dict()['metadata'] == {'performed': 0, 'skipped': 2}
+    assert stats.as_dict()['administration'] == {'performed': 1, 'skipped': 1}
+
+    record['N_technicalParameters'] = 'Nový popis'
+    record.commit()
+    assert stats.as_dict()['metadata'] == {'performed': 1, 'skipped': 2}
+
+    # commits updating references are always validated whole
+    record.commit(renamed_reference={
+        'old_url': 'http://127.0.0.1:5000/2.0/taxonomies/test_taxonomy/a',
+        'new_url': 'http://127.0.0.1:5000/2.0/taxonomies/test_taxonomy/a'
+    })
+    assert stats.as_dict()['metadata'] == {'performed': 2, 'skipped': 2}
+    db_.session.commit()
+
+
+def test_unchanged_record_not_indexed_again(app, db, taxonomy_tree, base_json, base_nresult):
+    data = {**base_json, **base_nresult, 'control_number': '411501'}
+    record = DraftNResultRecord.create(data=data, id_=uuid.uuid4())
+    db_.session.commit()
+
+    stats = current_nresults.fingerprint_stats
+    stats.clear()
+    indexer = NResultsBulkIndexer()
+    record = DraftNResultRecord.get_record(record.id)
+    # the index may be missing or stale, a loaded record is always indexed
+    assert indexer.needs_indexing(record)
+    indexer.mark_indexed(record)
+    assert indexer.bulk_index_records([record]) == (0, [])
+    record['N_technicalParameters'] = 'Nový popis'
+    assert indexer.needs_indexing(record)
+    assert stats.as_dict()['index'] == {'performed': 2, 'skipped': 1}
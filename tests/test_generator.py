@@ -0,0 +1,30 @@
+import io
+import json
+
+from nr_nresults.generator import create_taxonomy_terms, generate_records, write_ndjson
+from nr_nresults.marshmallow import NResultsMetadataSchemaV1
+
+
+def test_generate_records_deterministic():
+    first = list(generate_records(50, seed=42))
+    assert first == list(generate_records(50, seed=42))
+    assert first != list(generate_records(50, seed=43))
+    assert [r['control_number'] for r in generate_records(3, start=10)] == ['10', '11', '12']
+
+
+def test_generated_records_valid(app, db):
+    create_taxonomy_terms()
+    db.session.commit()
+    for record in generate_records(20, seed=1):
+        data = NResultsMetadataSchemaV1().load(record)
+        assert data['N_type'][0]['title']
+        assert len(data['N_technicalParameters']) <= 3000
+        assert len(data['N_economicalParameters']) <= 1024
+
+
+def test_write_ndjson():
+    stream = io.StringIO()
+    assert write_ndjson(stream, generate_records(5, seed=1)) == 5
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 5
+    assert json.loads(lines[0]) == next(generate_records(1, seed=1))
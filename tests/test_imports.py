@@ -0,0 +1,59 @@
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = (
+    'nr_nresults.record',
+    'nr_nresults.search',
+    'nr_nresults.indexer',
+    'nr_nresults.marshmallow',
+    'nr_nresults.providers',
+    'nr_common.search',
+    'oarepo_communities.links',
+    'oarepo_taxonomies.marshmallow',
+    'invenio_records',
+    'invenio_indexer',
+)
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import nr_nresults, nr_nresults.config, nr_nresults.views, nr_nresults.tasks
+duration = time.perf_counter() - start
+print(json.dumps({{'duration': duration,
+                  'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def import_in_subprocess():
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def test_package_import_is_lazy():
+    result = import_in_subprocess()
+    assert result['loaded'] == []
+
+
+def test_endpoint_classes_are_import_strings():
+    from nr_nresults import config
+    from invenio_base.utils import obj_or_import_string
+    from nr_nresults.indexer import NResultsQueuedIndexer
+    from nr_nresults.search import NResultsRecordsSearch
+
+    for endpoints in (config.RECORDS_DRAFT_ENDPOINTS, config.RECORDS_REST_ENDPOINTS):
+        for endpoint in endpoints.values():
+            for key in ('search_class', 'indexer_class', 'search_factory_imp', 'links_factory_imp'):
+                if key in endpoint:
+                    assert isinstance(endpoint[key], str)
+                    assert obj_or_import_string(endpoint[key])
+            assert obj_or_import_string(endpoint.get('search_class', NResultsRecordsSearch))
+    assert obj_or_import_string('nr_nresults.indexer:NResultsQueuedIndexer') is NResultsQueuedIndexer
+
+
+def test_lazy_state(app):
+    state = app.extensions['nr-nresults']
+    assert 'taxonomy_cache' not in state.__dict__
+    state.taxonomy_changed(None, taxonomy=None)
+    assert 'taxonomy_cache' not in state.__dict__
+    assert state.taxonomy_cache is state.taxonomy_cache
@@ -0,0 +1,55 @@
+import uuid
+
+from nr_nresults.marshmallow import NResultsMetadataSchemaV1
+from nr_nresults.marshmallow.incremental import PrevalidatedField, PrevalidatedTaxonomyField, \
+    incremental_schema, patched_fields
+from nr_nresults.proxies import current_nresults
+from nr_nresults.record import DraftNResultRecord
+
+
+def test_patched_fields():
+    assert patched_fields([
+        {'op': 'replace', 'path': '/N_technicalParameters', 'value': 'text'},
+        {'op': 'add', 'path': '/keywords/-', 'value': {'cs': '4'}},
+        {'op': 'move', 'from': '/titleAlternate/0', 'path': '/title/1'},
+    ]) == {'N_technicalParameters', 'keywords', 'titleAlternate', 'title'}
+    assert patched_fields([{'op': 'replace', 'path': '', 'value': {}}]) is None
+
+
+def test_incremental_schema():
+    schema = incremental_schema(NResultsMetadataSchemaV1, frozenset({'N_technicalParameters',
+                                                                     'keywords'}))
+    fields = schema._declared_fields
+    original = NResultsMetadataSchemaV1._declared_fields
+    assert fields['N_technicalParameters'] is original['N_technicalParameters']
+    assert fields['keywords'] is original['keywords']
+    assert fields['subject'] is original['subject']
+    assert isinstance(fields['N_type'], PrevalidatedTaxonomyField)
+    assert fields['N_type'].required
+    assert isinstance(fields['dateIssued'], PrevalidatedField)
+    assert incremental_schema(NResultsMetadataSchemaV1,
+                              frozenset({'keywords', 'N_technicalParameters'})) is schema
+
+
+def test_patch_validates_touched_fields(app, db, taxonomy_tree, base_json, base_nresult):
+    data = {**base_json, **base_nresult, 'control_number': '411400'}
+    record = DraftNResultRecord.create(data=data, id_=uuid.uuid4())
+    assert record['oarepo:validity']['valid']
+
+    cache = current_nresults.taxonomy_cache
+    cache.invalidate()
+    patched = record.patch([
+        {'op': 'replace', 'path': '/N_technicalParameters', 'value': 'Nový popis'}])
+    patched.commit()
+    assert patched['oarepo:validity']['valid']
+    assert patched['N_technicalParameters'] == 'Nový popis'
+    # no taxonomy field was dereferenced again, their references are kept
+    assert len(cache) == 0
+    references = {r['reference'] for r in patched.oarepo_references}
+    assert 'http://127.0.0.1:5000/2.0/taxonomies/test_taxonomy/a' in references
+    assert 'MARSHMALLOW_SCHEMA' not in patched.__dict__
+
+    invalid = patched.patch([
+        {'op': 'replace', 'path': '/N_technicalParameters', 'value': 'x' * 3001}])
+    invalid.commit()
+    assert not invalid['oarepo:validity']['valid']
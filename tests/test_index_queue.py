@@ -0,0 +1,134 @@
+import time
+import uuid
+
+import pytest
+from invenio_db import db as db_
+
+from nr_nresults import index_queue
+from nr_nresults.index_queue import coalesce, process_index_queue
+from nr_nresults.indexer import NResultsBulkIndexer, NResultsQueuedIndexer
+from nr_nresults.record import DraftNResultRecord
+
+
+class Message:
+    def __init__(self, payload):
+        self.payload = payload
+        self.state = None
+
+    def decode(self):
+        return self.payload
+
+    def ack(self):
+        self.state = 'ack'
+
+    def requeue(self):
+        self.state = 'requeue'
+
+
+@pytest.fixture()
+def published(monkeypatch):
+    published = []
+    monkeypatch.setattr(index_queue, 'publish',
+                        lambda payloads, failed=False: published.extend((failed, p) for p in payloads))
+    return published
+
+
+def test_queued_after_commit(app, db, taxonomy_tree, base_json, base_nresult, published):
+    data = {**base_json, **base_nresult, 'control_number': '411600'}
+    record = DraftNResultRecord.create(data=data, id_=uuid.uuid4())
+    indexer = NResultsQueuedIndexer()
+
+    with db_.session.begin_nested():
+        indexer.index(record)
+    indexer.index(record)
+    # neither the released savepoint nor the record being saved again publish anything
+    assert published == []
+    db_.session.commit()
+    assert [(failed, p['id'], p['op']) for failed, p in published] == [(False, str(record.id), 'index')]
+    assert published[0][1]['enqueued'] <= time.time()
+
+    published.clear()
+    indexer.index(record)
+    db_.session.rollback()
+    db_.session.commit()
+    assert published == []
+
+
+def test_coalesce():
+    record_id = str(uuid.uuid4())
+    operations = coalesce([
+        {'id': record_id, 'op': 'index', 'stale_routing': 'a', 'attempts': 2},
+        {'id': str(uuid.uuid4()), 'op': 'index'},
+        {'id': record_id, 'op': 'delete', 'stale_routing': None, 'attempts': 0},
+    ])
+    assert len(operations) == 2
+    assert operations[record_id] == {'id': record_id, 'op': 'delete', 'stale_routing': 'a',
+                                     'attempts': 2}
+    assert list(operations)[-1] == record_id
+
+
+def test_failed_operations_retried_then_given_up(app, monkeypatch, published):
+    ok_id, failing_id = str(uuid.uuid4()), str(uuid.uuid4())
+    messages = [
+        Message({'id': ok_id, 'op': 'delete', 'delete_action': {'_id': ok_id}}),
+        Message({'id': failing_id, 'op': 'delete', 'delete_action': {'_id': failing_id}}),
+        Message({'id': failing_id, 'op': 'delete', 'delete_action': {'_id': failing_id},
+                 'attempts': 1}),
+    ]
+    monkeypatch.setattr(index_queue, 'consume', lambda batch_size, failed=False: iter([messages]))
+    monkeypatch.setattr(NResultsBulkIndexer, 'send_actions',
+                        lambda self, actions: (1, [{'delete': {'_id': failing_id, 'status': 500}}]))
+
+    with app.app_context():
+        result = process_index_queue(max_retries=2)
+    assert result == (1, 1, 0, 1, 0)
+    assert [(failed, p['id'], p['attempts']) for failed, p in published] == [(False, failing_id, 2)]
+    # the second attempt waits twice the backoff
+    delay = published[0][1]['not_before'] - time.time()
+    assert 0 < delay <= 2 * app.config['NRESULTS_INDEX_QUEUE_BACKOFF']
+    assert all(m.state == 'ack' for m in messages)
+
+    published.clear()
+    for m in messages:
+        m.state = None
+    with app.app_context():
+        result = process_index_queue(max_retries=1)
+    assert result.failed == 1
+    assert [(failed, p['id']) for failed, p in published] == [(True, failing_id)]
+
+
+def test_unconfirmed_batch_stays_queued(app, monkeypatch, published):
+    messages = [Message({'id': str(uuid.uuid4()), 'op': 'delete', 'delete_action': {}})]
+    monkeypatch.setattr(index_queue, 'consume', lambda batch_size, failed=False: iter([messages]))
+
+    def unreachable(self, actions):
+        raise ConnectionError('elasticsearch is down')
+
+    monkeypatch.setattr(NResultsBulkIndexer, 'send_actions', unreachable)
+    with app.app_context(), pytest.raises(ConnectionError):
+        process_index_queue()
+    assert messages[0].state == 'requeue'
+    assert published == []
+
+
+def test_operations_wait_for_window_and_backoff(app, monkeypatch, published):
+    now = time.time()
+    due_id, saved_id, retried_id = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+    messages = [
+        Message({'id': due_id, 'op': 'delete', 'delete_action': {'_id': due_id}, 'enqueued': now - 60}),
+        # saved again within the window, waits for further saves
+        Message({'id': saved_id, 'op': 'delete', 'delete_action': {'_id': saved_id}, 'enqueued': now}),
+        Message({'id': retried_id, 'op': 'delete', 'delete_action': {'_id': retried_id},
+                 'enqueued': now - 60, 'attempts': 1, 'not_before': now + 60}),
+    ]
+    monkeypatch.setattr(index_queue, 'consume', lambda batch_size, failed=False: iter([messages]))
+    sent = []
+    monkeypatch.setattr(NResultsBulkIndexer, 'send_actions',
+                        lambda self, actions: (sent.extend(actions), (len(actions), []))[1])
+
+    with app.app_context():
+        result = process_index_queue()
+    assert sent == [{'_id': due_id}]
+    assert (result.sent, result.waiting, result.retried) == (1, 2, 0)
+    assert sorted(p['id'] for failed, p in published) == sorted([saved_id, retried_id])
+    assert all(m.state == 'ack' for m in messages)
@@ -0,0 +1,97 @@
+import json
+import os
+
+from oarepo_mapping_includes.mapping_transformer import process
+
+from nr_nresults import mapping_artifact
+from nr_nresults.constants import published_index_name
+from nr_nresults.mapping_artifact import META_KEY, SOURCE_MAPPING, artifact_status, \
+    build_artifact, mapping_hash, mapping_package_versions, use_artifact
+
+
+def test_build_artifact(app, tmpdir):
+    path = str(tmpdir.join('artifact.json'))
+    status = build_artifact(app, path)
+    assert status.valid
+    with open(path) as f:
+        artifact = json.load(f)
+    assert artifact['mappings']['_meta'][META_KEY]['mapping_hash'] == status.mapping_hash
+    assert mapping_hash(artifact) == status.mapping_hash
+
+    with open(process(app.extensions['oarepo-mapping-includes'], str(tmpdir), SOURCE_MAPPING)) as f:
+        expanded = json.load(f)
+    assert mapping_hash(expanded) == status.mapping_hash
+    assert 'oarepo:extends' not in json.dumps(artifact)
+    assert artifact_status(path).valid
+
+
+def test_modified_artifact_detected(app, tmpdir):
+    path = str(tmpdir.join('artifact.json'))
+    build_artifact(app, path)
+    with open(path) as f:
+        artifact = json.load(f)
+    artifact['mappings']['properties']['N_internalID']['type'] = 'text'
+    with open(path, 'w') as f:
+        json.dump(artifact, f)
+
+    status = artifact_status(path)
+    assert not status.valid
+    assert status.reason == 'modified after it was built'
+    # the app load does not hash the artifact, check-mapping does
+    assert artifact_status(path, verify_content=False).valid
+
+
+def test_stale_artifact_not_used(app, tmpdir):
+    path = str(tmpdir.join('artifact.json'))
+    build_artifact(app, path)
+    with open(path) as f:
+        artifact = json.load(f)
+    artifact['mappings']['_meta'][META_KEY]['source_hash'] = 'built-from-older-sources'
+    with open(path, 'w') as f:
+        json.dump(artifact, f)
+
+    assert artifact_status(path).reason == 'source mapping changed, rebuild it'
+
+
+def test_artifact_stale_after_package_upgrade(app, tmpdir, monkeypatch):
+    packages = dict(mapping_package_versions())
+    # this package and nr-common provide mapping includes
+    assert 'techlib-nr-nresults' in packages
+    path = str(tmpdir.join('artifact.json'))
+    build_artifact(app, path)
+    assert artifact_status(path).valid
+
+    upgraded = sorted({**packages, 'techlib-nr-common': '99.0.0'}.items())
+    monkeypatch.setattr(mapping_artifact, 'mapping_package_versions', lambda: upgraded)
+    assert artifact_status(path, verify_content=False).reason == 'source mapping changed, rebuild it'
+
+
+def test_use_artifact(app, tmpdir):
+    mappings = app.extensions['invenio-search'].mappings
+    previous = mappings[published_index_name]
+    app.config['NRESULTS_MAPPING_ARTIFACT'] = str(tmpdir.join('missing.json'))
+    assert use_artifact(app) is None
+    assert mappings[published_index_name] == previous
+
+    path = str(tmpdir.join('artifact.json'))
+    app.config['NRESULTS_MAPPING_ARTIFACT'] = path
+    build_artifact(app)
+    try:
+        assert use_artifact(app).valid
+        assert mappings[published_index_name] == path
+    finally:
+        mappings[published_index_name] = previous
+
+    with open(path, 'w') as f:
+        f.write('{')
+    assert not use_artifact(app).valid
+    assert mappings[published_index_name] == previous
+    assert os.path.exists(previous)
+
+
+def test_mapping_hash_ignores_artifact_meta():
+    mapping = {'mappings': {'properties': {'a': {'type': 'keyword'}}}}
+    with_meta = {'mappings': {'properties': {'a': {'type': 'keyword'}},
+                              '_meta': {META_KEY: {'mapping_hash': 'x'}}}}
+    assert mapping_hash(mapping) == mapping_hash(with_meta)
+    assert mapping_hash(mapping) != mapping_hash({'mappings': {'properties': {'a': {'type': 'text'}}}})
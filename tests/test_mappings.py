@@ -2,6 +2,8 @@ import json
 import uuid
 from pprint import pprint
 
+from oarepo_mapping_includes.mapping_transformer import process
+
 
 def test_mapping_1(app, es, es_index, base_json_dereferenced, base_nresult_dereferenced):
     mappings = app.extensions["invenio-search"].mappings
@@ -18,10 +20,32 @@ def test_mapping_1(app, es, es_index, base_json_dereferenced, base_nresult_deref
     response = es.index(
         index=index_name,
         body=record,
-        id=uuid_
+        id=uuid_,
+        routing=str(uuid_)
     )
     print("\n", "RESPONSE", "\n", response)
-    es_record = es.get(index_name, id=uuid_)
+    es_record = es.get(index_name, id=uuid_, routing=str(uuid_))
     print("\n" * 5)
     pprint(es_record["_source"])
-    assert es_record["_source"] == record
\ No newline at end of file
+    assert es_record["_source"] == record
+
+def test_title_indexed_with_offsets(app, tmpdir):
+    mapping_path = app.extensions["invenio-search"].mappings['nr_nresults-nr-nresults-v1.0.0']
+    processed = process(app.extensions['oarepo-mapping-includes'], str(tmpdir), mapping_path)
+    with open(processed, "r") as f:
+        title = json.load(f)["mappings"]["properties"]["title"]
+    for language in ("cs", "en", "_"):
+        assert title["properties"][language]["type"] == "text"
+        assert title["properties"][language]["index_options"] == "offsets"
+
+
+def test_control_number_sorts_numerically(app, tmpdir):
+    mapping_path = app.extensions["invenio-search"].mappings['nr_nresults-nr-nresults-v1.0.0']
+    processed = process(app.extensions['oarepo-mapping-includes'], str(tmpdir), mapping_path)
+    with open(processed, "r") as f:
+        mapping = json.load(f)
+    control_number = mapping["mappings"]["properties"]["control_number"]
+    assert control_number["type"] == "keyword"
+    assert control_number["fields"]["long"]["type"] == "long"
+    # index sorting is not supported with the nested taxonomy fields
+    assert not any(key.startswith("index.sort") for key in mapping["settings"])
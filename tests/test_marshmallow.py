@@ -1,7 +1,8 @@
 import pytest
 from marshmallow import ValidationError
 
-from nr_nresults.marshmallow import NResultsMetadataSchemaV1
+from nr_nresults.marshmallow import NResultsMetadataSchemaV1, load_many
+from nr_nresults.marshmallow.batch import collect_taxonomy_references
 
 
 class TestAllFields:
@@ -240,3 +241,34 @@ class TestTechnicalParameters:
         schema = NResultsMetadataSchemaV1()
         with pytest.raises(ValidationError):
             schema.load(base_json)
+
+
+class TestLoadMany:
+    def test_load_many(self, app, db, taxonomy_tree, base_json, base_json_dereferenced,
+                       base_nresult, base_nresult_dereferenced):
+        base_json.update(base_nresult)
+        base_json_dereferenced.update(base_nresult_dereferenced)
+        invalid = {**base_json, "N_technicalParameters": "a" * 3001}
+        unknown_term = {**base_json, "N_type": [{
+            "links": {
+                "self": "http://127.0.0.1:5000/2.0/taxonomies/test_taxonomy/unknown"
+            }
+        }]}
+
+        results = load_many([base_json, invalid, base_json, unknown_term])
+
+        assert len(results) == 4
+        assert results[0].data == base_json_dereferenced
+        assert results[0].errors is None
+        assert results[1].data is None
+        assert "N_technicalParameters" in results[1].errors
+        assert results[2].data == base_json_dereferenced
+        assert results[3].data is None
+        assert results[3].errors
+
+    def test_collect_taxonomy_references(self, base_json, base_nresult):
+        base_json.update(base_nresult)
+        references = collect_taxonomy_references([base_json, base_json])
+        assert ("test_taxonomy", "a") in references
+        assert ("test_taxonomy", "mdcr") in references
+        assert len(references) == 7
@@ -0,0 +1,71 @@
+import uuid
+
+from nr_nresults.metrics import NULL_TIMER, MetricsRegistry, stage_timer
+from nr_nresults.proxies import current_nresults
+from nr_nresults.record import DraftNResultRecord
+from nr_nresults.signals import stage_timed
+
+
+def test_registry_render():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.observe('validate', 0.05)
+    registry.observe('validate', 0.5)
+    registry.observe('validate', 5)
+    registry.register_gauge('nr_nresults_index_queue_depth', 'Queued records.', lambda: 3)
+    lines = registry.render().splitlines()
+    assert 'nr_nresults_stage_duration_seconds_bucket{stage="validate",le="0.1"} 1' in lines
+    assert 'nr_nresults_stage_duration_seconds_bucket{stage="validate",le="1.0"} 2' in lines
+    assert 'nr_nresults_stage_duration_seconds_bucket{stage="validate",le="+Inf"} 3' in lines
+    assert 'nr_nresults_stage_duration_seconds_count{stage="validate"} 3' in lines
+    assert 'nr_nresults_index_queue_depth 3.0' in lines
+    assert registry.as_dict() == {'validate': {'count': 3, 'sum': 5.55}}
+
+
+def test_failing_gauge_skipped():
+    registry = MetricsRegistry(buckets=(0.1,))
+
+    def unreachable():
+        raise ConnectionError('broker is down')
+
+    registry.register_gauge('nr_nresults_index_queue_depth', 'Queued records.', unreachable)
+    registry.register_gauge('nr_nresults_index_queue_lag_seconds', 'Lag.', lambda: 1.5)
+    lines = registry.render().splitlines()
+    assert 'nr_nresults_index_queue_lag_seconds 1.5' in lines
+    assert not any(line.startswith('nr_nresults_index_queue_depth') for line in lines)
+
+
+def test_index_queue_gauges_registered(app):
+    assert {'nr_nresults_index_queue_depth', 'nr_nresults_index_queue_failed_depth',
+            'nr_nresults_index_queue_lag_seconds'} <= set(current_nresults.metrics._gauges)
+
+
+def test_disabled_metrics(app):
+    state = current_nresults._get_current_object()
+    metrics, state.metrics = state.metrics, None
+    try:
+        assert stage_timer('validate') is NULL_TIMER
+    finally:
+        state.metrics = metrics
+
+
+def test_record_stages_timed(app, db, taxonomy_tree, base_json, base_nresult):
+    metrics = current_nresults.metrics
+    metrics.clear()
+    timed = []
+
+    def receiver(sender, stage=None, **kwargs):
+        timed.append(stage)
+
+    stage_timed.connect(receiver)
+    try:
+        data = {**base_json, **base_nresult, 'control_number': '411700'}
+        record = DraftNResultRecord.create(data=data, id_=uuid.uuid4())
+        record['N_technicalParameters'] = 'Nový popis'
+        record.commit()
+    finally:
+        stage_timed.disconnect(receiver)
+
+    stages = metrics.as_dict()
+    for stage in ('create', 'commit', 'validate', 'marshmallow', 'jsonschema', 'persist'):
+        assert stages[stage]['count'] >= 1, stage
+    assert set(stages) == set(timed)
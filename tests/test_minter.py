@@ -3,6 +3,7 @@ import uuid
 from invenio_pidstore.models import PersistentIdentifier
 
 from nr_nresults.minters import nr_nresults_id_minter
+from nr_nresults.providers import IdBlockAllocator
 from nr_nresults.record import PublishedNResultRecord
 from tests.conftest import TestRecord
 
@@ -31,3 +32,37 @@ def test_nr_id_minter(app, db):
 def test_entry_points(app):
     assert 'nr_nresults' in app.extensions['invenio-pidstore'].minters.keys()
     assert 'dnrnrs_minter' in app.extensions['invenio-pidstore'].minters.keys()
+
+
+def test_nr_block_id_minter(app, db):
+    state = app.extensions['nr-nresults']
+    state.id_block_allocator = IdBlockAllocator(3)
+    try:
+        control_numbers = []
+        for _ in range(4):
+            data = {
+                "title": "Test",
+                "resourceType": [
+                    {
+                        "is_ancestor": False,
+                        "links": {
+                            "self": "https://example.com/taxonomies/parent/certified-methodologies"
+                        }
+                    }
+                ]
+            }
+            record = TestRecord.create(data=data)
+            pid = nr_nresults_id_minter(record_uuid=record.id, data=data)
+            assert pid.pid_value == data["control_number"]
+            assert pid.pid_type == "nrnrs"
+            assert pid.object_uuid == record.id
+            control_numbers.append(int(data["control_number"]))
+        db.session.commit()
+        assert len(set(control_numbers)) == 4
+        assert control_numbers == sorted(control_numbers)
+        stats = state.id_block_allocator.stats()
+        assert stats["blocks_reserved"] == 2
+        assert stats["ids_issued"] == 4
+        assert stats["ids_available"] == 2
+    finally:
+        state.id_block_allocator = None
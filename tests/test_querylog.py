@@ -0,0 +1,59 @@
+import logging
+
+from nr_nresults.constants import prefixed_published_index_name
+from nr_nresults.querylog import QueryLog, normalize_query, query_fingerprint
+from nr_nresults.search import NResultsRecordsSearch
+
+
+class RawResponse:
+    def __init__(self, raw):
+        self.raw = raw
+
+    def to_dict(self):
+        return self.raw
+
+
+def test_normalize_query():
+    assert normalize_query({
+        'query': {'bool': {'must': [{'query_string': {'query': 'mapa', 'default_operator': 'AND'}}],
+                           'filter': [{'terms': {'N_type.links.self': ['a', 'b', 'c']}}]}},
+        'aggs': {'N_type': {'terms': {'field': 'N_type.links.self', 'size': 100}}}
+    }) == {
+        'query': {'bool': {'must': [{'query_string': {'query': '?', 'default_operator': 'AND'}}],
+                           'filter': [{'terms': {'N_type.links.self': ['?']}}]}},
+        'aggs': {'N_type': {'terms': {'field': 'N_type.links.self', 'size': '?'}}}
+    }
+
+
+def test_query_fingerprint():
+    fingerprint, _ = query_fingerprint(['idx'], {'query': {'match': {'title': 'mapa'}}, 'from': 10})
+    assert fingerprint == query_fingerprint(['idx'], {'query': {'match': {'title': 'eroze'}}})[0]
+    assert fingerprint != query_fingerprint(['idx'], {'query': {'match': {'abstract': 'mapa'}}})[0]
+    assert fingerprint != query_fingerprint(['other'], {'query': {'match': {'title': 'mapa'}}})[0]
+
+
+def test_slow_query_logged(app, caplog):
+    query_log = QueryLog(threshold=0.5, max_fingerprints=2)
+    response = RawResponse({'took': 700, 'hits': {'total': {'value': 2}, 'hits': [
+        {'_source': {'title': 'a'}}, {'_source': {'title': 'b'}}]}})
+    with app.test_request_context('/nr/nresults/?q=mapa'):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        with caplog.at_level(logging.WARNING, logger='nr-nresults-slow-queries'):
+            query_log.record(search, response, 0.1)
+            assert not caplog.records
+            query_log.record(search, response, 0.75)
+        assert len(caplog.records) == 1
+        assert '750 ms (took 700 ms)' in caplog.records[0].getMessage()
+        assert '2 hits' in caplog.records[0].getMessage()
+
+        stats = query_log.as_dict()
+        assert len(stats) == 1
+        latency = next(iter(stats.values()))
+        assert latency['count'] == 2
+        assert latency['max_ms'] == 750
+        assert latency['p99_ms'] == 750
+
+        # the least recently executed fingerprints are dropped
+        query_log.record(search.sort('control_number'), response, 0.1)
+        query_log.record(search.sort('dateIssued'), response, 0.1)
+        assert len(query_log.as_dict()) == 2
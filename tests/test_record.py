@@ -2,7 +2,10 @@ import uuid
 
 from future.backports.urllib.parse import urlparse
 
-from nr_nresults.record import PublishedNResultRecord
+from flask import url_for
+from oarepo_communities.converters import CommunityPIDValue
+
+from nr_nresults.record import PublishedNResultRecord, DraftNResultRecord, AllNResultRecord
 
 
 def test_record(app, db, base_json, base_nresult, taxonomy_tree):
@@ -12,3 +15,26 @@ def test_record(app, db, base_json, base_nresult, taxonomy_tree):
     record = PublishedNResultRecord.create(data=data, id_=record_id)
     url = record.canonical_url
     assert url == 'http://127.0.0.1:5000/nr/nresults/411100'
+
+
+def test_canonical_url_matches_url_for(app, db, base_json, base_nresult, taxonomy_tree):
+    data = {**base_json, **base_nresult, "control_number": "411101"}
+    record = DraftNResultRecord.create(data=data, id_=uuid.uuid4())
+    assert record.canonical_url == url_for(
+        'invenio_records_rest.draft-nresults-community_item',
+        pid_value=CommunityPIDValue("411101", "nr"),
+        _external=True)
+
+    all_record = AllNResultRecord({k: v for k, v in record.items() if k != 'oarepo:draft'})
+    assert all_record.canonical_url == url_for(
+        'invenio_records_rest.nresults-community_item',
+        pid_value=CommunityPIDValue("411101", "nr"),
+        _external=True)
+
+
+def test_canonical_url_memoized(app, db, base_json, base_nresult, taxonomy_tree):
+    data = {**base_json, **base_nresult, "control_number": "411102"}
+    record = PublishedNResultRecord.create(data=data, id_=uuid.uuid4())
+    assert record.canonical_url == 'http://127.0.0.1:5000/nr/nresults/411102'
+    record['control_number'] = "411103"
+    assert record.canonical_url == 'http://127.0.0.1:5000/nr/nresults/411103'
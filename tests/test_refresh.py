@@ -0,0 +1,98 @@
+import uuid
+
+from flask_taxonomies.proxies import current_flask_taxonomies
+from flask_taxonomies.term_identification import TermIdentification
+from invenio_db import db as db_
+
+from nr_nresults.record import PublishedNResultRecord
+from nr_nresults.refresh import referencing_records, refresh_records
+
+N_TYPE_URL = 'http://127.0.0.1:5000/2.0/taxonomies/test_taxonomy/a'
+
+
+def test_refresh_records(app, db, taxonomy_tree, base_json, base_nresult):
+    app.config['NRESULTS_REFRESH_ON_TERM_CHANGE'] = False
+    data = {**base_json, **base_nresult, 'control_number': '411300'}
+    record = PublishedNResultRecord.create(data=data, id_=uuid.uuid4())
+    db_.session.commit()
+
+    affected = referencing_records(N_TYPE_URL)
+    assert affected[record.id][1] == {N_TYPE_URL}
+    assert record.id not in referencing_records(
+        'http://127.0.0.1:5000/2.0/taxonomies/test_taxonomy/c_abf2')
+
+    term = current_flask_taxonomies.filter_term(
+        TermIdentification(taxonomy='test_taxonomy', slug='a')).one()
+    original = term.extra_data
+    term.extra_data = {'title': {'cs': 'certifikovaná metodika (NmetC) - změněno'}}
+    db_.session.commit()
+    progress = []
+    try:
+        result = refresh_records(N_TYPE_URL, batch_size=1, index=False, progress=progress.append)
+    finally:
+        term.extra_data = original
+        db_.session.commit()
+        app.config['NRESULTS_REFRESH_ON_TERM_CHANGE'] = True
+
+    assert result.total == len(affected)
+    assert result.refreshed == result.total
+    assert not result.errors
+    assert len(progress) == result.total
+    refreshed = PublishedNResultRecord.get_record(record.id)
+    assert refreshed['N_type'][0]['title'] == {'cs': 'certifikovaná metodika (NmetC) - změněno'}
+
+
+def test_term_refresh_scheduled_after_commit(app, db, taxonomy_tree, monkeypatch):
+    from nr_nresults.tasks import refresh_term_references
+
+    scheduled = []
+    monkeypatch.setattr(refresh_term_references.app.conf, 'task_always_eager', False)
+    monkeypatch.setattr(refresh_term_references, 'delay', scheduled.append)
+
+    state = app.extensions['nr-nresults']
+    term = current_flask_taxonomies.filter_term(
+        TermIdentification(taxonomy='test_taxonomy', slug='a')).one()
+    with db_.session.begin_nested():
+        state.term_updated(None, term=term)
+        state.term_updated(None, term=term)
+    assert scheduled == []
+    db_.session.commit()
+    assert scheduled == [N_TYPE_URL]
+
+    scheduled.clear()
+    state.term_updated(None, term=term)
+    db_.session.rollback()
+    savepoint = db_.session.begin_nested()
+    state.term_updated(None, term=term)
+    savepoint.rollback()
+    db_.session.commit()
+    assert scheduled == []
+
+
+def test_taxonomy_refresh_replaced_only_if_configured(app, monkeypatch):
+    from flask_taxonomies.signals import after_taxonomy_term_updated, before_taxonomy_term_updated
+    from oarepo_taxonomies.signals import lock_term, taxonomy_term_update
+
+    from nr_nresults.tasks import refresh_term_references
+
+    def connected():
+        return taxonomy_term_update in list(after_taxonomy_term_updated.receivers_for(object()))
+
+    state = app.extensions['nr-nresults']
+    # NRESULTS_REPLACE_TAXONOMY_REFRESH is off by default
+    assert connected()
+    assert not state.taxonomy_refresh_replaced
+
+    monkeypatch.setattr(refresh_term_references.app.conf, 'task_always_eager', True)
+    state.replace_taxonomy_refresh()
+    assert connected()
+
+    monkeypatch.setattr(refresh_term_references.app.conf, 'task_always_eager', False)
+    state.replace_taxonomy_refresh()
+    try:
+        assert not connected()
+        assert state.taxonomy_refresh_replaced
+    finally:
+        after_taxonomy_term_updated.connect(taxonomy_term_update)
+        before_taxonomy_term_updated.connect(lock_term)
+        state.taxonomy_refresh_replaced = False
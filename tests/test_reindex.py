@@ -0,0 +1,66 @@
+import uuid
+from datetime import datetime
+
+from nr_nresults import reindex
+from nr_nresults.reindex import alias_actions, catch_up_until_complete, uuid_slices
+
+
+def test_uuid_slices():
+    slices = uuid_slices(4)
+    assert len(slices) == 4
+    assert slices[0][0] == uuid.UUID(int=0)
+    assert slices[-1][1] is None
+    # consecutive ranges, each uuid belongs to exactly one of them
+    for (_, upper), (lower, _) in zip(slices, slices[1:]):
+        assert upper == lower
+    assert uuid_slices(1) == [(uuid.UUID(int=0), None)]
+
+
+def test_alias_actions():
+    aliases = {'nr-all': {}, 'nr_nresults-nr-nresults-v1.0.0': {'is_write_index': True}}
+    assert alias_actions('nr_nresults-nr-nresults-v1.0.0-1', ['nr-all'], 'nr_nresults-nr-nresults-v1.0.0-2',
+                         aliases, 'nr_nresults-nr-nresults-v1.0.0') == [
+        {'remove': {'index': 'nr_nresults-nr-nresults-v1.0.0-1', 'alias': 'nr-all'}},
+        {'add': {'index': 'nr_nresults-nr-nresults-v1.0.0-2', 'alias': 'nr-all'}},
+        {'add': {'index': 'nr_nresults-nr-nresults-v1.0.0-2', 'alias': 'nr_nresults-nr-nresults-v1.0.0',
+                 'is_write_index': True}},
+    ]
+
+
+def test_alias_actions_unsuffixed_index():
+    # an index created without suffix is replaced by an alias of the same name
+    actions = alias_actions('nr_nresults-nr-nresults-v1.0.0', [], 'nr_nresults-nr-nresults-v1.0.0-2',
+                            {'nr_nresults-nr-nresults-v1.0.0': {}}, 'nr_nresults-nr-nresults-v1.0.0')
+    assert actions == [
+        {'remove_index': {'index': 'nr_nresults-nr-nresults-v1.0.0'}},
+        {'add': {'index': 'nr_nresults-nr-nresults-v1.0.0-2', 'alias': 'nr_nresults-nr-nresults-v1.0.0'}},
+    ]
+
+
+def test_catch_up_until_counts_agree(monkeypatch):
+    class Indices:
+        def refresh(self, index):
+            pass
+
+    class Client:
+        indices = Indices()
+        counts = iter([9, 12])
+
+        def count(self, index):
+            return {'count': next(self.counts)}
+
+    since = []
+    monkeypatch.setattr(reindex, 'current_search_client', Client())
+    monkeypatch.setattr(reindex, 'catch_up', lambda index, new_index, since_, batch_size:
+                        since.append(since_) or 2)
+    # a record is created between the first catch up and the counting
+    expected = iter([10, 12])
+    monkeypatch.setattr(reindex, 'expected_count', lambda index, old_index, source: next(expected))
+
+    start = datetime(2020, 1, 1)
+    caught_up, expected_docs, count, started = catch_up_until_complete(
+        'index', 'old', 'new', 'database', start, 100, progress=lambda message: None)
+    assert (caught_up, expected_docs, count) == (4, 12, 12)
+    # the second round catches up the writes since the first one started
+    assert since[0] == start and since[1] > start
+    assert started >= since[1]
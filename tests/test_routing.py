@@ -0,0 +1,111 @@
+import uuid
+
+from elasticsearch.helpers import bulk
+from invenio_db import db as db_
+from invenio_indexer.api import RecordIndexer
+
+from nr_nresults.indexer import NResultsBulkIndexer
+from nr_nresults.mapping_artifact import resolve_mapping
+from nr_nresults.record import DraftNResultRecord, PublishedNResultRecord
+from nr_nresults.routing import SHARED_ROUTING, community_routing
+from nr_nresults.search import NResultsRecordsSearch, nresults_community_search_factory
+
+
+def test_community_routing(app):
+    assert community_routing({'_primary_community': 'nr'}) == 'nr'
+    assert community_routing({'_primary_community': 'nr', '_communities': ['nr']}) == 'nr'
+    # shared records are found from the searches of all their communities
+    assert community_routing({'_primary_community': 'nr', '_communities': ['other']}) == SHARED_ROUTING
+    assert community_routing({}) == SHARED_ROUTING
+
+
+def test_community_search_routed(app):
+    app.config['NRESULTS_COMMUNITY_ROUTING'] = True
+    try:
+        with app.test_request_context('/nr/nresults/'):
+            from flask import request
+            request.view_args = {'community_id': 'nr'}
+            search, _ = nresults_community_search_factory(None, NResultsRecordsSearch())
+            assert search._params['routing'] == f'nr,{SHARED_ROUTING}'
+    finally:
+        app.config['NRESULTS_COMMUNITY_ROUTING'] = False
+
+
+def test_moved_record_deleted_from_old_routing(app, db, taxonomy_tree, base_json, base_nresult,
+                                               monkeypatch):
+    app.config['NRESULTS_COMMUNITY_ROUTING'] = True
+    try:
+        data = {**base_json, **base_nresult, 'control_number': '411600'}
+        record = DraftNResultRecord.create(data=data, id_=uuid.uuid4())
+        db_.session.commit()
+        record = DraftNResultRecord.get_record(record.id)
+        assert record.indexed_routing == 'nr'
+
+        sent = []
+        monkeypatch.setattr(NResultsBulkIndexer, 'send_actions',
+                            lambda self, actions, **kwargs: (sent.extend(actions), (len(actions), []))[1])
+        # shared with another community, the record moves to the shared routing
+        record['_communities'] = ['other']
+        record.commit()
+        NResultsBulkIndexer().bulk_index_records([record])
+        assert [(a['_op_type'], a.get('_routing') or a.get('routing')) for a in sent] == [
+            ('delete', 'nr'), ('index', SHARED_ROUTING)
+        ]
+        assert record.indexed_routing == SHARED_ROUTING
+        db_.session.commit()
+    finally:
+        app.config['NRESULTS_COMMUNITY_ROUTING'] = False
+
+
+def test_writes_routed_by_id_without_community_routing(app, db, taxonomy_tree, base_json, base_nresult):
+    data = {**base_json, **base_nresult, 'control_number': '411601'}
+    record = DraftNResultRecord.create(data=data, id_=uuid.uuid4())
+    indexer = NResultsBulkIndexer()
+    assert indexer.index_action(record)['routing'] == str(record.id)
+    assert indexer.delete_action(record)['_routing'] == str(record.id)
+    db_.session.commit()
+
+
+def test_unpublished_document_deleted_with_routing_after_commit(app, db, taxonomy_tree, base_json,
+                                                                base_nresult, monkeypatch):
+    from collections import namedtuple
+
+    data = {**base_json, **base_nresult, 'control_number': '411602'}
+    record = PublishedNResultRecord.create(data=data, id_=uuid.uuid4())
+    db_.session.commit()
+
+    sent = []
+    monkeypatch.setattr(NResultsBulkIndexer, 'send_actions',
+                        lambda self, actions, **kwargs: (sent.append((actions, kwargs)), (len(actions), []))[1])
+    Context = namedtuple('Context', ['record'])
+    Pair = namedtuple('Pair', ['published_context'])
+    app.extensions['nr-nresults'].records_unpublished([Pair(Context(record))])
+    assert sent == []
+    db_.session.commit()
+    assert sent == [([{'_op_type': 'delete', '_index': sent[0][0][0]['_index'], '_id': str(record.id),
+                       '_routing': str(record.id)}], {'refresh': True})]
+
+
+def test_invenio_indexer_actions_routed(app, db, es, taxonomy_tree, base_json, base_nresult):
+    data = {**base_json, **base_nresult, 'control_number': '411603'}
+    record = PublishedNResultRecord.create(data=data, id_=uuid.uuid4())
+    db_.session.commit()
+
+    # actions of the queue of invenio-indexer (invenio index run, reindexing of referencing records)
+    action = RecordIndexer(record_cls=PublishedNResultRecord)._index_action({'id': str(record.id)})
+    assert action['routing'] == str(record.id)
+    delete_action = NResultsBulkIndexer(record_cls=PublishedNResultRecord)._delete_action(
+        {'id': str(record.id)})
+    assert delete_action['_routing'] == str(record.id)
+
+    index_name = 'test_routed_index'
+    mapping = resolve_mapping(app)
+    es.indices.create(index_name, body={'mappings': mapping['mappings'],
+                                        'settings': mapping.get('settings', {})})
+    try:
+        success, errors = bulk(es, [{**action, '_index': index_name},
+                                    {**delete_action, '_index': index_name}], raise_on_error=False)
+        assert errors == []
+        assert success == 2
+    finally:
+        es.indices.delete(index_name)
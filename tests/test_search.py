@@ -0,0 +1,184 @@
+import pytest
+from invenio_records_rest.errors import InvalidQueryRESTError
+from invenio_records_rest.sorter import default_sorter_factory
+
+from nr_nresults import indexer
+from nr_nresults.constants import prefixed_published_index_name, prefixed_draft_index_name, \
+    published_index_name
+from nr_nresults.indexer import NResultsBulkIndexer
+from nr_nresults.search import NResultsRecordsSearch, list_args_search_factory
+
+
+def test_response_cache_used_for_anonymous_published_search(app):
+    state = app.extensions['nr-nresults']
+    with app.test_request_context('/nresults/'):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        assert search._response_cache() is state.search_cache
+        assert search.without_response_cache()._response_cache() is None
+        assert search.params(version=True)._response_cache() is state.search_cache
+        assert NResultsRecordsSearch(index=prefixed_draft_index_name)._response_cache() is None
+
+    with app.test_request_context('/nresults/', method='POST'):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        assert search._response_cache() is None
+
+
+def test_response_cache_key(app):
+    with app.test_request_context('/nresults/?q=metodika'):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        key = search._response_cache_key()
+        assert search.params(preference='abc')._response_cache_key() == key
+        assert search.query('match', title='metodika')._response_cache_key() != key
+        assert search.extra(size=20)._response_cache_key() != key
+
+
+def test_response_cache_invalidated_on_reindex(app):
+    state = app.extensions['nr-nresults']
+    state.search_cache.store('key', {})
+    state.record_indexed(app, index=prefixed_draft_index_name)
+    assert len(state.search_cache) == 1
+    state.record_indexed(app, index=published_index_name)
+    assert len(state.search_cache) == 0
+
+
+def test_cache_keys_follow_shared_index_version(app):
+    state = app.extensions['nr-nresults']
+    with app.test_request_context('/nresults/?q=metodika'):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        search.aggs.bucket('N_type', 'terms', field='N_type.links.self')
+        response_key, aggregation_key = search._response_cache_key(), search._aggregation_cache_key()
+        # draft autosaves do not invalidate searches of the published index
+        state.record_indexed(app, index=prefixed_draft_index_name)
+        assert search._response_cache_key() == response_key
+        assert search._aggregation_cache_key() == aggregation_key
+        state.record_indexed(app, index=published_index_name)
+        assert search._response_cache_key() != response_key
+        assert search._aggregation_cache_key() != aggregation_key
+
+        draft_search = NResultsRecordsSearch(index=prefixed_draft_index_name)
+        draft_key = draft_search._aggregation_cache_key()
+        assert draft_key[0] == ('draft',)
+        state.record_indexed(app, index=prefixed_draft_index_name)
+        assert draft_search._aggregation_cache_key() != draft_key
+
+
+def test_index_version_bumped_after_confirmed_write(app, monkeypatch):
+    state = app.extensions['nr-nresults']
+    written = []
+    monkeypatch.setattr(indexer, 'bulk', lambda client, actions, **kwargs:
+                        (written.append(state.cache_versions.get('published')), (1, []))[1])
+    version = state.cache_versions.get('published')
+    NResultsBulkIndexer().send_actions([{'_op_type': 'delete', '_index': prefixed_published_index_name,
+                                         '_id': 'x', '_routing': 'x'}])
+    assert written == [version]
+    assert state.cache_versions.get('published') == version + 1
+
+
+def test_searches_not_cached_until_index_settled(app, monkeypatch):
+    state = app.extensions['nr-nresults']
+    state.index_changed('published')
+    # the changed documents are not searchable before the index refreshes
+    assert not state.index_settled('published')
+    monkeypatch.setitem(app.config, 'NRESULTS_SEARCH_CACHE_SETTLE', 0)
+    assert state.index_settled('published')
+
+
+def test_list_projection(app):
+    with app.test_request_context('/nresults/?projection=minimal'):
+        # the constructor does not read the request
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        assert search._source == NResultsRecordsSearch.LIST_SOURCE_FIELDS
+        assert search.with_list_args({})._source == NResultsRecordsSearch.LIST_SOURCE_FIELDS
+
+        projected = search.with_list_args({'projection': 'minimal'})
+        assert projected._source == [*NResultsRecordsSearch.LIST_REQUIRED_FIELDS, 'title']
+        assert projected.extra(size=10)._source == projected._source
+
+        for args in ({'projection': 'unknown'}, {'fields': '*'}, {'fields': 'N_type,_files'}):
+            with pytest.raises(InvalidQueryRESTError):
+                search.with_list_args(args)
+
+    assert NResultsRecordsSearch.list_source_fields({'projection': 'minimal',
+                                                     'fields': 'N_type,title.cs'}) == [
+        *NResultsRecordsSearch.LIST_REQUIRED_FIELDS, 'title', 'N_type', 'title.cs']
+
+
+def test_list_args_applied_by_search_factory(app):
+    factory = list_args_search_factory(lambda list_resource, records_search, **kwargs:
+                                       (records_search, {}))
+    with app.test_request_context('/nresults/?projection=minimal&highlight=true'):
+        search, params = factory(None, NResultsRecordsSearch(index=prefixed_published_index_name))
+        assert search._source == [*NResultsRecordsSearch.LIST_REQUIRED_FIELDS, 'title']
+        assert 'highlight' in search.to_dict()
+        assert params == {'projection': 'minimal', 'highlight': 'true'}
+
+
+def test_highlight_on_request(app):
+    with app.test_request_context('/nresults/?q=metodika&highlight=true'):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        assert 'highlight' not in search.query('match', title='metodika').to_dict()
+
+        highlight = search.with_list_args({'highlight': 'true'}).extra(size=10).to_dict()['highlight']
+        assert set(highlight['fields']) == {'title.cs', 'title._', 'title.en'}
+        assert highlight['type'] == 'unified'
+
+
+def test_nresults_facets(app):
+    facets = app.config['RECORDS_REST_FACETS'][published_index_name]
+    assert set(facets['aggs']) == {'N_type', 'N_resultUsage', 'N_certifyingAuthority',
+                                   'N_dateCertified'}
+    assert facets['aggs']['N_type']['aggs']['links']['terms']['field'] == 'N_type.links.self'
+    link = 'http://127.0.0.1:5000/2.0/taxonomies/Ntype/a'
+    assert facets['post_filters']['N_type']([link]).to_dict() == {
+        'nested': {'path': 'N_type', 'query': {'terms': {'N_type.links.self': [link]}}}}
+    assert facets['filters']['N_dateCertified'](['2015--2020']).to_dict() == {
+        'range': {'N_dateCertified': {'gte': '2015', 'lte': '2020||/y', 'format': 'yyyy'}}}
+
+
+def test_aggregation_cache_key(app):
+    with app.test_request_context('/nresults/?q=metodika'):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        search.aggs.bucket('N_type', 'terms', field='N_type.links.self')
+        key = search._aggregation_cache_key()
+        assert search[10:20].sort('-dateIssued')._aggregation_cache_key() == key
+        assert search.post_filter('term', state='published')._aggregation_cache_key() == key
+        assert search.query('match', title='metodika')._aggregation_cache_key() != key
+        assert search.without_response_cache()._aggregation_cache() is None
+
+
+def test_aggregation_cache_invalidated_on_reindex(app):
+    state = app.extensions['nr-nresults']
+    state.aggregation_cache.clear()
+    state.aggregation_cache.store((('published',), 'published-key'), {})
+    state.aggregation_cache.store((('draft', 'published'), 'all-key'), {})
+    state.record_indexed(app, index='other-index')
+    assert len(state.aggregation_cache) == 2
+    state.record_indexed(app, index=prefixed_draft_index_name)
+    assert list(state.aggregation_cache._entries) == [(('published',), 'published-key')]
+    state.record_indexed(app, index=published_index_name)
+    assert len(state.aggregation_cache) == 0
+
+
+def test_sort_options(app):
+    with app.test_request_context('/nresults/'):
+        search, args = default_sorter_factory(
+            NResultsRecordsSearch(index=prefixed_published_index_name), published_index_name)
+        assert search.to_dict()['sort'] == [{'dateIssued.date': {'order': 'desc'}},
+                                             {'control_number.long': {'order': 'desc'}}]
+        assert args == {'sort': '-dateIssued'}
+    with app.test_request_context('/nresults/?q=metodika&sort=N_dateCertified'):
+        search, _ = default_sorter_factory(
+            NResultsRecordsSearch(index=prefixed_published_index_name), published_index_name)
+        assert search.to_dict()['sort'] == [{'N_dateCertified': {'order': 'asc'}}]
+
+
+def test_track_total_hits(app):
+    with app.test_request_context('/nresults/'):
+        search = NResultsRecordsSearch(index=prefixed_published_index_name)
+        assert search.extra(track_total_hits=True).to_dict()['track_total_hits'] is True
+        app.config['NRESULTS_TRACK_TOTAL_HITS'] = 10000
+        try:
+            assert search.extra(track_total_hits=True).to_dict()['track_total_hits'] == 10000
+            assert search.extra(track_total_hits=False).to_dict()['track_total_hits'] is False
+        finally:
+            app.config['NRESULTS_TRACK_TOTAL_HITS'] = True
@@ -0,0 +1,55 @@
+import copy
+import json
+
+from oarepo_validate.serializers import json_serializer as oarepo_json_serializer
+
+from nr_nresults.fetchers import nr_nresults_id_fetcher
+from nr_nresults.serializers import json_serializer
+
+
+def make_search_result(base_json, base_nresult):
+    hits = []
+    for control_number in ("1", "2"):
+        source = {**copy.deepcopy(base_json), **copy.deepcopy(base_nresult),
+                  "control_number": control_number}
+        hits.append({"_id": f"uuid-{control_number}", "_version": 2, "_source": source})
+    hits[0]["_source"]["_created"] = "2021-01-01T00:00:00"
+    hits[1]["highlight"] = {"title.cs": ["<em>Záznam</em>"]}
+    return {"hits": {"total": {"value": 2, "relation": "eq"}, "hits": hits},
+            "aggregations": {"N_type": {"buckets": []}}}
+
+
+def links_factory(pid, record_hit=None, **kwargs):
+    return {"self": f"https://localhost/nr/nresults/{pid.pid_value}"}
+
+
+def test_search_same_as_oarepo_serializer(app, base_json, base_nresult):
+    result = make_search_result(base_json, base_nresult)
+    original = copy.deepcopy(result)
+    links = {"self": "https://localhost/nr/nresults/?page=1"}
+    with app.test_request_context():
+        serialized = json_serializer.serialize_search(nr_nresults_id_fetcher, result, links=links,
+                                                      item_links_factory=links_factory)
+        # the hits are not modified, they may come from the response cache
+        assert result == original
+        expected = oarepo_json_serializer.serialize_search(nr_nresults_id_fetcher, result, links=links,
+                                                           item_links_factory=links_factory)
+    assert isinstance(serialized, bytes)
+    assert json.loads(serialized) == json.loads(expected)
+    assert json.loads(serialized)["hits"]["hits"][0]["created"] == "2021-01-01T00:00:00"
+
+
+def test_search_pretty_print(app, base_json, base_nresult):
+    result = make_search_result(base_json, base_nresult)
+    with app.test_request_context("/?prettyprint=1"):
+        serialized = json_serializer.serialize_search(nr_nresults_id_fetcher, result,
+                                                      item_links_factory=links_factory)
+    assert b"\n  " in serialized
+    assert json.loads(serialized)["hits"]["total"] == 2
+
+
+def test_empty_search(app):
+    with app.test_request_context():
+        serialized = json_serializer.serialize_search(
+            nr_nresults_id_fetcher, {"hits": {"total": {"value": 0}, "hits": []}})
+    assert json.loads(serialized) == {"hits": {"hits": [], "total": 0}, "links": {}, "aggregations": {}}
@@ -0,0 +1,55 @@
+from nr_nresults.marshmallow import NResultsMetadataSchemaV1
+from nr_nresults.proxies import current_nresults
+
+
+def test_schema_uses_cache(app, db, taxonomy_tree, base_json, base_json_dereferenced, base_nresult,
+                           base_nresult_dereferenced):
+    cache = current_nresults.taxonomy_cache
+    cache.invalidate()
+    base_json.update(base_nresult)
+    base_json_dereferenced.update(base_nresult_dereferenced)
+
+    schema = NResultsMetadataSchemaV1()
+    assert schema.load(base_json) == base_json_dereferenced
+    misses = cache.stats()['misses']
+    hits = cache.stats()['hits']
+    # accessRights, language, provider, resourceType + N_certifyingAuthority, N_resultUsage, N_type
+    assert len(cache) == 7
+
+    assert schema.load(base_json) == base_json_dereferenced
+    assert cache.stats()['misses'] == misses
+    assert cache.stats()['hits'] == hits + 7
+
+
+def test_cache_invalidation(app, db, taxonomy_tree, base_json, base_nresult):
+    cache = current_nresults.taxonomy_cache
+    base_json.update(base_nresult)
+    NResultsMetadataSchemaV1().load(base_json)
+    assert len(cache) > 0
+    cache.invalidate('another_taxonomy')
+    assert len(cache) > 0
+    cache.invalidate('test_taxonomy')
+    assert len(cache) == 0
+
+
+def test_cache_eviction(app):
+    cache = current_nresults.taxonomy_cache
+    max_size = cache.max_size
+    cache.fetch = lambda code, slug: [{'links': {'self': f'{code}/{slug}'}}]
+    try:
+        cache.max_size = 2
+        cache.invalidate()
+        cache.get('tax', 'a')
+        cache.get('tax', 'b')
+        cache.get('tax', 'a')
+        cache.get('tax', 'c')
+        assert len(cache) == 2
+        misses = cache.misses
+        cache.get('tax', 'a')
+        assert cache.misses == misses
+        cache.get('tax', 'b')
+        assert cache.misses == misses + 1
+    finally:
+        del cache.fetch
+        cache.max_size = max_size
+        cache.invalidate()
@@ -0,0 +1,67 @@
+import json
+import uuid
+
+import pytest
+from invenio_jsonschemas import current_jsonschemas
+from invenio_records.api import _records_state
+from jsonschema import ValidationError
+
+from nr_nresults.constants import NRESULTS_PREFERRED_SCHEMA
+from nr_nresults.proxies import current_nresults
+from nr_nresults.record import PublishedNResultRecord
+
+
+@pytest.fixture()
+def schema_url(app):
+    return current_jsonschemas.path_to_url(NRESULTS_PREFERRED_SCHEMA)
+
+
+def test_validator_compiled_on_first_use(app, schema_url):
+    current_nresults.schema_validators.clear()
+    validator = current_nresults.schema_validator(schema_url)
+    assert validator is not None
+    assert current_nresults.schema_validators[schema_url] is validator
+    assert '$ref' not in json.dumps(validator.schema)
+
+
+def test_validators_warmed(app, schema_url):
+    current_nresults.schema_validators.clear()
+    current_nresults.warm_schema_validators()
+    assert current_nresults.schema_validators[schema_url] is not None
+
+
+def test_compiled_validation_matches_invenio(app, schema_url, base_json, base_nresult):
+    validator = current_nresults.schema_validator(schema_url)
+    data = {**base_json, **base_nresult, '$schema': schema_url}
+    validator.validate(data)
+    _records_state.validate(data, schema_url)
+
+    invalid = {**data, 'title': 'not an array'}
+    with pytest.raises(ValidationError) as compiled_error:
+        validator.validate(invalid)
+    with pytest.raises(ValidationError) as invenio_error:
+        _records_state.validate(invalid, schema_url)
+    assert compiled_error.value.message == invenio_error.value.message
+    assert list(compiled_error.value.path) == list(invenio_error.value.path)
+
+
+def test_record_uses_compiled_validator(app, db, schema_url, base_json, base_nresult,
+                                        taxonomy_tree):
+    calls = []
+    validator = current_nresults.schema_validator(schema_url)
+    original = validator.validate
+    validator.validate = lambda data: calls.append(data) or original(data)
+    try:
+        data = {**base_json, **base_nresult, 'control_number': '411200'}
+        PublishedNResultRecord.create(data=data, id_=uuid.uuid4())
+    finally:
+        del validator.validate
+    assert len(calls) == 1
+
+
+def test_compiled_validation_disabled(app, schema_url):
+    app.config['NRESULTS_COMPILED_SCHEMA_VALIDATION'] = False
+    try:
+        assert current_nresults.schema_validator(schema_url) is None
+    finally:
+        app.config['NRESULTS_COMPILED_SCHEMA_VALIDATION'] = True